@@ -0,0 +1,251 @@
+"""
+Benchmark the client's hot paths against a local StubElucidateServer, and store the results to compare releases.
+Every case runs in a fresh process, so its peak RSS is the client's alone (the server runs in this process).
+
+    python -m benchmarks.bench_client                                  # run all cases, store the results
+    python -m benchmarks.bench_client --quick create_annotations       # run one case at a tenth of the size
+    python -m benchmarks.bench_client --compare benchmarks/results/0.1.0-abc1234.json
+
+With --compare, cases that got slower than --threshold are reported, and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from typing import Callable, Optional
+
+from benchmarks.bench_codec import annotation
+from elucidate.client import ElucidateClient
+from elucidate.model import ContainerIdentifier, AnnotationIdentifier
+from elucidate.stub_server import StubElucidateServer
+from elucidate.tools import split_annotation
+from elucidate.transport import Transport
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+results_dir = os.path.join(os.path.dirname(__file__), 'results')
+
+
+class Case:
+    def __init__(self, run: Callable[[str, int], int], size: int,
+                 prepare: Callable[[StubElucidateServer, int], None] = None, uses_server: bool = True, repeat: int = 3):
+        """
+        :param run: Runs the case against the server at the given base uri, and returns the number of operations done
+        :type run: Callable[[str, int], int]
+        :param size: The number of operations (annotations, calls) per run
+        :type size: int
+        :param prepare: Stores the fixtures the case needs in the server, outside of the measured time
+        :type prepare: Callable[[StubElucidateServer, int], None]
+        :param uses_server: Whether the case makes requests
+        :type uses_server: bool
+        :param repeat: The number of runs; the fastest counts
+        :type repeat: int
+        """
+        self.run = run
+        self.size = size
+        self.prepare = prepare
+        self.uses_server = uses_server
+        self.repeat = repeat
+
+
+def body_and_target(i: int) -> tuple:
+    a = annotation(i)
+    return a['body'], a['target']
+
+
+def run_create_annotation(base_uri: str, size: int) -> int:
+    with ElucidateClient(base_uri) as client:
+        container_id = client.create_container()
+        for i in range(size):
+            client.create_annotation(container_id, *body_and_target(i))
+    return size
+
+
+def run_create_annotations(base_uri: str, size: int) -> int:
+    with ElucidateClient(base_uri, transport=Transport(pool_maxsize=8)) as client:
+        container_id = client.create_container()
+        results = client.create_annotations(container_id, (body_and_target(i) for i in range(size)), max_workers=8)
+        return sum(1 for result in results if isinstance(result, AnnotationIdentifier))
+
+
+def prepare_container(server: StubElucidateServer, size: int):
+    server.add_annotations('bench', [{k: v for k, v in annotation(i).items() if k != 'id'} for i in range(size)])
+
+
+def run_annotations_as_json(base_uri: str, size: int) -> int:
+    with ElucidateClient(base_uri) as client:
+        collection = client.read_container(ContainerIdentifier(f"{base_uri}/w3c/bench/"))
+        return sum(1 for _ in collection.annotations_as_json())
+
+
+def run_annotations_as_json_prefetch(base_uri: str, size: int) -> int:
+    with ElucidateClient(base_uri) as client:
+        collection = client.read_container(ContainerIdentifier(f"{base_uri}/w3c/bench/"))
+        return sum(1 for _ in collection.annotations_as_json(prefetch=2))
+
+
+def run_search_paging(base_uri: str, size: int) -> int:
+    with ElucidateClient(base_uri) as client:
+        collection = client.search_by_target_source('urn:example:scan=')
+        return sum(len(page) for page in collection.pages_as_json(max_workers=4))
+
+
+def run_split_annotation(base_uri: str, size: int) -> int:
+    # a large annotation: many bodies and targets, and custom fields
+    large = annotation(0)
+    large['body'] = large['body'] * 250
+    large['target'] = large['target'] * 250
+    large.update({f"custom{i}": {'value': i} for i in range(100)})
+    for _ in range(size):
+        split_annotation(large)
+    return size
+
+
+def run_identifiers(base_uri: str, size: int) -> int:
+    for i in range(size):
+        ContainerIdentifier(f"http://localhost:8080/annotation/w3c/container{i}")
+        AnnotationIdentifier(f"http://localhost:8080/annotation/w3c/container/{i:08d}", 'etag')
+    return size
+
+
+cases = {
+    'create_annotation': Case(run_create_annotation, 500),
+    'create_annotations': Case(run_create_annotations, 2000),
+    'annotations_as_json': Case(run_annotations_as_json, 20000, prepare_container),
+    'annotations_as_json_prefetch': Case(run_annotations_as_json_prefetch, 20000, prepare_container),
+    'search_paging': Case(run_search_paging, 20000, prepare_container),
+    'split_annotation': Case(run_split_annotation, 200, uses_server=False),
+    'identifiers': Case(run_identifiers, 200000, uses_server=False),
+}
+
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return rss / 2 ** 20 if sys.platform == 'darwin' else rss / 2 ** 10
+
+
+def run_case(name: str, base_uri: str, size: int) -> dict:
+    """Run one case (in a fresh process): the fastest of its runs, and the peak RSS of all of them"""
+    case = cases[name]
+    seconds = []
+    operations = 0
+    for _ in range(case.repeat):
+        start = time.perf_counter()
+        operations = case.run(base_uri, size)
+        seconds.append(time.perf_counter() - start)
+    return {'seconds': min(seconds), 'operations': operations, 'peak_rss_mb': peak_rss_mb()}
+
+
+def run(names: list, scale: float, latency: float, page_size: int) -> dict:
+    results = {}
+    with StubElucidateServer(page_size=page_size, latency=latency) as server:
+        for name in names:
+            case = cases[name]
+            size = max(1, int(case.size * scale))
+            server.reset()
+            if case.prepare:
+                case.prepare(server, size)
+            requests_before = server.request_count
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                result = executor.submit(run_case, name, server.base_uri, size).result()
+            requests = (server.request_count - requests_before) / case.repeat
+            result.update({
+                'size': size,
+                'operations_per_second': result['operations'] / result['seconds'],
+                'requests_per_second': requests / result['seconds'] if case.uses_server else None
+            })
+            results[name] = result
+            print_result(name, result)
+    return results
+
+
+def print_result(name: str, result: dict, baseline: dict = None):
+    requests_per_second = result['requests_per_second']
+    line = f"{name:<30}{result['size']:>8}{result['seconds']:>10.3f}{result['operations_per_second']:>12.0f}" \
+           f"{requests_per_second if requests_per_second is not None else float('nan'):>12.0f}" \
+           f"{result['peak_rss_mb'] or float('nan'):>10.1f}"
+    if baseline:
+        line += f"{(result['seconds'] / baseline['seconds'] - 1) * 100:>+9.1f}%"
+    print(line)
+
+
+def print_header(compare: bool = False):
+    print(f"{'case':<30}{'size':>8}{'wall (s)':>10}{'ops/s':>12}{'requests/s':>12}{'RSS (MB)':>10}"
+          + (f"{'Δ wall':>10}" if compare else ''))
+
+
+def metadata() -> dict:
+    try:
+        from importlib.metadata import version
+        client_version = version('elucidate-client')
+    except Exception:
+        client_version = 'unknown'
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(__file__)).stdout.strip() or 'unknown'
+    except OSError:
+        commit = 'unknown'
+    return {'version': client_version, 'commit': commit, 'python': platform.python_version(),
+            'platform': platform.platform(), 'date': datetime.now(timezone.utc).isoformat(timespec='seconds')}
+
+
+def compare(results: dict, baseline_path: str, threshold: float) -> list:
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    print(f"\ncompared to {baseline_path}:")
+    print_header(compare=True)
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline or baseline[name]['size'] != result['size']:
+            continue
+        print_result(name, result, baseline[name])
+        if result['seconds'] > baseline[name]['seconds'] * (1 + threshold):
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the elucidate client against a local stub server")
+    parser.add_argument('cases', nargs='*', help=f"the cases to run, all when omitted: {', '.join(cases)}")
+    parser.add_argument('--quick', action='store_true', help='run the cases at a tenth of their size')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds of server latency per request')
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--output', help='where to store the results, benchmarks/results/<version>-<commit>.json '
+                                         'when omitted')
+    parser.add_argument('--compare', help='a stored result file to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1, help='the slowdown that counts as a regression')
+    args = parser.parse_args()
+    unknown = [name for name in args.cases if name not in cases]
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(unknown)}")
+
+    print_header()
+    results = run(args.cases or list(cases), 0.1 if args.quick else 1.0, args.latency, args.page_size)
+    info = metadata()
+    output = args.output or os.path.join(results_dir, f"{info['version']}-{info['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({**info, 'settings': {'latency': args.latency, 'page_size': args.page_size}, 'results': results}, f,
+                  indent=2)
+    print(f"\nstored in {output}")
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print(f"\nslower than the baseline by more than {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
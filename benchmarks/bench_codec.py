@@ -0,0 +1,62 @@
+"""
+Compare the json codecs on the bodies the client encodes and decodes: single annotations and pages of annotations.
+
+    python -m benchmarks.bench_codec
+"""
+import timeit
+
+from elucidate.codec import JsonCodec, available_codecs
+
+
+def annotation(i: int) -> dict:
+    source = f"urn:example:scan={i // 100}:textline=r{i}"
+    return {
+        '@context': ['http://www.w3.org/ns/anno.jsonld', 'http://example.org/ns/custom.jsonld'],
+        'id': f"http://localhost:8080/annotation/w3c/container/{i:08d}",
+        'type': 'Annotation',
+        'motivation': 'classifying',
+        'created': '2021-07-27T16:13:09.078457',
+        'generator': {'id': 'https://github.com/example/ner', 'name': 'NER', 'type': 'Software'},
+        'body': [
+            {'purpose': 'classifying', 'type': 'TextualBody', 'value': 'location'},
+            {'type': 'Dataset',
+             'value': {'category': 'location', 'match_phrase': 'Karel', 'match_score': 0.8387096774193549,
+                       'match_variant': 'Farel', 'alternatives': [{'phrase': f"alt{j}", 'score': j / 10}
+                                                                  for j in range(5)]}}
+        ],
+        'target': [
+            {'source': source, 'selector': {'type': 'TextPositionSelector', 'start': 19, 'end': 24}},
+            {'source': source, 'selector': {'type': 'FragmentSelector', 'conformsTo': 'http://tools.ietf.org/rfc/rfc5147',
+                                            'value': 'char=19,24'}},
+            {'source': 'https://example.org/iiif/2/scan/full/max/0/default.jpg', 'type': 'image',
+             'selector': {'type': 'FragmentSelector', 'conformsTo': 'http://www.w3.org/TR/media-frags/',
+                          'value': 'xywh=850,3620,1510,86'}}
+        ]
+    }
+
+
+def bench(codec: JsonCodec, obj, number: int):
+    encoded = codec.dumps(obj)
+    dumps = min(timeit.repeat(lambda: codec.dumps(obj), number=number, repeat=5)) / number
+    loads = min(timeit.repeat(lambda: codec.loads(encoded), number=number, repeat=5)) / number
+    return dumps, loads
+
+
+def main():
+    cases = [
+        ('annotation', annotation(0), 2000),
+        ('page (100 annotations)', {'items': [annotation(i) for i in range(100)]}, 50),
+    ]
+    print(f"{'case':<24}{'codec':<8}{'dumps (µs)':>12}{'loads (µs)':>12}{'speedup':>10}")
+    for name, obj, number in cases:
+        baseline = None
+        for codec_name in reversed(available_codecs()):
+            dumps, loads = bench(JsonCodec(codec_name), obj, number)
+            total = dumps + loads
+            if baseline is None:
+                baseline = total
+            print(f"{name:<24}{codec_name:<8}{dumps * 1e6:>12.1f}{loads * 1e6:>12.1f}{baseline / total:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+from elucidate.cache import ResponseCache
+from elucidate.codec import JsonCodec
+from elucidate.client import BaseElucidateClient
+from elucidate.metrics import calling_endpoint
+from elucidate.profiling import trace_phase
+from elucidate.model import AsyncAnnotationCollection
+from elucidate.transport import AsyncTransport
+
+
+class AsyncElucidateClient(BaseElucidateClient):
+    """
+    The asyncio version of ElucidateClient, with the same methods; they return awaitables:
+
+        async with AsyncElucidateClient(base_uri) as client:
+            collection = await client.read_container(container_identifier)
+            async for annotation in collection:
+                ...
+
+    All requests, including the paging of the returned AsyncAnnotationCollections, share one AsyncTransport.
+    """
+
+    def __init__(self, base_uri: str, raise_exceptions: bool = True, verbose: bool = False,
+                 transport: AsyncTransport = None, cache: ResponseCache = None, codec: JsonCodec = None):
+        """
+        :param base_uri: The base uri of the elucidate server
+        :type base_uri: str
+        :param raise_exceptions: Raise an exception on an unexpected response, instead of returning an ElucidateFailure
+        :type raise_exceptions: bool
+        :param verbose: Print the requests and the response status; use the Metrics of the transport to measure them
+        :type verbose: bool
+        :param transport: The (pooled) async http transport to use, a default AsyncTransport is created when omitted
+        :type transport: AsyncTransport
+        :param cache: The cache for conditional reads of annotations and containers, no caching when omitted
+        :type cache: ResponseCache
+        :param codec: The json encoder/decoder, the fastest installed one when omitted
+        :type codec: JsonCodec
+        """
+        super().__init__(base_uri, raise_exceptions, verbose, transport if transport else AsyncTransport(), cache,
+                         codec)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        """Close the connections in the transport pool"""
+        await self.transport.close()
+
+    def _request(self, method: str, url: str, result_producers: dict, **kwargs):
+        # the endpoint is looked up now: the coroutine does not run inside the calling client method
+        endpoint = calling_endpoint() if self._instrumented() else None
+        return self.__request(endpoint, method, url, result_producers, self._encode_json(kwargs))
+
+    async def __request(self, endpoint: str, method: str, url: str, result_producers: dict, kwargs: dict):
+        if endpoint is None:
+            return self._handle_response(await self.transport.request(method, url, **kwargs), result_producers)
+        with self._instrumentation(endpoint):
+            response = await self.transport.request(method, url, **kwargs)
+            with trace_phase('construct'):
+                return self._handle_response(response, result_producers)
+
+    def _annotation_collection(self, json: dict) -> AsyncAnnotationCollection:
+        return AsyncAnnotationCollection(json['total'], json['id'], json['first'], json.get('label'), self.transport,
+                                         self.codec)
@@ -0,0 +1,82 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+
+
+class CacheEntry:
+    def __init__(self, etag: str, content: bytes, size: int):
+        self.etag = etag
+        self.content = content
+        self.size = size
+
+    def __str__(self):
+        return f"CacheEntry:\n  etag = {self.etag}\n  size = {self.size}"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class ResponseCache:
+    """
+    A thread-safe LRU cache of response bodies and their ETags, bounded by the number of entries and by the total size
+    of the response bodies.
+    The client revalidates a cached entry with If-None-Match, and decodes the cached body when the server answers 304.
+    The bodies are kept as received, so every result decoded from them is a new object the caller is free to change.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        """
+        :param max_entries: The maximum number of cached responses
+        :type max_entries: int
+        :param max_bytes: The maximum total size (in bytes) of the cached response bodies
+        :type max_bytes: int
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __str__(self):
+        return f"ResponseCache:\n  entries = {len(self)}/{self.max_entries}\n  size = {self.size}/{self.max_bytes}"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, etag: str, content: bytes, size: int = None):
+        if size is None:
+            size = len(content)
+        if size > self.max_bytes:
+            self.invalidate(key)
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = CacheEntry(etag, content, size)
+            self.size += size
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= evicted.size
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self.size -= entry.size
@@ -1,12 +1,21 @@
 import http.client
-import requests
 from datetime import datetime
 from http import HTTPStatus
 from requests import Response
-from typing import Union
-
+from collections import defaultdict
+from typing import Union, Iterable, Iterator, Tuple, Any, List, BinaryIO, Callable
+
+from elucidate.cache import ResponseCache
+from elucidate.codec import JsonCodec
+from elucidate.executor import bounded_map, max_workers_for
+from elucidate.metrics import calling_endpoint, endpoint_context
+from elucidate.profiling import current_span, trace_phase
 from elucidate.model import AnnotationCollection, ElucidateFailure, ElucidateSuccess, AnnotationIdentifier, \
     ContainerIdentifier, ElucidateResponse
+from elucidate.ndjson import write_ndjson, Progress, import_ndjson
+from elucidate.tools import split_annotation
+from elucidate.watch import ChangeFeed, AnnotationEvent
+from elucidate.transport import Transport
 
 default_anno_context = "http://www.w3.org/ns/anno.jsonld"
 
@@ -21,15 +30,24 @@ json_headers = {
 }
 
 
-class ElucidateClient:
-    def __init__(self, base_uri: str, raise_exceptions: bool = True, verbose: bool = False):
+class BaseElucidateClient:
+    """
+    The elucidate api calls, independent of how the requests are performed.
+    Subclasses implement _request: ElucidateClient returns the results directly, AsyncElucidateClient returns awaitables.
+    """
+
+    def __init__(self, base_uri: str, raise_exceptions: bool, verbose: bool, transport, cache: ResponseCache,
+                 codec: JsonCodec):
         self.base_uri = base_uri
         self.version = 'w3c'
         self.raise_exceptions = raise_exceptions
         self.verbose = verbose
+        self.transport = transport
+        self.cache = cache
+        self.codec = codec if codec else JsonCodec()
 
     def __str__(self):
-        return f"ElucidateClient:\n  base_uri = {self.base_uri}\n  version = {self.version}\n  raise_exceptions = {self.raise_exceptions}"
+        return f"{self.__class__.__name__}:\n  base_uri = {self.base_uri}\n  version = {self.version}\n  raise_exceptions = {self.raise_exceptions}"
 
     def __repr__(self):
         return self.__str__()
@@ -68,13 +86,9 @@ class ElucidateClient:
         headers = jsonld_headers.copy()
         if container_id:
             headers['slug'] = container_id
-        response = requests.post(
-            url=url,
-            headers=headers,
-            json=body)
-        return self.__handle_response(response, {
+        return self._request('POST', url, {
             HTTPStatus.CREATED: lambda r: ContainerIdentifier(r.headers['location'])
-        })
+        }, headers=headers, json=body)
 
     def read_container(self, container_identifier: ContainerIdentifier) -> Union[
         AnnotationCollection, ElucidateResponse]:
@@ -87,12 +101,7 @@ class ElucidateClient:
         :rtype: dict
         """
         url = f'{self.base_uri}/{self.version}/{container_identifier.uuid}/'
-        response = requests.get(
-            url=url,
-            headers=jsonld_headers)
-        return self.__handle_response(response, {
-            HTTPStatus.OK: as_annotation_collection
-        })
+        return self.__conditional_get(url, self._annotation_collection)
 
     def read_container_identifier(self, name: str) -> Union[None, ContainerIdentifier]:
         """
@@ -104,11 +113,7 @@ class ElucidateClient:
         :rtype: Union[None, ContainerIdentifier]
         """
         url = f'{self.base_uri}/{self.version}/{name}/'
-        response = requests.get(
-            url=url,
-            headers=jsonld_headers)
-        return self.__handle_response(response, {
-            HTTPStatus.OK: lambda r: ContainerIdentifier(r.json()['id']),
+        return self.__conditional_get(url, lambda json: ContainerIdentifier(json['id']), {
             HTTPStatus.NOT_FOUND: lambda r: None
         })
 
@@ -122,7 +127,7 @@ class ElucidateClient:
     #     :rtype: bool
     #     """
     #     url = f'{self.base_uri}/{self.version}/{container_identifier}/'
-    #     response = requests.delete(url=url)
+    #     response = self.transport.delete(url=url)
     #     return self.__handle_response(response, HTTPStatus.NO_CONTENT,
     #                                   lambda r: True)
 
@@ -163,14 +168,10 @@ class ElucidateClient:
         headers = jsonld_headers.copy()
         if annotation_id:
             headers['slug'] = annotation_id
-        response = requests.post(
-            url=container_id.url,
-            headers=headers,
-            json=annotation)
-
-        return self.__handle_response(response, {
-            HTTPStatus.CREATED: lambda r: AnnotationIdentifier(r.headers['location'], r.headers['etag'][3:-1])
-        })
+        return self._request('POST', container_id.url, {
+            HTTPStatus.CREATED: self.__invalidating(
+                lambda r: AnnotationIdentifier(r.headers['location'], r.headers['etag'][3:-1]), container_id.uuid)
+        }, headers=headers, json=annotation)
 
     # TODO: Annotation Histories
     def read_annotation(self, annotation_identifier: AnnotationIdentifier):
@@ -182,13 +183,7 @@ class ElucidateClient:
         :rtype:
         """
         url = f'{self.base_uri}/{self.version}/{annotation_identifier.container_uuid}/{annotation_identifier.uuid}'
-        response = requests.get(
-            url=url,
-            headers=jsonld_headers
-        )
-        return self.__handle_response(response, {
-            HTTPStatus.OK: as_json_dict
-        })
+        return self.__conditional_get(url, lambda json: json)
 
     def update_annotation(self, annotation_identifier: AnnotationIdentifier, body, target, custom=None,
                           custom_contexts=None):
@@ -217,13 +212,11 @@ class ElucidateClient:
         annotation.update(custom)
         put_headers = {'If-Match': annotation_identifier.etag}
         put_headers.update(jsonld_headers)
-        response = requests.put(
-            url=url,
-            headers=put_headers,
-            json=annotation)
-        return self.__handle_response(response, {
-            HTTPStatus.OK: lambda r: AnnotationIdentifier(annotation_identifier.url, r.headers['etag'][3:-1])
-        })
+        return self._request('PUT', url, {
+            HTTPStatus.OK: self.__invalidating(
+                lambda r: AnnotationIdentifier(annotation_identifier.url, r.headers['etag'][3:-1]),
+                annotation_identifier.container_uuid, annotation_identifier.uuid)
+        }, headers=put_headers, json=annotation)
 
     def delete_annotation(self, annotation_identifier: AnnotationIdentifier):
         """
@@ -236,12 +229,10 @@ class ElucidateClient:
         url = f'{self.base_uri}/{self.version}/{annotation_identifier.container_uuid}/{annotation_identifier.uuid}'
         del_headers = {'If-Match': annotation_identifier.etag}
         del_headers.update(jsonld_headers)
-        response = requests.delete(
-            url=url,
-            headers=del_headers)
-        return self.__handle_response(response, {
-            HTTPStatus.NO_CONTENT: lambda r: r.ok
-        })
+        return self._request('DELETE', url, {
+            HTTPStatus.NO_CONTENT: self.__invalidating(lambda r: True, annotation_identifier.container_uuid,
+                                                       annotation_identifier.uuid)
+        }, headers=del_headers)
 
     def __search_by_part(self, part: str, fields: str, value: str, strict: bool = False, xywh: str = None,
                          t: str = None, creator: str = None, generator: str = None):
@@ -255,13 +246,9 @@ class ElucidateClient:
             params['creator'] = creator
         if generator:
             params['generator'] = generator
-        response = requests.get(
-            url=url,
-            params=params
-        )
-        return self.__handle_response(response, {
-            HTTPStatus.OK: as_annotation_collection
-        })
+        return self._request('GET', url, {
+            HTTPStatus.OK: self._as_annotation_collection
+        }, params=params)
 
     def search_by_body_id(self, value: str, strict: bool = False, xywh: str = None, t: str = None,
                           creator: str = None, generator: str = None) -> Union[
@@ -355,13 +342,9 @@ class ElucidateClient:
                          strict: bool = False) -> Union[AnnotationCollection, ElucidateResponse]:
         url = f'{self.base_uri}/w3c/services/search/{role}'
         params = dict(levels=levels, type=type, value=value, strict=strict)
-        response = requests.get(
-            url=url,
-            params=params
-        )
-        return self.__handle_response(response, {
-            HTTPStatus.OK: as_annotation_collection
-        })
+        return self._request('GET', url, {
+            HTTPStatus.OK: self._as_annotation_collection
+        }, params=params)
 
     def search_by_annotation_creator_id(self, value: str, strict: bool = False) -> Union[
         AnnotationCollection, ElucidateResponse]:
@@ -766,13 +749,9 @@ class ElucidateClient:
             since_param += ".00000"
         since_param += 'Z'
         params = dict(levels=levels, types=types, since=since_param)
-        response = requests.get(
-            url=url,
-            params=params
-        )
-        return self.__handle_response(response, {
-            HTTPStatus.OK: as_annotation_collection
-        })
+        return self._request('GET', url, {
+            HTTPStatus.OK: self._as_annotation_collection
+        }, params=params)
 
     def search_by_annotation_created_since(self, since: datetime) -> Union[ElucidateResponse, AnnotationCollection]:
         """
@@ -868,13 +847,9 @@ class ElucidateClient:
 
     def __get_statistics(self, part: str, field: str):
         url = f'{self.base_uri}/{self.version}/services/stats/{part}'
-        response = requests.get(
-            url=url,
-            headers=jsonld_headers,
-            params={"field": field})
-        return self.__handle_response(response, {
-            HTTPStatus.OK: as_json_dict
-        })
+        return self._request('GET', url, {
+            HTTPStatus.OK: self._json
+        }, headers=jsonld_headers, params={"field": field})
 
     def get_body_id_statistics(self):
         """
@@ -924,14 +899,9 @@ class ElucidateClient:
             "body": body,
             "target": target
         }
-        response = requests.post(
-            url=url,
-            headers=jsonld_headers,
-            json=json
-        )
-        return self.__handle_response(response, {
-            HTTPStatus.OK: as_json_dict
-        })
+        return self._request('POST', url, {
+            HTTPStatus.OK: self._json
+        }, headers=jsonld_headers, json=json)
 
     def do_batch_delete(self, body, target):
         """
@@ -949,14 +919,9 @@ class ElucidateClient:
             "body": body,
             "target": target
         }
-        response = requests.post(
-            url=url,
-            headers=jsonld_headers,
-            json=json
-        )
-        return self.__handle_response(response, {
-            HTTPStatus.OK: as_json_dict
-        })
+        return self._request('POST', url, {
+            HTTPStatus.OK: self._json
+        }, headers=jsonld_headers, json=json)
 
     def read_current_user(self):
         """
@@ -965,12 +930,9 @@ class ElucidateClient:
         :rtype:
         """
         url = f'{self.base_uri}/user/current'
-        response = requests.get(
-            url=url,
-            headers=json_headers)
-        return self.__handle_response(response, {
-            HTTPStatus.OK: as_json_dict
-        })
+        return self._request('GET', url, {
+            HTTPStatus.OK: self._json
+        }, headers=json_headers)
 
     def create_group(self, label: str):
         """
@@ -981,13 +943,9 @@ class ElucidateClient:
         :rtype:
         """
         url = f'{self.base_uri}/group'
-        response = requests.post(
-            url=url,
-            headers=json_headers,
-            json={"label": label})
-        return self.__handle_response(response, {
-            HTTPStatus.CREATED: lambda r: r.json()['id']
-        })
+        return self._request('POST', url, {
+            HTTPStatus.CREATED: lambda r: self._json(r)['id']
+        }, headers=json_headers, json={"label": label})
 
     def read_group(self, group_id: str):
         """
@@ -998,12 +956,9 @@ class ElucidateClient:
         :rtype:
         """
         url = f'{self.base_uri}/group/{group_id}'
-        response = requests.get(
-            url=url,
-            headers=json_headers)
-        return self.__handle_response(response, {
-            HTTPStatus.OK: as_json_dict
-        })
+        return self._request('GET', url, {
+            HTTPStatus.OK: self._json
+        }, headers=json_headers)
 
     def read_group_users(self, group_id: str):
         """
@@ -1014,12 +969,9 @@ class ElucidateClient:
         :rtype:
         """
         url = f'{self.base_uri}/group/{group_id}/users'
-        response = requests.get(
-            url=url,
-            headers=json_headers)
-        return self.__handle_response(response, {
-            HTTPStatus.OK: lambda r: r.json()['users']
-        })
+        return self._request('GET', url, {
+            HTTPStatus.OK: lambda r: self._json(r)['users']
+        }, headers=json_headers)
 
     def create_group_user(self, group_id: str, user_id: str):
         """
@@ -1032,12 +984,9 @@ class ElucidateClient:
         :rtype:
         """
         url = f'{self.base_uri}/group/{group_id}/users/{user_id}'
-        response = requests.post(
-            url=url,
-            headers=json_headers)
-        return self.__handle_response(response, {
-            HTTPStatus.OK: lambda r: r.ok
-        })
+        return self._request('POST', url, {
+            HTTPStatus.OK: lambda r: True
+        }, headers=json_headers)
 
     def delete_group_user(self, group_id: str, user_id: str):
         """
@@ -1050,12 +999,9 @@ class ElucidateClient:
         :rtype:
         """
         url = f'{self.base_uri}/group/{group_id}/users/{user_id}'
-        response = requests.delete(
-            url=url,
-            headers=json_headers)
-        return self.__handle_response(response, {
-            HTTPStatus.OK: lambda r: r.ok
-        })
+        return self._request('DELETE', url, {
+            HTTPStatus.OK: lambda r: True
+        }, headers=json_headers)
 
     def read_group_annotations(self, group_id: str):
         """
@@ -1066,12 +1012,9 @@ class ElucidateClient:
         :rtype:
         """
         url = f'{self.base_uri}/group/{group_id}/annotations'
-        response = requests.get(
-            url=url,
-            headers=json_headers)
-        return self.__handle_response(response, {
-            HTTPStatus.OK: lambda r: r.json()['annotations']
-        })
+        return self._request('GET', url, {
+            HTTPStatus.OK: lambda r: self._json(r)['annotations']
+        }, headers=json_headers)
 
     def create_group_annotation(self, group_id: str, annotation_identifier: AnnotationIdentifier):
         """
@@ -1084,9 +1027,8 @@ class ElucidateClient:
         :rtype: bool
         """
         url = f'{self.base_uri}/group/{group_id}/annotation/{annotation_identifier.container_uuid}/{annotation_identifier.uuid}'
-        response = requests.post(url=url)
-        return self.__handle_response(response, {
-            HTTPStatus.OK: lambda r: r.ok
+        return self._request('POST', url, {
+            HTTPStatus.OK: lambda r: True
         })
 
     def delete_group_annotation(self, group_id: str, annotation_identifier: AnnotationIdentifier):
@@ -1100,12 +1042,79 @@ class ElucidateClient:
         :rtype:
         """
         url = f'{self.base_uri}/group/{group_id}/annotation/{annotation_identifier.container_uuid}/{annotation_identifier.uuid}'
-        response = requests.delete(url=url)
-        return self.__handle_response(response, {
-            HTTPStatus.OK: lambda r: r.ok
+        return self._request('DELETE', url, {
+            HTTPStatus.OK: lambda r: True
         })
 
-    def __handle_response(self, response: Response, result_producers: dict):
+    def _request(self, method: str, url: str, result_producers: dict, **kwargs):
+        raise NotImplementedError
+
+    def _encode_json(self, kwargs: dict) -> dict:
+        # send the json body as data, encoded with our codec; the callers set the Content-Type header
+        if 'json' in kwargs:
+            kwargs['data'] = self.codec.dumps(kwargs.pop('json'))
+        return kwargs
+
+    def _json(self, response: Response):
+        if current_span.get() is None:
+            return self.codec.loads(response.content)
+        with trace_phase('decode'):
+            return self.codec.loads(response.content)
+
+    def _instrumented(self) -> bool:
+        return getattr(self.transport, 'metrics', None) is not None or getattr(self.transport, 'tracer', None) is not None
+
+    def _instrumentation(self, endpoint: str):
+        # label the requests with the endpoint for the metrics, and trace them when the transport has a tracer
+        tracer = getattr(self.transport, 'tracer', None)
+        return tracer.span(endpoint) if tracer is not None else endpoint_context(endpoint)
+
+    def _as_annotation_collection(self, response: Response) -> AnnotationCollection:
+        return self._annotation_collection(self._json(response))
+
+    def _annotation_collection(self, json: dict) -> AnnotationCollection:
+        return AnnotationCollection(json['total'], json['id'], json['first'], json.get('label'), self.transport,
+                                    self.codec)
+
+    def __conditional_get(self, url: str, result_from_json, other_result_producers: dict = None):
+        # with a cache, revalidate the cached response with its ETag, and reuse its parsed json when not modified
+        result_producers = dict(other_result_producers) if other_result_producers else {}
+        result_producers[HTTPStatus.OK] = lambda r: result_from_json(self.__cache_response(url, r))
+        headers = jsonld_headers
+        entry = self.cache.get(url) if self.cache is not None else None
+        if entry:
+            headers = {**jsonld_headers, 'If-None-Match': entry.etag}
+            # decoded again, so changes to an earlier result don't end up in this one
+            result_producers[HTTPStatus.NOT_MODIFIED] = lambda r: result_from_json(self.__decode(entry.content))
+        return self._request('GET', url, result_producers, headers=headers)
+
+    def __cache_response(self, url: str, response: Response):
+        etag = response.headers.get('etag')
+        if self.cache is not None and etag:
+            self.cache.put(url, etag, response.content)
+        return self._json(response)
+
+    def __decode(self, content: bytes):
+        with trace_phase('decode'):
+            return self.codec.loads(content)
+
+    def __invalidating(self, result_producer, container_uuid: str, annotation_uuid: str = None):
+        # invalidates the cache when the write succeeded, not when it is sent, so a read in between (or, with the
+        # AsyncElucidateClient, before the request is awaited) can not cache the old version again
+        def produce(response: Response):
+            self.__invalidate_cache(container_uuid, annotation_uuid)
+            return result_producer(response)
+
+        return produce
+
+    def __invalidate_cache(self, container_uuid: str, annotation_uuid: str = None):
+        if self.cache is not None:
+            for version in ('w3c', 'oa'):
+                self.cache.invalidate(f'{self.base_uri}/{version}/{container_uuid}/')
+                if annotation_uuid:
+                    self.cache.invalidate(f'{self.base_uri}/{version}/{container_uuid}/{annotation_uuid}')
+
+    def _handle_response(self, response: Response, result_producers: dict):
         status_code = response.status_code
         status_message = http.client.responses[status_code]
         if self.verbose:
@@ -1124,10 +1133,317 @@ class ElucidateClient:
             return ElucidateFailure(response)
 
 
-def as_annotation_collection(response: Response) -> Union[AnnotationCollection, ElucidateResponse]:
-    json = response.json()
-    return AnnotationCollection(json['total'], json['id'], json['first'], json.get('label'))
+class ElucidateClient(BaseElucidateClient):
+    def __init__(self, base_uri: str, raise_exceptions: bool = True, verbose: bool = False,
+                 transport: Transport = None, cache: ResponseCache = None, codec: JsonCodec = None):
+        """
+        :param base_uri: The base uri of the elucidate server
+        :type base_uri: str
+        :param raise_exceptions: Raise an exception on an unexpected response, instead of returning an ElucidateFailure
+        :type raise_exceptions: bool
+        :param verbose: Print the requests and the response status; use the Metrics of the transport to measure them
+        :type verbose: bool
+        :param transport: The (pooled) http transport to use, a default Transport is created when omitted
+        :type transport: Transport
+        :param cache: The cache for conditional reads of annotations and containers, no caching when omitted
+        :type cache: ResponseCache
+        :param codec: The json encoder/decoder, the fastest installed one when omitted
+        :type codec: JsonCodec
+        """
+        super().__init__(base_uri, raise_exceptions, verbose, transport if transport else Transport(), cache, codec)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Close the connections in the transport pool"""
+        self.transport.close()
+
+    def create_annotations(self, container_id: ContainerIdentifier, annotations: Iterable[tuple],
+                           max_workers: int = None, max_pending: int = None) -> Iterator:
+        """
+        Create annotations in the container with the given ContainerIdentifier, with several requests in flight.
+        The annotations are consumed lazily, as (body, target[, custom[, custom_contexts[, annotation_id]]]) tuples,
+        with the same meaning as the arguments of create_annotation.
+        A failing annotation does not stop the others; its failure is returned in its place.
+
+        :param container_id:
+        :type container_id: ContainerIdentifier
+        :param annotations: The annotations to create
+        :type annotations: Iterable[tuple]
+        :param max_workers: The maximum number of requests in flight; keep this within the pool size of the transport.
+            When omitted: the max_limit of the transport's AdaptiveLimiter, or 8 without a limiter
+        :type max_workers: int
+        :param max_pending: The maximum number of annotations read ahead from annotations, 2 * max_workers when omitted
+        :type max_pending: int
+        :return: Per annotation, in order: the AnnotationIdentifier (or the ElucidateSuccess or ElucidateFailure when
+            raise_exceptions is False), or the Exception raised while creating it
+        :rtype: Iterator
+        """
+        return self.__bulk(lambda annotation: self.create_annotation(container_id, *annotation), annotations,
+                           max_workers, max_pending)
+
+    def delete_annotations(self, annotation_identifiers: Iterable[AnnotationIdentifier], max_workers: int = None,
+                           max_pending: int = None) -> Iterator:
+        """
+        Delete the annotations identified by the given AnnotationIdentifiers (with their etag), with several requests
+        in flight. As with create_annotations, a failure is returned in place of the result.
+
+        :param annotation_identifiers:
+        :type annotation_identifiers: Iterable[AnnotationIdentifier]
+        :param max_workers: The maximum number of requests in flight, as with create_annotations
+        :type max_workers: int
+        :param max_pending: The maximum number of identifiers read ahead, 2 * max_workers when omitted
+        :type max_pending: int
+        :return: Per annotation, in order: the result of delete_annotation, or the Exception raised while deleting it
+        :rtype: Iterator
+        """
+        return self.__bulk(self.delete_annotation, annotation_identifiers, max_workers, max_pending)
+
+    def create_group_annotations(self, group_id: str, annotation_identifiers: Iterable[AnnotationIdentifier],
+                                 max_workers: int = None, max_pending: int = None) -> Iterator:
+        """
+        Add the annotations identified by the given AnnotationIdentifiers to the group, with several requests in flight.
+        As with create_annotations, a failure is returned in place of the result.
 
+        :param group_id: The group id
+        :type group_id: str
+        :param annotation_identifiers:
+        :type annotation_identifiers: Iterable[AnnotationIdentifier]
+        :param max_workers: The maximum number of requests in flight, as with create_annotations
+        :type max_workers: int
+        :param max_pending: The maximum number of identifiers read ahead, 2 * max_workers when omitted
+        :type max_pending: int
+        :return: Per annotation, in order: the result of create_group_annotation, or the Exception raised
+        :rtype: Iterator
+        """
+        return self.__bulk(lambda i: self.create_group_annotation(group_id, i), annotation_identifiers, max_workers,
+                           max_pending)
 
-def as_json_dict(response: Response) -> dict:
-    return response.json()
+    def delete_group_annotations(self, group_id: str, annotation_identifiers: Iterable[AnnotationIdentifier],
+                                 max_workers: int = None, max_pending: int = None) -> Iterator:
+        """
+        Remove the annotations identified by the given AnnotationIdentifiers from the group, with several requests in
+        flight. As with create_annotations, a failure is returned in place of the result.
+
+        :param group_id: The group id
+        :type group_id: str
+        :param annotation_identifiers:
+        :type annotation_identifiers: Iterable[AnnotationIdentifier]
+        :param max_workers: The maximum number of requests in flight, as with create_annotations
+        :type max_workers: int
+        :param max_pending: The maximum number of identifiers read ahead, 2 * max_workers when omitted
+        :type max_pending: int
+        :return: Per annotation, in order: the result of delete_group_annotation, or the Exception raised
+        :rtype: Iterator
+        """
+        return self.__bulk(lambda i: self.delete_group_annotation(group_id, i), annotation_identifiers, max_workers,
+                           max_pending)
+
+    def read_annotations(self, annotation_identifiers: Iterable[AnnotationIdentifier], max_workers: int = None,
+                         scan_ratio: float = 0.5, min_scan: int = 10) -> Iterator[Tuple[AnnotationIdentifier, Any]]:
+        """
+        Read the annotations identified by the given AnnotationIdentifiers, from all containers at the same time.
+        Per container, the annotations are either read one by one, or, when at least min_scan annotations and at least
+        scan_ratio of the annotations in the container are requested, by scanning the pages of the container.
+        Annotations that were not found in the scan are read one by one afterwards.
+
+        :param annotation_identifiers:
+        :type annotation_identifiers: Iterable[AnnotationIdentifier]
+        :param max_workers: The maximum number of requests in flight, as with create_annotations
+        :type max_workers: int
+        :param scan_ratio: The minimal fraction of the annotations in a container to request for a page scan
+        :type scan_ratio: float
+        :param min_scan: The minimal number of annotations to request from a container for a page scan; the container
+            itself is only read to decide on a scan when at least this many are requested
+        :type min_scan: int
+        :return: (AnnotationIdentifier, annotation dict) tuples, one per given AnnotationIdentifier (also for
+            duplicates), in the order they are read, also when raise_exceptions is False; as with create_annotations,
+            the annotation is replaced by the Exception raised (or the ElucidateFailure) when the read failed
+        :rtype: Iterator[Tuple[AnnotationIdentifier, Any]]
+        """
+        max_workers = max_workers_for(self.transport, max_workers)
+        identifiers_per_container = defaultdict(list)
+        for annotation_identifier in annotation_identifiers:
+            identifiers_per_container[annotation_identifier.container_uuid].append(annotation_identifier)
+
+        def read(unit) -> Tuple[list, list]:
+            # the results of the unit, and the identifiers still to read one by one
+            if isinstance(unit, AnnotationIdentifier):
+                return [self.__read_annotation_quietly(unit)], []
+            return self.__scan_container(unit, scan_ratio, max_workers)
+
+        units = self.__read_units(identifiers_per_container.values(), min_scan)
+        unread = []
+        for results, identifiers in bounded_map(read, units, max_workers=max_workers, ordered=False):
+            yield from results
+            unread.extend(identifiers)
+        yield from bounded_map(self.__read_annotation_quietly, unread, max_workers=max_workers, ordered=False)
+
+    def export_container(self, container_identifier: ContainerIdentifier, fileobj: BinaryIO,
+                         compression: str = None, prefetch: int = 1, progress: Callable[[Progress], None] = None,
+                         progress_interval: float = 1.0) -> Union[Progress, ElucidateResponse]:
+        """
+        Write the annotations of the container identified by the given ContainerIdentifier to fileobj as
+        newline-delimited json, one page at a time, so the memory use does not depend on the size of the container.
+
+        :param container_identifier:
+        :type container_identifier: ContainerIdentifier
+        :param fileobj: The binary file object to write to; it is not closed
+        :type fileobj: BinaryIO
+        :param compression: None, 'gzip' or 'zstd' (this requires the optional zstandard dependency)
+        :type compression: str
+        :param prefetch: The number of pages to fetch ahead while writing
+        :type prefetch: int
+        :param progress: Called with the Progress every progress_interval seconds, and when done
+        :type progress: Callable[[Progress], None]
+        :param progress_interval: The number of seconds between progress reports
+        :type progress_interval: float
+        :return: The final Progress, or the ElucidateFailure when reading the container failed and raise_exceptions is False
+        :rtype: Union[Progress, ElucidateResponse]
+        """
+        collection = self.read_container(container_identifier)
+        if isinstance(collection, ElucidateFailure):
+            return collection
+        if isinstance(collection, ElucidateSuccess):
+            collection = collection.result
+        return write_ndjson(collection.annotations_as_json(prefetch=prefetch), fileobj, compression=compression,
+                            total=collection.total, progress=progress, progress_interval=progress_interval,
+                            codec=self.codec)
+
+    def import_annotations(self, container_identifier: ContainerIdentifier, ndjson_path: str,
+                           checkpoint_path: str = None, max_workers: int = None, checkpoint_interval: int = 1000,
+                           on_failure: Callable[[int, Any], None] = None) -> Progress:
+        """
+        Create the annotations from the newline-delimited json file (as written by export_container) in the container
+        identified by the given ContainerIdentifier, with several requests in flight.
+        The offset after the last line that was handled is stored in a checkpoint file, so an interrupted import
+        continues where it left off; delete the checkpoint file to import the file again. The checkpoint is not
+        advanced while none of the lines could be parsed, as that means the file was not read correctly.
+        The annotations keep their id, so annotations that were already created are not duplicated.
+
+        :param container_identifier:
+        :type container_identifier: ContainerIdentifier
+        :param ndjson_path: The path of the ndjson file; a path ending in .gz is read as gzip-compressed, one ending
+            in .zst as zstd-compressed
+        :type ndjson_path: str
+        :param checkpoint_path: The path of the checkpoint file, ndjson_path + '.checkpoint' when omitted
+        :type checkpoint_path: str
+        :param max_workers: The maximum number of requests in flight, as with create_annotations
+        :type max_workers: int
+        :param checkpoint_interval: The number of lines between checkpoint updates
+        :type checkpoint_interval: int
+        :param on_failure: Called with the line number (in the file, counted from 1) and the Exception or
+            ElucidateFailure of every annotation that could not be created
+        :type on_failure: Callable[[int, Any], None]
+        :return: The number of annotations handled, and how many of those failed
+        :rtype: Progress
+        """
+        def parse(line: bytes) -> tuple:
+            annotation = self.codec.loads(line)
+            annotation_id = annotation['id'].split('/')[-1] if 'id' in annotation else None
+            return (*split_annotation(annotation), annotation_id)
+
+        def create(annotation: tuple):
+            return self.create_annotation(container_identifier, *annotation)
+
+        return import_ndjson(ndjson_path, parse, create, checkpoint_path=checkpoint_path,
+                             max_workers=max_workers_for(self.transport, max_workers),
+                             checkpoint_interval=checkpoint_interval, on_failure=on_failure)
+
+    def watch(self, since: datetime = None, cursor_path: str = None, min_interval: float = 1.0,
+              max_interval: float = 60.0) -> Iterator[AnnotationEvent]:
+        """
+        Watch the server for created and modified annotations, polling less often while nothing changes.
+        This generator does not end by itself.
+
+        :param since: The (UTC) time to start watching from, now when omitted; ignored when continuing from a cursor file
+        :type since: datetime
+        :param cursor_path: The file to store the cursor in, so a restarted watch continues without gaps
+        :type cursor_path: str
+        :param min_interval: The minimal number of seconds between polls
+        :type min_interval: float
+        :param max_interval: The maximal number of seconds between polls
+        :type max_interval: float
+        :return: The AnnotationEvents, per poll first the created, then the modified annotations
+        :rtype: Iterator[AnnotationEvent]
+        """
+        return iter(ChangeFeed(self, since=since, cursor_path=cursor_path, min_interval=min_interval,
+                               max_interval=max_interval))
+
+    def __bulk(self, call: Callable, items: Iterable, max_workers: int, max_pending: int) -> Iterator:
+        def call_quietly(item):
+            try:
+                return call(item)
+            except Exception as e:
+                return e
+
+        return bounded_map(call_quietly, items, max_workers=max_workers_for(self.transport, max_workers),
+                           max_pending=max_pending)
+
+    @staticmethod
+    def __read_units(identifier_groups: Iterable[List[AnnotationIdentifier]], min_scan: int) -> Iterator:
+        # the identifiers of a container to consider for a page scan as one list, the others one by one
+        for identifiers in identifier_groups:
+            if len({i.uuid for i in identifiers}) >= min_scan:
+                yield identifiers
+            else:
+                yield from identifiers
+
+    def __scan_container(self, identifiers: List[AnnotationIdentifier], scan_ratio: float,
+                         max_workers: int) -> Tuple[list, list]:
+        # the requested annotations found in the pages of their container, and the identifiers that were not found
+        wanted = defaultdict(list)
+        for annotation_identifier in identifiers:
+            wanted[annotation_identifier.uuid].append(annotation_identifier)
+        collection = self.__read_container_quietly(identifiers[0].container_identifier())
+        if not collection or len(wanted) < scan_ratio * collection.total:
+            return [], identifiers
+        found = []
+        for page in collection.pages_as_json(max_workers=max_workers, ordered=False):
+            for annotation in page:
+                for annotation_identifier in wanted.pop(annotation['id'].split('/')[-1], []):
+                    found.append((annotation_identifier, annotation))
+            if not wanted:
+                break
+        return found, [i for missing in wanted.values() for i in missing]
+
+    def __read_container_quietly(self, container_identifier: ContainerIdentifier) -> Union[None, AnnotationCollection]:
+        try:
+            result = self.read_container(container_identifier)
+        except Exception:
+            return None
+        if isinstance(result, ElucidateResponse):
+            return result.result if isinstance(result, ElucidateSuccess) else None
+        return result
+
+    def __read_annotation_quietly(self, annotation_identifier: AnnotationIdentifier):
+        try:
+            result = self.read_annotation(annotation_identifier)
+        except Exception as e:
+            return annotation_identifier, e
+        # without exceptions, unwrap the annotation, so it is a dict as when it was found in a page scan
+        return annotation_identifier, result.result if isinstance(result, ElucidateSuccess) else result
+
+    def _request(self, method: str, url: str, result_producers: dict, **kwargs):
+        kwargs = self._encode_json(kwargs)
+        if not self._instrumented():
+            return self._handle_response(self.transport.request(method, url, **kwargs), result_producers)
+        with self._instrumentation(calling_endpoint()):
+            response = self.transport.request(method, url, **kwargs)
+            with trace_phase('construct'):
+                return self._handle_response(response, result_producers)
+
+
+def as_annotation_collection(response: Response, transport: Transport = None,
+                             codec: JsonCodec = None) -> Union[AnnotationCollection, ElucidateResponse]:
+    codec = codec if codec else JsonCodec()
+    json = codec.loads(response.content)
+    return AnnotationCollection(json['total'], json['id'], json['first'], json.get('label'), transport, codec)
+
+
+def as_json_dict(response: Response, codec: JsonCodec = None) -> dict:
+    return (codec if codec else JsonCodec()).loads(response.content)
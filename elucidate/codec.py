@@ -0,0 +1,60 @@
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    ujson = None
+
+
+def available_codecs() -> list:
+    """The names of the json libraries that are installed, fastest first"""
+    return [name for name, module in (('orjson', orjson), ('ujson', ujson), ('json', json)) if module]
+
+
+class JsonCodec:
+    """
+    The json encoder/decoder used for request and response bodies.
+    Uses orjson or ujson when installed, falling back on the standard library json module.
+    """
+
+    def __init__(self, name: str = None):
+        """
+        :param name: 'orjson', 'ujson' or 'json'; the fastest installed library when omitted
+        :type name: str
+        """
+        available = available_codecs()
+        if name is None:
+            name = available[0]
+        elif name not in available:
+            raise ValueError(f"json library {name} is not available, choose from {available}")
+        self.name = name
+        if name == 'orjson':
+            self._dumps = lambda o, sort_keys: orjson.dumps(o, option=orjson.OPT_SORT_KEYS if sort_keys else None)
+            self._loads = orjson.loads
+        elif name == 'ujson':
+            self._dumps = lambda o, sort_keys: ujson.dumps(o, ensure_ascii=False, sort_keys=sort_keys).encode('utf-8')
+            self._loads = ujson.loads
+        else:
+            self._dumps = lambda o, sort_keys: json.dumps(o, ensure_ascii=False, separators=(',', ':'),
+                                                          sort_keys=sort_keys).encode('utf-8')
+            self._loads = json.loads
+
+    def __str__(self):
+        return f"JsonCodec:\n  name = {self.name}"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def dumps(self, obj: Any, sort_keys: bool = False) -> bytes:
+        """Encode obj as utf-8 json, with the keys of its dicts sorted when sort_keys is set"""
+        return self._dumps(obj, sort_keys)
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        """Decode the json in data"""
+        return self._loads(data)
@@ -0,0 +1,299 @@
+import time
+from functools import partial
+from itertools import chain
+from typing import Iterator, Union, Dict, List, Optional, Sequence
+
+from elucidate.codec import JsonCodec
+from elucidate.model import ContainerIdentifier, ElucidateFailure, ElucidateSuccess
+from elucidate.ndjson import Progress
+from elucidate.tools import as_list, pixel_region, target_selectors, text_position
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+try:
+    import pyarrow
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+try:
+    import pyarrow.dataset
+except ImportError:  # pragma: no cover
+    pass
+
+try:
+    import pandas
+except ImportError:  # pragma: no cover
+    pandas = None
+
+formats = ('arrow', 'numpy', 'python')
+
+# the flattened annotation: one row per annotation, with the fields of its first target, its first text position and
+# pixel region (with the source they are on), and its first body
+string_columns = ('id', 'motivation', 'created', 'modified', 'target_source', 'selector_type', 'text_source',
+                  'image_source', 'body_id', 'body_purpose', 'body_value', 'creator', 'generator')
+int_columns = ('selector_start', 'selector_end', 'xywh_x', 'xywh_y', 'xywh_w', 'xywh_h')
+columns = string_columns + int_columns
+
+
+def split_annotations(annotations, chunk_size: int = 10000, format: str = 'arrow') -> Iterator:
+    """
+    The batch, columnar version of split_annotation: flatten the annotations into a table with one row per annotation,
+    in chunks of chunk_size rows, so the memory use does not depend on the number of annotations.
+    Per annotation, target_source and selector_type come from the first target; text_source, selector_start and
+    selector_end from the first target with a TextPositionSelector or char= fragment; image_source and the xywh
+    columns from the first target with a pixel xywh= fragment (percent regions are skipped); the body columns from
+    the first body; creator and generator are the id (or name) of the first agent.
+
+    :param annotations: The annotation dicts, or an AnnotationCollection
+    :type annotations: Union[Iterable[dict], AnnotationCollection]
+    :param chunk_size: The number of rows per chunk
+    :type chunk_size: int
+    :param format: 'arrow' for pyarrow.RecordBatches, 'numpy' for dicts of numpy arrays (strings as object arrays,
+        missing numbers as -1), or 'python' for dicts of lists (missing values as None)
+    :type format: str
+    :return: The chunks, in the order of the annotations
+    :rtype: Iterator
+    """
+    if format not in formats:
+        raise ValueError(f"unknown format {format}, choose from {formats}")
+    if format == 'arrow' and pyarrow is None:
+        raise ImportError("the arrow format requires pyarrow, install it with: pip install elucidate-client[columnar]")
+    if format == 'numpy' and numpy is None:
+        raise ImportError("the numpy format requires numpy, install it with: pip install elucidate-client[columnar]")
+    if hasattr(annotations, 'annotations_as_json'):
+        annotations = annotations.annotations_as_json()
+    chunk = _empty_chunk()
+    for annotation in annotations:
+        _append(chunk, annotation)
+        if len(chunk['id']) >= chunk_size:
+            yield _convert(chunk, format)
+            chunk = _empty_chunk()
+    if chunk['id']:
+        yield _convert(chunk, format)
+
+
+def to_dataframe(annotations, chunk_size: int = 10000):
+    """
+    Flatten the annotations (as with split_annotations) into one pandas DataFrame.
+    This requires pandas, and uses pyarrow when installed.
+
+    :param annotations: The annotation dicts, or an AnnotationCollection
+    :type annotations: Union[Iterable[dict], AnnotationCollection]
+    :param chunk_size: The number of annotations to convert at a time
+    :type chunk_size: int
+    :return: The DataFrame, with the columns of split_annotations
+    :rtype: pandas.DataFrame
+    """
+    if pandas is None:
+        raise ImportError("to_dataframe requires pandas, install it with: pip install elucidate-client[dataframe]")
+    if pyarrow is not None:
+        batches = list(split_annotations(annotations, chunk_size, 'arrow'))
+        return pyarrow.Table.from_batches(batches, schema=arrow_schema()).to_pandas()
+    frames = [pandas.DataFrame(chunk, columns=list(columns))
+              for chunk in split_annotations(annotations, chunk_size, 'python')]
+    if not frames:
+        return pandas.DataFrame(columns=list(columns))
+    return pandas.concat(frames, ignore_index=True)
+
+
+def export_parquet(annotations, path: str, client=None, partition_by: Sequence[str] = (),
+                   rows_per_group: int = 100000, max_rows_per_file: int = 10000000, max_workers: int = None,
+                   compression: str = 'zstd', codec: JsonCodec = None, processes: int = 0) -> Progress:
+    """
+    Write a snapshot of the annotations as a Parquet dataset in the directory at path: the columns of
+    split_annotations, plus the complete annotation as a json column.
+    The annotations are streamed to the files in row groups, so the memory use does not depend on the number of
+    annotations; the pages of an AnnotationCollection are fetched concurrently (and written in order).
+    This requires pyarrow.
+
+    :param annotations: The annotation dicts, an AnnotationCollection, or a ContainerIdentifier to read with the client
+    :type annotations: Union[Iterable[dict], AnnotationCollection, ContainerIdentifier]
+    :param path: The directory to write the dataset to; it should be empty or not exist yet
+    :type path: str
+    :param client: The client to read the container with, when annotations is a ContainerIdentifier
+    :type client: ElucidateClient
+    :param partition_by: The columns to partition the dataset by (in hive-style column=value directories), such as
+        ('motivation',); the dataset is only split into files of max_rows_per_file rows when omitted
+    :type partition_by: Sequence[str]
+    :param rows_per_group: The number of rows per Parquet row group
+    :type rows_per_group: int
+    :param max_rows_per_file: The maximum number of rows per file
+    :type max_rows_per_file: int
+    :param max_workers: The maximum number of pages fetched at the same time; when omitted, the max_limit of the
+        transport's AdaptiveLimiter, or 8 without a limiter
+    :type max_workers: int
+    :param compression: The Parquet compression codec: 'zstd', 'snappy', 'gzip' or None
+    :type compression: str
+    :param codec: The json encoder for the json column, the fastest installed one when omitted
+    :type codec: JsonCodec
+    :param processes: The number of worker processes to decode and flatten the pages of an AnnotationCollection in,
+        0 to do that in this process
+    :type processes: int
+    :return: The number of annotations written, and the time it took
+    :rtype: Progress
+    """
+    if pyarrow is None:
+        raise ImportError("export_parquet requires pyarrow, install it with: pip install elucidate-client[columnar]")
+    annotations = _resolve(annotations, client)
+    codec = codec if codec else JsonCodec()
+    progress = Progress(0, getattr(annotations, 'total', None), 0.0)
+    if processes > 0 and hasattr(annotations, 'pages_as_json'):
+        data = _page_batches(annotations, progress, max_workers, processes, codec)
+    else:
+        data = _annotation_batches(annotations, progress, max_workers, rows_per_group, codec)
+    start = time.monotonic()
+    parquet = pyarrow.dataset.ParquetFileFormat()
+    pyarrow.dataset.write_dataset(data, path, schema=arrow_schema(raw_json=True), format=parquet,
+                                  file_options=parquet.make_write_options(compression=compression),
+                                  partitioning=list(partition_by) or None, partitioning_flavor='hive',
+                                  basename_template='part-{i}.parquet', min_rows_per_group=rows_per_group,
+                                  max_rows_per_group=rows_per_group, max_rows_per_file=max_rows_per_file)
+    progress.seconds = time.monotonic() - start
+    return progress
+
+
+def _resolve(annotations, client):
+    if isinstance(annotations, ContainerIdentifier):
+        if client is None:
+            raise ValueError("a client is needed to export a ContainerIdentifier")
+        annotations = client.read_container(annotations)
+    if isinstance(annotations, ElucidateFailure):
+        raise Exception(f'{annotations.response.request.method} {annotations.response.request.url} returned '
+                        f'{annotations.response.status_code}')
+    if isinstance(annotations, ElucidateSuccess):
+        return annotations.result
+    return annotations
+
+
+def _page_batches(collection, progress: Progress, max_workers: int, processes: int, codec: JsonCodec):
+    # one batch per page, made by the worker processes; write_dataset combines them into row groups
+    for batch in collection.pages_as_json(max_workers=max_workers, processes=processes,
+                                          transform=partial(_page_batch, codec.name)):
+        progress.count += batch.num_rows
+        yield batch
+
+
+def _annotation_batches(annotations, progress: Progress, max_workers: int, rows_per_group: int, codec: JsonCodec):
+    if hasattr(annotations, 'pages_as_json'):
+        annotations = chain.from_iterable(annotations.pages_as_json(max_workers=max_workers))
+    schema = arrow_schema(raw_json=True)
+    dumps = codec.dumps
+    chunk = _empty_chunk(raw_json=True)
+    for annotation in annotations:
+        _append(chunk, annotation)
+        chunk['json'].append(dumps(annotation).decode('utf-8'))
+        if len(chunk['id']) >= rows_per_group:
+            progress.count += len(chunk['id'])
+            yield _convert(chunk, 'arrow', schema)
+            chunk = _empty_chunk(raw_json=True)
+    if chunk['id']:
+        progress.count += len(chunk['id'])
+        yield _convert(chunk, 'arrow', schema)
+
+
+def _page_batch(codec_name: str, annotations: List[dict]):
+    # runs in a worker process of export_parquet
+    dumps = JsonCodec(codec_name).dumps
+    chunk = _empty_chunk(raw_json=True)
+    for annotation in annotations:
+        _append(chunk, annotation)
+        chunk['json'].append(dumps(annotation).decode('utf-8'))
+    return _convert(chunk, 'arrow', arrow_schema(raw_json=True))
+
+
+def arrow_schema(raw_json: bool = False):
+    fields = [(name, pyarrow.string()) for name in string_columns] + [(name, pyarrow.int64()) for name in int_columns]
+    if raw_json:
+        fields.append(('json', pyarrow.string()))
+    return pyarrow.schema(fields)
+
+
+def flatten_annotation(annotation: dict) -> dict:
+    """One row of split_annotations, as a dict"""
+    chunk = _empty_chunk()
+    _append(chunk, annotation)
+    return {name: values[0] for name, values in chunk.items()}
+
+
+def _empty_chunk(raw_json: bool = False) -> Dict[str, list]:
+    return {name: [] for name in (columns + ('json',) if raw_json else columns)}
+
+
+def _append(chunk: Dict[str, list], annotation: dict):
+    chunk['id'].append(_string(annotation.get('id')))
+    chunk['motivation'].append(_string(annotation.get('motivation')))
+    chunk['created'].append(_string(annotation.get('created')))
+    chunk['modified'].append(_string(annotation.get('modified')))
+    targets = as_list(annotation.get('target'))
+    first = targets[0] if targets else None
+    chunk['target_source'].append(first if isinstance(first, str) else _source(first))
+    first_selectors = target_selectors(first)
+    chunk['selector_type'].append(_string(first_selectors[0].get('type')) if first_selectors else None)
+    # every group of columns comes from a single target, so a position is never paired with another target's source
+    text = image = None
+    for target in targets:
+        for selector in target_selectors(target):
+            if text is None:
+                position = text_position(selector)
+                text = (_source(target),) + position if position else None
+            if image is None:
+                region = _xywh(selector)
+                image = (_source(target),) + region if region else None
+    for name, value in zip(('text_source', 'selector_start', 'selector_end'), text or (None,) * 3):
+        chunk[name].append(value)
+    for name, value in zip(('image_source', 'xywh_x', 'xywh_y', 'xywh_w', 'xywh_h'), image or (None,) * 5):
+        chunk[name].append(value)
+    bodies = as_list(annotation.get('body'))
+    body = bodies[0] if bodies else None
+    if isinstance(body, dict):
+        chunk['body_id'].append(_string(body.get('id')))
+        chunk['body_purpose'].append(_string(body.get('purpose')))
+        chunk['body_value'].append(_string(body.get('value')))
+    else:
+        chunk['body_id'].append(_string(body))
+        chunk['body_purpose'].append(None)
+        chunk['body_value'].append(None)
+    chunk['creator'].append(_agent(annotation.get('creator')))
+    chunk['generator'].append(_agent(annotation.get('generator')))
+
+
+def _convert(chunk: Dict[str, list], format: str, schema=None):
+    if format == 'python':
+        return chunk
+    if format == 'numpy':
+        arrays = {name: numpy.array(chunk[name], dtype=object) for name in string_columns}
+        arrays.update({name: numpy.array([-1 if v is None else v for v in chunk[name]], dtype=numpy.int64)
+                       for name in int_columns})
+        return arrays
+    schema = schema if schema is not None else arrow_schema()
+    return pyarrow.RecordBatch.from_arrays([pyarrow.array(chunk[field.name], type=field.type) for field in schema],
+                                           schema=schema)
+
+
+def _string(value):
+    return value if value is None or isinstance(value, str) else str(value)
+
+
+def _source(target) -> Union[None, str]:
+    if not isinstance(target, dict):
+        return None
+    return _string(target.get('source', target.get('id')))
+
+
+def _xywh(selector: dict) -> Optional[tuple]:
+    # in whole pixels
+    region = pixel_region(selector)
+    return tuple(round(v) for v in region) if region else None
+
+
+def _agent(agent) -> Union[None, str]:
+    agents = as_list(agent)
+    if not agents:
+        return None
+    first = agents[0]
+    if isinstance(first, dict):
+        return _string(first.get('id', first.get('name')))
+    return _string(first)
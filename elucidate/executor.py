@@ -0,0 +1,57 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Any
+
+default_max_workers = 8
+
+
+def max_workers_for(transport, max_workers: int = None) -> int:
+    """
+    The given max_workers, or else enough workers to reach the max_limit of the transport's AdaptiveLimiter,
+    or else default_max_workers
+    """
+    if max_workers:
+        return max_workers
+    limiter = getattr(transport, 'limiter', None)
+    return limiter.max_limit if limiter else default_max_workers
+
+
+def bounded_map(function: Callable[[Any], Any], iterable: Iterable, max_workers: int = 8, ordered: bool = True,
+                max_pending: int = None) -> Iterator:
+    """
+    Apply function to the items of iterable in a pool of threads, consuming the iterable lazily
+
+    :param function: The function to apply
+    :type function: Callable
+    :param iterable: The items to apply the function to
+    :type iterable: Iterable
+    :param max_workers: The number of threads
+    :type max_workers: int
+    :param ordered: Yield the results in the order of the items, or as soon as they are available
+    :type ordered: bool
+    :param max_pending: The maximum number of items that are in flight, or done but not yet yielded;
+        2 * max_workers when omitted
+    :type max_pending: int
+    :return: The results of the function
+    """
+    if max_pending is None:
+        max_pending = 2 * max_workers
+    items = iter(iterable)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque(executor.submit(function, item) for item in islice(items, max_pending))
+        try:
+            while pending:
+                if ordered:
+                    done = [pending.popleft()]
+                else:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        pending.remove(future)
+                for item in islice(items, len(done)):
+                    pending.append(executor.submit(function, item))
+                for future in done:
+                    yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
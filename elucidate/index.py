@@ -0,0 +1,492 @@
+import math
+import random
+from collections import defaultdict, deque
+from itertools import count
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from elucidate.tools import as_list, fragment_pixel_region, pixel_region, target_selectors, text_position
+
+
+class TextSpan:
+    """The characters start (inclusive) to end (exclusive) of the source, targeted by the annotation"""
+    __slots__ = ('source', 'start', 'end', 'annotation')
+
+    def __init__(self, source: str, start: int, end: int, annotation: dict):
+        self.source = source
+        self.start = start
+        self.end = end
+        self.annotation = annotation
+
+    def __str__(self):
+        return f"TextSpan:\n  source = {self.source}\n  start = {self.start}\n  end = {self.end}" \
+               f"\n  annotation = {self.annotation.get('id')}"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+def text_spans(annotation: dict) -> Iterator[Tuple[str, int, int]]:
+    """
+    The (source, start, end) of every target of the annotation with a TextPositionSelector or a char= FragmentSelector,
+    including those refining another selector. A span that is selected in several ways is only included once.
+    """
+    spans = set()
+    for target in as_list(annotation.get('target')):
+        if not isinstance(target, dict) or not isinstance(target.get('source'), str):
+            continue
+        for selector in target_selectors(target):
+            position = text_position(selector)
+            span = (target['source'],) + position if position else None
+            if span and span not in spans:
+                spans.add(span)
+                yield span
+
+
+class IntervalIndex:
+    """
+    An in-memory index of the text spans targeted by annotations, to answer overlap, containment and nearest queries
+    locally instead of with a search per question.
+    There is an interval tree per target source: a treap ordered on start, where every node keeps the largest end in its
+    subtree. An overlapping query takes O((k + 1) log n) expected time for k results. within only visits the spans
+    starting in the range, and containing those starting before it that end far enough, so their time depends on those
+    numbers rather than on the number of results. Annotations can be added and removed (by id) as they change.
+    Spans are half-open, like TextPositionSelectors: [start, end).
+    """
+
+    def __init__(self, annotations: Iterable[dict] = ()):
+        """
+        :param annotations: The annotations to index, or an AnnotationCollection or the annotations of an
+            AnnotationMirror; annotations without text spans are skipped, those with text spans need an id
+        :type annotations: Union[Iterable[dict], AnnotationCollection]
+        """
+        self._trees = {}
+        self._spans_by_id = defaultdict(list)
+        self._ids = count()
+        self._random = random.Random()
+        spans_by_source = defaultdict(list)
+        for annotation in _annotations(annotations):
+            for source, start, end in text_spans(annotation):
+                node = self.__node(source, start, end, annotation)
+                spans_by_source[source].append(node)
+        for source, nodes in spans_by_source.items():
+            nodes.sort(key=lambda n: n.key)
+            self._trees[source] = self.__build(nodes)
+
+    def __str__(self):
+        return f"IntervalIndex:\n  sources = {len(self._trees)}\n  annotations = {len(self._spans_by_id)}"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __len__(self):
+        """The number of indexed spans"""
+        return sum(len(nodes) for nodes in self._spans_by_id.values())
+
+    def __contains__(self, annotation_id: str):
+        return annotation_id in self._spans_by_id
+
+    def sources(self) -> List[str]:
+        return [source for source, root in self._trees.items() if root is not None]
+
+    def add(self, annotation: dict) -> int:
+        """
+        Index the text spans of the annotation, replacing those of an earlier version with the same id
+
+        :param annotation: The annotation, with an id
+        :type annotation: dict
+        :return: The number of spans indexed
+        :rtype: int
+        """
+        self.remove(_annotation_id(annotation))
+        added = 0
+        for source, start, end in text_spans(annotation):
+            node = self.__node(source, start, end, annotation)
+            self._trees[source] = _insert(self._trees.get(source), node)
+            added += 1
+        return added
+
+    def remove(self, annotation_id: str) -> int:
+        """
+        Remove the spans of the annotation with the given id from the index
+
+        :param annotation_id: The id of the annotation
+        :type annotation_id: str
+        :return: The number of spans removed
+        :rtype: int
+        """
+        nodes = self._spans_by_id.pop(annotation_id, [])
+        for node in nodes:
+            source = node.span.source
+            self._trees[source] = _delete(self._trees.get(source), node.key)
+        return len(nodes)
+
+    def overlapping(self, source: str, start: int, end: int) -> List[TextSpan]:
+        """The spans on the source that share at least one character with [start, end), ordered by start"""
+        found = []
+        _overlapping(self._trees.get(source), start, end, found)
+        return found
+
+    def within(self, source: str, start: int, end: int) -> List[TextSpan]:
+        """The spans on the source that lie completely within [start, end), ordered by start"""
+        found = []
+        _within(self._trees.get(source), start, end, found)
+        return found
+
+    def containing(self, source: str, start: int, end: int) -> List[TextSpan]:
+        """The spans on the source that completely contain [start, end), ordered by start"""
+        found = []
+        _containing(self._trees.get(source), start, end, found)
+        return found
+
+    def nearest(self, source: str, start: int, end: int = None) -> Optional[TextSpan]:
+        """
+        The span on the source closest to [start, end) (or to the position start): an overlapping span when there is
+        one, otherwise the closest span before or after it, measured in characters between the spans
+
+        :param source: The target source
+        :type source: str
+        :param start: The start of the range
+        :type start: int
+        :param end: The end of the range, start when omitted
+        :type end: int
+        :return: The nearest span, or None when the source has no spans
+        :rtype: Optional[TextSpan]
+        """
+        end = start if end is None else end
+        root = self._trees.get(source)
+        overlapping = _first_overlapping(root, start, max(end, start + 1))
+        if overlapping is not None:
+            return overlapping.span
+        # nothing overlaps, so every span starting before the range also ends before it
+        before = _max_end_before(root, end)
+        after = _first_starting_at(root, end)
+        if before is None or after is None:
+            closest = before or after
+            return closest.span if closest else None
+        return before.span if start - before.span.end <= after.span.start - end else after.span
+
+    def __node(self, source: str, start: int, end: int, annotation: dict) -> '_Node':
+        span = TextSpan(source, start, end, annotation)
+        node = _Node((start, end, next(self._ids)), span, self._random.random())
+        self._spans_by_id[_annotation_id(annotation)].append(node)
+        return node
+
+    @staticmethod
+    def __build(nodes: List['_Node']) -> Optional['_Node']:
+        # a balanced tree of the sorted nodes, with the highest priorities assigned level by level to keep it a treap
+        if not nodes:
+            return None
+        priorities = sorted((node.priority for node in nodes), reverse=True)
+
+        def build(lo: int, hi: int) -> Optional[_Node]:
+            if lo >= hi:
+                return None
+            mid = (lo + hi) // 2
+            node = nodes[mid]
+            node.left = build(lo, mid)
+            node.right = build(mid + 1, hi)
+            node.update()
+            return node
+
+        root = build(0, len(nodes))
+        queue = deque([root])
+        i = 0
+        while queue:
+            node = queue.popleft()
+            node.priority = priorities[i]
+            i += 1
+            queue.extend(child for child in (node.left, node.right) if child is not None)
+        return root
+
+
+def _annotation_id(annotation: dict) -> str:
+    # the spans are kept (and replaced) per annotation id
+    annotation_id = annotation.get('id')
+    if annotation_id is None:
+        raise ValueError("an IntervalIndex can only index annotations with an id")
+    return annotation_id
+
+
+class _Node:
+    __slots__ = ('key', 'span', 'priority', 'left', 'right', 'max_end')
+
+    def __init__(self, key: tuple, span: TextSpan, priority: float):
+        self.key = key
+        self.span = span
+        self.priority = priority
+        self.left = None
+        self.right = None
+        self.max_end = span.end
+
+    def update(self):
+        max_end = self.span.end
+        if self.left is not None and self.left.max_end > max_end:
+            max_end = self.left.max_end
+        if self.right is not None and self.right.max_end > max_end:
+            max_end = self.right.max_end
+        self.max_end = max_end
+
+
+def _split(node: Optional[_Node], key: tuple) -> Tuple[Optional[_Node], Optional[_Node]]:
+    # the nodes with keys < key, and those with keys >= key
+    if node is None:
+        return None, None
+    if node.key < key:
+        node.right, right = _split(node.right, key)
+        node.update()
+        return node, right
+    left, node.left = _split(node.left, key)
+    node.update()
+    return left, node
+
+
+def _merge(left: Optional[_Node], right: Optional[_Node]) -> Optional[_Node]:
+    # all keys in left are smaller than those in right
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        left.update()
+        return left
+    right.left = _merge(left, right.left)
+    right.update()
+    return right
+
+
+def _insert(root: Optional[_Node], node: _Node) -> _Node:
+    left, right = _split(root, node.key)
+    return _merge(_merge(left, node), right)
+
+
+def _delete(node: Optional[_Node], key: tuple) -> Optional[_Node]:
+    if node is None:
+        return None
+    if key == node.key:
+        return _merge(node.left, node.right)
+    if key < node.key:
+        node.left = _delete(node.left, key)
+    else:
+        node.right = _delete(node.right, key)
+    node.update()
+    return node
+
+
+def _overlapping(node: Optional[_Node], start: int, end: int, found: list):
+    if node is None or node.max_end <= start:
+        return
+    _overlapping(node.left, start, end, found)
+    if node.span.start < end:
+        if node.span.end > start:
+            found.append(node.span)
+        _overlapping(node.right, start, end, found)
+
+
+def _within(node: Optional[_Node], start: int, end: int, found: list):
+    if node is None:
+        return
+    if node.span.start >= start:
+        _within(node.left, start, end, found)
+        if node.span.start <= end and node.span.end <= end:
+            found.append(node.span)
+    if node.span.start <= end:
+        _within(node.right, start, end, found)
+
+
+def _containing(node: Optional[_Node], start: int, end: int, found: list):
+    if node is None or node.max_end < end:
+        return
+    _containing(node.left, start, end, found)
+    if node.span.start <= start:
+        if node.span.end >= end:
+            found.append(node.span)
+        _containing(node.right, start, end, found)
+
+
+def _first_overlapping(node: Optional[_Node], start: int, end: int) -> Optional[_Node]:
+    while node is not None:
+        if node.left is not None and node.left.max_end > start:
+            node = node.left
+        elif node.span.start < end and node.span.end > start:
+            return node
+        elif node.span.start >= end:
+            return None
+        else:
+            node = node.right
+    return None
+
+
+def _first_starting_at(node: Optional[_Node], position: int) -> Optional[_Node]:
+    # the node with the smallest start >= position
+    found = None
+    while node is not None:
+        if node.span.start >= position:
+            found = node
+            node = node.left
+        else:
+            node = node.right
+    return found
+
+
+def _max_end_before(node: Optional[_Node], position: int) -> Optional[_Node]:
+    # the node with the largest end among those starting before position
+    best = None
+    best_subtree = None
+    while node is not None:
+        if node.span.start < position:
+            if best is None or node.span.end > best.span.end:
+                best = node
+            if node.left is not None and (best_subtree is None or node.left.max_end > best_subtree.max_end):
+                best_subtree = node.left
+            node = node.right
+        else:
+            node = node.left
+    if best_subtree is not None and (best is None or best_subtree.max_end > best.span.end):
+        # descend along the largest end to the node that has it
+        node = best_subtree
+        while node.span.end != node.max_end:
+            node = node.left if node.left is not None and node.left.max_end == node.max_end else node.right
+        best = node
+    return best
+
+
+class ImageRegion:
+    """The rectangle x, y, w, h (in pixels) of the source image, targeted by the annotation"""
+    __slots__ = ('source', 'x', 'y', 'w', 'h', 'annotation')
+
+    def __init__(self, source: str, x: float, y: float, w: float, h: float, annotation: dict):
+        self.source = source
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+        self.annotation = annotation
+
+    def __str__(self):
+        return f"ImageRegion:\n  source = {self.source}\n  xywh = {self.x},{self.y},{self.w},{self.h}" \
+               f"\n  annotation = {self.annotation.get('id')}"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+def image_regions(annotation: dict) -> Iterator[Tuple[str, float, float, float, float]]:
+    """
+    The (source, x, y, w, h) of every target of the annotation with an xywh= FragmentSelector (in pixels), or a source
+    url ending in an #xywh= fragment
+    """
+    for target in as_list(annotation.get('target')):
+        if isinstance(target, str):
+            source, _, fragment = target.partition('#')
+            region = fragment_pixel_region(fragment)
+            if region:
+                yield (source,) + region
+            continue
+        if not isinstance(target, dict) or not isinstance(target.get('source'), str):
+            continue
+        for selector in target_selectors(target):
+            region = pixel_region(selector)
+            if region:
+                yield (target['source'],) + region
+
+
+class SpatialIndex:
+    """
+    An in-memory index of the image regions targeted by annotations, to answer viewport queries (such as those of a IIIF
+    viewer panning over a scan) locally instead of with an xywh search per view.
+    There is a packed R-tree per target source, bulk loaded with Sort-Tile-Recursive: the regions are sorted into tiles
+    of node_size regions, which are grouped the same way level by level. The tree is static; build a new index when
+    the annotations change. Regions are closed rectangles, so regions that only touch the viewport intersect it too.
+    Percent-based xywh fragments are not indexed.
+    """
+
+    def __init__(self, annotations: Iterable[dict] = (), node_size: int = 16):
+        """
+        :param annotations: The annotations to index, or an AnnotationCollection or the annotations of an
+            AnnotationMirror; annotations without xywh regions are skipped
+        :type annotations: Union[Iterable[dict], AnnotationCollection]
+        :param node_size: The maximum number of children per tree node
+        :type node_size: int
+        """
+        self.node_size = node_size
+        entries_by_source = defaultdict(list)
+        for annotation in _annotations(annotations):
+            for source, x, y, w, h in image_regions(annotation):
+                entries_by_source[source].append((x, y, x + w, y + h, ImageRegion(source, x, y, w, h, annotation)))
+        self._count = sum(len(entries) for entries in entries_by_source.values())
+        self._trees = {source: _pack(entries, node_size) for source, entries in entries_by_source.items()}
+
+    def __str__(self):
+        return f"SpatialIndex:\n  sources = {len(self._trees)}\n  regions = {self._count}"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __len__(self):
+        """The number of indexed regions"""
+        return self._count
+
+    def sources(self) -> List[str]:
+        return list(self._trees)
+
+    def intersecting(self, source: str, x: float, y: float, w: float, h: float) -> List[ImageRegion]:
+        """
+        The regions of the source image that intersect the rectangle x, y, w, h
+
+        :param source: The source image
+        :type source: str
+        :param x: The left of the viewport
+        :type x: float
+        :param y: The top of the viewport
+        :type y: float
+        :param w: The width of the viewport
+        :type w: float
+        :param h: The height of the viewport
+        :type h: float
+        :return: The intersecting regions, in no particular order
+        :rtype: List[ImageRegion]
+        """
+        root = self._trees.get(source)
+        if root is None:
+            return []
+        min_x, min_y, max_x, max_y = x, y, x + w, y + h
+        found = []
+        stack = [root]
+        while stack:
+            for entry in stack.pop():
+                if entry[0] <= max_x and entry[2] >= min_x and entry[1] <= max_y and entry[3] >= min_y:
+                    if isinstance(entry[4], list):
+                        stack.append(entry[4])
+                    else:
+                        found.append(entry[4])
+        return found
+
+    def at(self, source: str, x: float, y: float) -> List[ImageRegion]:
+        """The regions of the source image that contain the point x, y"""
+        return self.intersecting(source, x, y, 0, 0)
+
+
+def _pack(entries: List[tuple], node_size: int) -> list:
+    # Sort-Tile-Recursive: entries are (min_x, min_y, max_x, max_y, region or child entries) tuples, and every level
+    # groups those of the level below into nodes of node_size entries, until one node (the root) is left
+    while True:
+        if len(entries) <= node_size:
+            return entries
+        node_count = math.ceil(len(entries) / node_size)
+        slice_size = node_size * math.ceil(node_count / math.ceil(math.sqrt(node_count)))
+        entries.sort(key=lambda e: e[0] + e[2])
+        nodes = []
+        for i in range(0, len(entries), slice_size):
+            tile = sorted(entries[i:i + slice_size], key=lambda e: e[1] + e[3])
+            for j in range(0, len(tile), node_size):
+                children = tile[j:j + node_size]
+                nodes.append((min(e[0] for e in children), min(e[1] for e in children),
+                              max(e[2] for e in children), max(e[3] for e in children), children))
+        entries = nodes
+
+
+def _annotations(annotations) -> Iterable[dict]:
+    if hasattr(annotations, 'annotations_as_json'):
+        return annotations.annotations_as_json()
+    return annotations
@@ -0,0 +1,124 @@
+import asyncio
+import time
+from collections import deque
+from threading import Condition
+from typing import Iterable
+
+
+class AdaptiveLimiter:
+    """
+    An AIMD (additive increase, multiplicative decrease) limit on the number of requests in flight, shared by all
+    threads using the same Transport, and by the tasks of an AsyncTransport (which waits with acquire_async).
+    After every `limit` successful requests the limit grows by one, as long as the p95 latency of the recent requests
+    stays within latency_tolerance times the baseline p95. On a rising p95, an overload status (429, 503) or a
+    connection error, the limit is multiplied by decrease_factor, at most once per round trip.
+    """
+
+    def __init__(self, initial_limit: int = 4, min_limit: int = 1, max_limit: int = 64,
+                 decrease_factor: float = 0.5, latency_tolerance: float = 1.5, window: int = 100,
+                 overload_statuses: Iterable[int] = (429, 503)):
+        """
+        :param initial_limit: The number of requests in flight to start with
+        :type initial_limit: int
+        :param min_limit: The lowest limit
+        :type min_limit: int
+        :param max_limit: The highest limit; use this as the number of threads of bulk operations
+        :type max_limit: int
+        :param decrease_factor: The factor to multiply the limit with on overload
+        :type decrease_factor: float
+        :param latency_tolerance: How much the p95 latency may exceed the baseline before it counts as overload
+        :type latency_tolerance: float
+        :param window: The number of recent request latencies to compute the p95 over
+        :type window: int
+        :param overload_statuses: The response status codes that signal overload
+        :type overload_statuses: Iterable[int]
+        """
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.overload_statuses = set(overload_statuses)
+        self.in_flight = 0
+        self.baseline = None
+        self._latencies = deque(maxlen=window)
+        self._successes = 0
+        self._last_decrease = 0.0
+        self._condition = Condition()
+        self._async_waiters = []
+
+    def __str__(self):
+        return f"AdaptiveLimiter:\n  limit = {int(self.limit)}\n  in_flight = {self.in_flight}\n  baseline = {self.baseline}"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def acquire(self) -> float:
+        """Wait until another request may be sent; returns the start time to pass to release"""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+        return time.monotonic()
+
+    async def acquire_async(self) -> float:
+        """The asyncio counterpart of acquire, which waits without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return time.monotonic()
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            await waiter
+
+    def release(self, started: float, status_code: int = None):
+        """
+        Record the outcome of a request
+
+        :param started: The start time returned by acquire
+        :type started: float
+        :param status_code: The response status code, or None for a connection error or timeout
+        :type status_code: int
+        """
+        latency = time.monotonic() - started
+        with self._condition:
+            self.in_flight -= 1
+            if status_code is None or status_code in self.overload_statuses:
+                self.__decrease(started)
+            else:
+                self._latencies.append(latency)
+                self._successes += 1
+                if self._successes >= int(self.limit):
+                    self._successes = 0
+                    self.__adjust(started)
+            self._condition.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            # release may be called from another thread than the one running the loop of the waiter
+            loop.call_soon_threadsafe(_wake, waiter)
+
+    def __adjust(self, started: float):
+        if len(self._latencies) < min(10, self._latencies.maxlen):
+            self.limit = min(self.max_limit, self.limit + 1)
+            return
+        latencies = sorted(self._latencies)
+        p95 = latencies[int(0.95 * (len(latencies) - 1))]
+        # the baseline follows the p95 down at once, and up slowly, so a permanently slower server is accepted
+        self.baseline = p95 if self.baseline is None else min(p95, self.baseline * 1.05)
+        if p95 > self.baseline * self.latency_tolerance:
+            self.__decrease(started)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1)
+
+    def __decrease(self, started: float):
+        # requests sent before the previous decrease report on the old limit, so they don't decrease it again
+        if started > self._last_decrease:
+            self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+            self._last_decrease = time.monotonic()
+
+
+def _wake(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
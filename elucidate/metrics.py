@@ -0,0 +1,210 @@
+import bisect
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Callable, Iterable
+
+try:
+    from opentelemetry import trace
+except ImportError:  # pragma: no cover
+    trace = None
+
+# the client method (or 'annotation_page') the current request is made for, set by the client when metrics are enabled
+current_endpoint = ContextVar('elucidate_endpoint', default=None)
+
+default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+@contextmanager
+def endpoint_context(endpoint: str):
+    """Label the requests made in this block (in this thread or task) with the given endpoint"""
+    token = current_endpoint.set(endpoint)
+    try:
+        yield
+    finally:
+        current_endpoint.reset(token)
+
+
+def calling_endpoint() -> str:
+    """The name of the public method that (maybe through private helpers) called the function calling this"""
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_code.co_name[0] in '_<':
+        frame = frame.f_back
+    return frame.f_code.co_name if frame is not None else 'other'
+
+
+class RequestEvent:
+    """
+    One request as seen by the caller of the transport: retries are included in its duration.
+    A status_code of None means the request failed with a connection error or a timeout.
+    """
+
+    def __init__(self, endpoint: str, method: str, url: str):
+        self.endpoint = endpoint
+        self.method = method
+        self.url = url
+        self.status_code = None
+        self.start_time = time.time()
+        self.seconds = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.retries = 0
+        self.from_cache = False
+
+    def __str__(self):
+        return f"RequestEvent:\n  endpoint = {self.endpoint}\n  {self.method} {self.url}\n  status_code = " \
+               f"{self.status_code}\n  seconds = {self.seconds:.4f}\n  retries = {self.retries}"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+def request_bytes(kwargs: dict) -> int:
+    data = kwargs.get('data', kwargs.get('content'))
+    return len(data) if isinstance(data, (bytes, str)) else 0
+
+
+def response_bytes(response, kwargs: dict) -> int:
+    # the body of a streamed response is not read here, so count its Content-Length instead
+    if kwargs.get('stream'):
+        return int(response.headers.get('content-length', 0))
+    return len(response.content)
+
+
+class Histogram:
+    def __init__(self, buckets: Iterable[float] = default_buckets):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self) -> list:
+        """The number of observations <= each bucket bound, ending with the total for +Inf"""
+        counts = []
+        total = 0
+        for count in self.counts:
+            total += count
+            counts.append(total)
+        return counts
+
+
+class Metrics:
+    """
+    Per-endpoint request counters (by method and status code), latency histograms, byte counts, retries and search cache
+    hits of a Transport or AsyncTransport. Every RequestEvent is also passed to the exporters, which are plain callables,
+    such as an OpenTelemetryExporter or print.
+    Without metrics on the transport, requests are not measured at all.
+    """
+
+    def __init__(self, exporters: Iterable[Callable[[RequestEvent], None]] = (),
+                 buckets: Iterable[float] = default_buckets):
+        """
+        :param exporters: Called with every RequestEvent, after it is counted
+        :type exporters: Iterable[Callable[[RequestEvent], None]]
+        :param buckets: The upper bounds (in seconds) of the latency histogram buckets
+        :type buckets: Iterable[float]
+        """
+        self.exporters = list(exporters)
+        self.buckets = tuple(sorted(buckets))
+        self.requests = defaultdict(int)
+        self.latencies = defaultdict(lambda: Histogram(self.buckets))
+        self.request_bytes = defaultdict(int)
+        self.response_bytes = defaultdict(int)
+        self.retries = defaultdict(int)
+        self.cache_hits = defaultdict(int)
+        self._lock = Lock()
+
+    def __str__(self):
+        return f"Metrics:\n  requests = {sum(self.requests.values())}\n  endpoints = {len(self.latencies)}"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def start(self, method: str, url: str) -> RequestEvent:
+        return RequestEvent(current_endpoint.get() or 'other', method, url)
+
+    def record(self, event: RequestEvent):
+        endpoint = event.endpoint
+        status = str(event.status_code) if event.status_code is not None else 'error'
+        with self._lock:
+            self.requests[(endpoint, event.method, status)] += 1
+            self.latencies[endpoint].observe(event.seconds)
+            self.request_bytes[endpoint] += event.request_bytes
+            self.response_bytes[endpoint] += event.response_bytes
+            self.retries[endpoint] += event.retries
+            if event.from_cache:
+                self.cache_hits[endpoint] += 1
+        for exporter in self.exporters:
+            exporter(event)
+
+    def reset(self):
+        with self._lock:
+            for counter in (self.requests, self.latencies, self.request_bytes, self.response_bytes, self.retries,
+                            self.cache_hits):
+                counter.clear()
+
+    def prometheus_text(self) -> str:
+        """The metrics in the Prometheus text exposition format"""
+        with self._lock:
+            lines = ['# HELP elucidate_requests_total Requests to the elucidate server.',
+                     '# TYPE elucidate_requests_total counter']
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'elucidate_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} '
+                             f'{count}')
+            lines += ['# HELP elucidate_request_duration_seconds Request latency, including retries.',
+                      '# TYPE elucidate_request_duration_seconds histogram']
+            for endpoint, histogram in sorted(self.latencies.items()):
+                bounds = [str(b) for b in histogram.buckets] + ['+Inf']
+                for bound, count in zip(bounds, histogram.cumulative_counts()):
+                    lines.append(f'elucidate_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} '
+                                 f'{count}')
+                lines.append(f'elucidate_request_duration_seconds_sum{{endpoint="{endpoint}"}} {histogram.sum}')
+                lines.append(f'elucidate_request_duration_seconds_count{{endpoint="{endpoint}"}} {histogram.count}')
+            for name, help_text, counter in (
+                    ('elucidate_request_bytes_total', 'Bytes sent in request bodies.', self.request_bytes),
+                    ('elucidate_response_bytes_total', 'Bytes received in response bodies.', self.response_bytes),
+                    ('elucidate_retries_total', 'Retried requests.', self.retries),
+                    ('elucidate_cache_hits_total', 'Requests served from the search cache.', self.cache_hits)):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                for endpoint, value in sorted(counter.items()):
+                    lines.append(f'{name}{{endpoint="{endpoint}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class OpenTelemetryExporter:
+    """
+    Report every request as an OpenTelemetry span named elucidate.<endpoint>.
+    This requires the optional opentelemetry-api dependency; the spans go to the globally configured tracer provider
+    unless a tracer is given.
+    """
+
+    def __init__(self, tracer=None):
+        if trace is None:
+            raise ImportError("OpenTelemetryExporter requires opentelemetry-api, install it with: "
+                              "pip install elucidate-client[otel]")
+        self.tracer = tracer if tracer else trace.get_tracer('elucidate')
+
+    def __call__(self, event: RequestEvent):
+        start = int(event.start_time * 1e9)
+        span = self.tracer.start_span(f'elucidate.{event.endpoint}', start_time=start, kind=trace.SpanKind.CLIENT,
+                                      attributes={
+                                          'http.method': event.method,
+                                          'http.url': event.url,
+                                          'http.request_content_length': event.request_bytes,
+                                          'http.response_content_length': event.response_bytes,
+                                          'elucidate.retries': event.retries,
+                                          'elucidate.from_cache': event.from_cache
+                                      })
+        if event.status_code is not None:
+            span.set_attribute('http.status_code', event.status_code)
+        if event.status_code is None or event.status_code >= 500:
+            span.set_status(trace.Status(trace.StatusCode.ERROR))
+        span.end(end_time=start + int(event.seconds * 1e9))
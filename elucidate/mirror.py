@@ -0,0 +1,140 @@
+import hashlib
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, Optional
+
+from elucidate.client import ElucidateClient
+from elucidate.model import ContainerIdentifier, ElucidateFailure, ElucidateSuccess
+
+watermark_format = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+class AnnotationMirror:
+    """
+    A local SQLite replica of the annotations in a number of containers, kept up to date incrementally.
+    The first sync reads the containers completely; later syncs only fetch the annotations created or modified since
+    the previous sync (minus an overlap, to allow for clock skew between client and server), and only store those that
+    actually changed.
+    Deleted annotations are not reported by the server's search, so they are not removed from the mirror.
+    """
+
+    def __init__(self, client: ElucidateClient, path: str, container_uuids: Iterable[str],
+                 overlap: timedelta = timedelta(minutes=5)):
+        """
+        :param client: The client to read the annotations with
+        :type client: ElucidateClient
+        :param path: The path of the SQLite database file
+        :type path: str
+        :param container_uuids: The uuids of the containers to mirror
+        :type container_uuids: Iterable[str]
+        :param overlap: How far before the previous sync to start searching for changes
+        :type overlap: timedelta
+        """
+        self.client = client
+        self.path = path
+        self.container_uuids = set(container_uuids)
+        self.overlap = overlap
+        self._connection = sqlite3.connect(path)
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS annotations (id TEXT PRIMARY KEY, container_uuid TEXT, etag TEXT, '
+                'json TEXT)')
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS annotations_container_uuid ON annotations (container_uuid)')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)')
+
+    def __str__(self):
+        return f"AnnotationMirror:\n  path = {self.path}\n  containers = {sorted(self.container_uuids)}" \
+               f"\n  watermark = {self.watermark}"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def watermark(self) -> Optional[datetime]:
+        """The (UTC) start time of the last successful sync"""
+        row = self._connection.execute("SELECT value FROM state WHERE key = 'watermark'").fetchone()
+        return datetime.strptime(row[0], watermark_format) if row else None
+
+    def sync(self) -> int:
+        """
+        Update the mirror with the annotations created or modified since the last sync, or with all annotations of the
+        containers on the first sync
+
+        :return: The number of annotations that were added or updated
+        :rtype: int
+        """
+        started = datetime.utcnow()
+        watermark = self.watermark
+        if watermark is None:
+            changed = self.__upsert(self.__all_annotations())
+        else:
+            since = watermark - self.overlap
+            changed = self.__upsert(self.__changed_annotations(since))
+        with self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO state VALUES ('watermark', ?)",
+                                     (started.strftime(watermark_format),))
+        return changed
+
+    def get(self, annotation_id: str) -> Optional[dict]:
+        """The mirrored annotation with the given id (url), or None"""
+        row = self._connection.execute('SELECT json FROM annotations WHERE id = ?', (annotation_id,)).fetchone()
+        return self.client.codec.loads(row[0]) if row else None
+
+    def annotations(self, container_uuid: str = None) -> Iterator[dict]:
+        """The mirrored annotations, of all containers or of the container with the given uuid"""
+        if container_uuid:
+            rows = self._connection.execute('SELECT json FROM annotations WHERE container_uuid = ?', (container_uuid,))
+        else:
+            rows = self._connection.execute('SELECT json FROM annotations')
+        for row in rows:
+            yield self.client.codec.loads(row[0])
+
+    def close(self):
+        self._connection.close()
+
+    def __all_annotations(self) -> Iterator[dict]:
+        for container_uuid in sorted(self.container_uuids):
+            url = f'{self.client.base_uri}/w3c/{container_uuid}/'
+            collection = _result(self.client.read_container(ContainerIdentifier(url)))
+            yield from collection.annotations_as_json(prefetch=1)
+
+    def __changed_annotations(self, since: datetime) -> Iterator[dict]:
+        for search in (self.client.search_by_annotation_created_since,
+                       self.client.search_by_annotation_modified_since):
+            collection = _result(search(since))
+            yield from collection.annotations_as_json(prefetch=1)
+
+    def __upsert(self, annotations: Iterable[dict]) -> int:
+        changed = 0
+        with self._connection:
+            for annotation in annotations:
+                annotation_id = annotation['id']
+                container_uuid = annotation_id.split('/')[-2]
+                if container_uuid not in self.container_uuids:
+                    continue
+                annotation_json = self.client.codec.dumps(annotation, sort_keys=True)
+                # the search results carry no ETags, so a digest of the annotation takes their place
+                etag = hashlib.sha1(annotation_json).hexdigest()
+                row = self._connection.execute('SELECT etag FROM annotations WHERE id = ?', (annotation_id,)).fetchone()
+                if row and row[0] == etag:
+                    continue
+                self._connection.execute('INSERT OR REPLACE INTO annotations VALUES (?, ?, ?, ?)',
+                                         (annotation_id, container_uuid, etag, annotation_json.decode('utf-8')))
+                changed += 1
+        return changed
+
+
+def _result(response):
+    if isinstance(response, ElucidateFailure):
+        raise Exception(f'{response.response.request.method} {response.response.request.url} returned '
+                        f'{response.response.status_code}')
+    if isinstance(response, ElucidateSuccess):
+        return response.result
+    return response
@@ -1,8 +1,23 @@
-from typing import Any
+import asyncio
+import math
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Callable, List, Optional, Iterator, Tuple
 
 import requests
 from requests import Response
 
+try:
+    import ijson
+except ImportError:  # pragma: no cover
+    ijson = None
+
+from elucidate.codec import JsonCodec
+from elucidate.executor import bounded_map, max_workers_for
+from elucidate.metrics import endpoint_context
+from elucidate.profiling import trace_phase
+
 
 class ElucidateResponse:
     def __init__(self, response: Response):
@@ -54,37 +69,260 @@ class AnnotationIdentifier:
 
 
 class AnnotationCollection:
-    def __init__(self, total, id: str, first_page: dict, label: str):
+    def __init__(self, total, id: str, first_page: dict, label: str, transport=None, codec: JsonCodec = None):
         self.total = total
         self.id = id
         self.first_page = first_page
         self.label = label
+        self.transport = transport
+        self.codec = codec if codec else JsonCodec()
         self.page = 0
         self.url_extend_character = self._url_extend_character()
 
     def reset(self):
         self.page = 0
 
-    def annotations_as_json(self):
+    def annotations_as_json(self, prefetch: int = 0, stream: bool = False):
+        """
+        Iterate over the annotations in this collection, fetching the next pages when needed
+
+        :param prefetch: The number of pages to fetch ahead in a background thread while the current page is consumed,
+            0 to only fetch a page when it is needed
+        :type prefetch: int
+        :param stream: Decode the annotations one by one while a page is being downloaded, instead of decoding the
+            whole page with the codec. This keeps less of a page in memory, but takes more cpu time; it requires the
+            optional ijson dependency, and does not apply when prefetching
+        :type stream: bool
+        :return: The annotations, in order
+        """
+        if stream and ijson is None:
+            raise ImportError("streaming pages requires ijson, install it with: "
+                              "pip install elucidate-client[streaming]")
         if 'items' not in self.first_page:
-            raise StopIteration
-        annotations = self.first_page['items']
-        annotations_yielded = 0
+            return
+        if prefetch > 0:
+            yield from self._prefetching_annotations_as_json(prefetch)
+            return
+        yield from self.first_page['items']
+        annotations_yielded = len(self.first_page['items'])
         while annotations_yielded < self.total:
-            yield from annotations
-            annotations_yielded += len(annotations)
-            if self.total > annotations_yielded:
-                self.page += 1
-                next_page_url = f"{self.id}{self.url_extend_character}page={self.page}"
-                result = requests.get(url=next_page_url)
-                json = result.json()
-                if 'items' in json:
-                    annotations = result.json()['items']
-                else:
-                    raise StopIteration
+            self.page += 1
+            page_size = 0
+            for annotation in self._stream_page(self.page) if stream else self._fetch_page(self.page) or []:
+                yield annotation
+                page_size += 1
+            if page_size == 0:
+                return
+            annotations_yielded += page_size
+
+    def _prefetching_annotations_as_json(self, prefetch: int):
+        annotations = self.first_page['items']
+        yield from annotations
+        page_size = len(annotations)
+        if page_size == 0:
+            return
+        last_page = self.page + math.ceil((self.total - page_size) / page_size)
+        pages = iter(range(self.page + 1, last_page + 1))
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            # at most `prefetch` pages are buffered or in flight at any time
+            pending = deque(executor.submit(self._fetch_page, page) for page in islice(pages, prefetch))
+            try:
+                while pending:
+                    annotations = pending.popleft().result()
+                    self.page += 1
+                    if annotations is None:
+                        return
+                    for page in islice(pages, 1):
+                        pending.append(executor.submit(self._fetch_page, page))
+                    yield from annotations
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def pages_as_json(self, max_workers: int = None, ordered: bool = True, processes: int = 0,
+                      transform: Callable[[List[dict]], Any] = None) -> Iterator[Any]:
+        """
+        Iterate over the pages of annotations in this collection, fetching the remaining pages concurrently.
+        The number of pages follows from the total and the size of the first page.
+        With processes, the pages are still fetched in this process, but their json is decoded (and transformed) in a
+        pool of worker processes, so the cpu work of large pages is not limited to one core by the GIL.
+
+        :param max_workers: The maximum number of pages fetched at the same time; when omitted, the max_limit of the
+            transport's AdaptiveLimiter, or 8 without a limiter
+        :type max_workers: int
+        :param ordered: Yield the pages in order, or as soon as they are fetched; with processes, the pages are always
+            yielded in order
+        :type ordered: bool
+        :param processes: The number of worker processes to decode the pages in, 0 to decode them in this process
+        :type processes: int
+        :param transform: Applied to the list of annotations of every page (in the worker processes, if any), to yield
+            its result instead of the list; with processes, it must be picklable, like a module level function
+        :type transform: Callable[[List[dict]], Any]
+        :return: The lists of annotations per page (or what transform made of them), starting with the first page
+        """
+        annotations = self.first_page.get('items')
+        if not annotations:
+            return
+        if processes > 0:
+            yield from self._pages_in_processes(max_workers, processes, transform)
+            return
+        yield transform(annotations) if transform else annotations
+        page_size = len(annotations)
+        last_page = math.ceil(self.total / page_size) - 1
+        for annotations in bounded_map(self._fetch_page, range(1, last_page + 1),
+                                       max_workers=max_workers_for(self.transport, max_workers), ordered=ordered):
+            if annotations:
+                yield transform(annotations) if transform else annotations
+
+    def _pages_in_processes(self, max_workers: Optional[int], processes: int,
+                            transform: Optional[Callable[[List[dict]], Any]]) -> Iterator[Any]:
+        annotations = self.first_page['items']
+        last_page = math.ceil(self.total / len(annotations)) - 1
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            # the first page is already decoded; the others are decoded by the workers, in the order they were fetched
+            pending = deque([executor.submit(_transform_page, transform, annotations)])
+            try:
+                for content in bounded_map(self._fetch_page_content, range(1, last_page + 1),
+                                           max_workers=max_workers_for(self.transport, max_workers)):
+                    pending.append(executor.submit(_decode_page, self.codec.name, transform, content))
+                    # keep the workers busy, without buffering more pages than they can handle
+                    while len(pending) > 2 * processes:
+                        yield from _page_result(pending.popleft())
+                while pending:
+                    yield from _page_result(pending.popleft())
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _stream_page(self, page: int) -> Iterator[dict]:
+        # the annotations are decoded one by one while the page is being downloaded, unless it came from a cache
+        with self._page_instrumentation():
+            response = self._http().get(url=self._page_url(page), stream=True)
+        with response as result:
+            if result.raw is not None:
+                result.raw.decode_content = True
+                yield from ijson.items(result.raw, 'items.item', use_float=True)
+            else:
+                yield from self.codec.loads(result.content).get('items', [])
+
+    def _page_url(self, page: int) -> str:
+        return f"{self.id}{self.url_extend_character}page={page}"
+
+    def _fetch_page(self, page: int) -> Optional[List[dict]]:
+        with self._page_instrumentation():
+            result = self._http().get(url=self._page_url(page))
+            with trace_phase('decode'):
+                return self.codec.loads(result.content).get('items')
+
+    def _fetch_page_content(self, page: int) -> bytes:
+        with self._page_instrumentation():
+            return self._http().get(url=self._page_url(page)).content
+
+    def _page_instrumentation(self):
+        # label the page requests for the metrics, and trace them when the transport has a tracer
+        tracer = getattr(self.transport, 'tracer', None)
+        return tracer.span('annotation_page') if tracer is not None else endpoint_context('annotation_page')
+
+    def _http(self):
+        # page through the pooled transport of the client, when we have one
+        return self.transport if self.transport else requests
 
     def _url_extend_character(self):
         if '?' in self.id:
             return '&'
         else:
             return '?'
+
+
+def _transform_page(transform: Optional[Callable[[List[dict]], Any]], annotations: List[dict]) -> Tuple[bool, Any]:
+    return True, transform(annotations) if transform else annotations
+
+
+def _decode_page(codec_name: str, transform: Optional[Callable[[List[dict]], Any]],
+                 content: bytes) -> Tuple[bool, Any]:
+    # runs in a worker process; empty pages are skipped, like pages_as_json does without processes
+    annotations = JsonCodec(codec_name).loads(content).get('items')
+    if not annotations:
+        return False, None
+    return _transform_page(transform, annotations)
+
+
+def _page_result(future) -> Iterator[Any]:
+    has_annotations, result = future.result()
+    if has_annotations:
+        yield result
+
+
+class AsyncAnnotationCollection(AnnotationCollection):
+    """
+    An AnnotationCollection that fetches its pages through an AsyncTransport, without blocking the event loop.
+    Iterate over the annotations with `async for annotation in collection`, or over the pages with
+    `async for page in collection.pages_as_json()`.
+    """
+
+    def __aiter__(self):
+        return self.annotations_as_json()
+
+    async def annotations_as_json(self):
+        if 'items' not in self.first_page:
+            return
+        for annotation in self.first_page['items']:
+            yield annotation
+        annotations_yielded = len(self.first_page['items'])
+        while annotations_yielded < self.total:
+            self.page += 1
+            annotations = await self._fetch_page(self.page)
+            if not annotations:
+                return
+            for annotation in annotations:
+                yield annotation
+            annotations_yielded += len(annotations)
+
+    async def pages_as_json(self, max_workers: int = None, ordered: bool = True,
+                            transform: Callable[[List[dict]], Any] = None):
+        """
+        Iterate (with async for) over the pages of annotations in this collection, fetching the remaining pages
+        concurrently. Unlike with an AnnotationCollection, the pages can not be decoded in worker processes.
+
+        :param max_workers: The maximum number of pages fetched at the same time; when omitted, the max_limit of the
+            transport's AdaptiveLimiter, or 8 without a limiter
+        :type max_workers: int
+        :param ordered: Yield the pages in order, or as soon as they are fetched
+        :type ordered: bool
+        :param transform: Applied to the list of annotations of every page, to yield its result instead of the list
+        :type transform: Callable[[List[dict]], Any]
+        :return: The lists of annotations per page (or what transform made of them), starting with the first page
+        """
+        annotations = self.first_page.get('items')
+        if not annotations:
+            return
+        yield transform(annotations) if transform else annotations
+        last_page = math.ceil(self.total / len(annotations)) - 1
+        pages = iter(range(1, last_page + 1))
+        pending = deque(asyncio.ensure_future(self._fetch_page(page))
+                        for page in islice(pages, max_workers_for(self.transport, max_workers)))
+        try:
+            while pending:
+                annotations = await self._next_fetched(pending, ordered)
+                for page in islice(pages, 1):
+                    pending.append(asyncio.ensure_future(self._fetch_page(page)))
+                if annotations:
+                    yield transform(annotations) if transform else annotations
+        finally:
+            for task in pending:
+                task.cancel()
+
+    @staticmethod
+    async def _next_fetched(pending: deque, ordered: bool) -> Optional[List[dict]]:
+        if ordered:
+            return await pending.popleft()
+        done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        task = done.pop()
+        pending.remove(task)
+        return task.result()
+
+    async def _fetch_page(self, page: int) -> Optional[List[dict]]:
+        with self._page_instrumentation():
+            result = await self.transport.get(url=self._page_url(page))
+            with trace_phase('decode'):
+                return self.codec.loads(result.content).get('items')
@@ -0,0 +1,220 @@
+import gzip
+import io
+import os
+import time
+from functools import partial
+from typing import Any, Iterable, Callable, BinaryIO, Iterator, Tuple
+
+from elucidate.codec import JsonCodec
+from elucidate.executor import bounded_map, default_max_workers
+from elucidate.model import ElucidateFailure
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+compressions = (None, 'gzip', 'zstd')
+
+
+class Progress:
+    def __init__(self, count: int, total: int, seconds: float, failed: int = 0):
+        self.count = count
+        self.total = total
+        self.seconds = seconds
+        self.failed = failed
+
+    @property
+    def rate(self) -> float:
+        """The number of annotations per second"""
+        return self.count / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self):
+        return f"Progress:\n  count = {self.count}/{self.total}\n  failed = {self.failed}\n  seconds = {self.seconds:.1f}" \
+               f"\n  rate = {self.rate:.1f}/s"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+def write_ndjson(annotations: Iterable[dict], fileobj: BinaryIO, compression: str = None, total: int = None,
+                 progress: Callable[[Progress], None] = None, progress_interval: float = 1.0,
+                 codec: JsonCodec = None) -> Progress:
+    """
+    Write the annotations to the (binary) fileobj, one json annotation per line
+
+    :param annotations: The annotations to write, consumed lazily
+    :type annotations: Iterable[dict]
+    :param fileobj: The binary file object to write to; it is not closed
+    :type fileobj: BinaryIO
+    :param compression: None, 'gzip' or 'zstd' (this requires the optional zstandard dependency)
+    :type compression: str
+    :param total: The expected number of annotations, for the progress reports
+    :type total: int
+    :param progress: Called with the Progress every progress_interval seconds, and when done
+    :type progress: Callable[[Progress], None]
+    :param progress_interval: The number of seconds between progress reports
+    :type progress_interval: float
+    :param codec: The json encoder, the fastest installed one when omitted
+    :type codec: JsonCodec
+    :return: The final Progress
+    :rtype: Progress
+    """
+    dumps = (codec if codec else JsonCodec()).dumps
+    start = time.monotonic()
+    next_report = start + progress_interval
+    count = 0
+    with _compressed_writer(fileobj, compression) as out:
+        for annotation in annotations:
+            out.write(dumps(annotation))
+            out.write(b'\n')
+            count += 1
+            if progress and time.monotonic() >= next_report:
+                progress(Progress(count, total, time.monotonic() - start))
+                next_report += progress_interval
+    result = Progress(count, total, time.monotonic() - start)
+    if progress:
+        progress(result)
+    return result
+
+
+def import_ndjson(path: str, parse: Callable[[bytes], Any], create: Callable[[Any], Any], checkpoint_path: str = None,
+                  max_workers: int = default_max_workers, checkpoint_interval: int = 1000,
+                  on_failure: Callable[[int, Any], None] = None) -> Progress:
+    """
+    Create something from every non-empty line of the ndjson file, with several creates in flight.
+    The offset after the last line that was handled is stored in a checkpoint file, so an interrupted import
+    continues where it left off. The checkpoint is not advanced while none of the lines could be parsed, as that
+    means the file was not read correctly.
+
+    :param path: The path of the ndjson file, as with read_ndjson_lines
+    :type path: str
+    :param parse: Turns a line into the argument of create; an Exception raised counts as a failure
+    :type parse: Callable[[bytes], Any]
+    :param create: Creates what the parsed line describes; an Exception raised or an ElucidateFailure returned
+        counts as a failure
+    :type create: Callable[[Any], Any]
+    :param checkpoint_path: The path of the checkpoint file, path + '.checkpoint' when omitted
+    :type checkpoint_path: str
+    :param max_workers: The maximum number of creates in flight
+    :type max_workers: int
+    :param checkpoint_interval: The number of lines between checkpoint updates
+    :type checkpoint_interval: int
+    :param on_failure: Called with the line number (in the file, counted from 1) and the Exception or
+        ElucidateFailure of every line that failed
+    :type on_failure: Callable[[int, Any], None]
+    :return: The number of lines handled, and how many of those failed
+    :rtype: Progress
+    """
+    if not checkpoint_path:
+        checkpoint_path = f"{path}.checkpoint"
+    start = time.monotonic()
+    lines = read_ndjson_lines(path, *read_checkpoint(checkpoint_path))
+    count = failed = 0
+    position = None
+    any_parsed = False
+    # the results are ordered, so every line before the checkpoint offset has been handled
+    for line_number, offset, result, parsed in bounded_map(partial(_import_line, parse, create), lines,
+                                                           max_workers=max_workers):
+        count += 1
+        position = (offset, line_number)
+        any_parsed = any_parsed or parsed
+        if isinstance(result, (Exception, ElucidateFailure)):
+            failed += 1
+            if on_failure:
+                on_failure(line_number, result)
+        if any_parsed and count % checkpoint_interval == 0:
+            write_checkpoint(checkpoint_path, *position)
+    if any_parsed and position is not None:
+        write_checkpoint(checkpoint_path, *position)
+    return Progress(count, count, time.monotonic() - start, failed)
+
+
+def read_ndjson_lines(path: str, offset: int = 0, line_number: int = 0) -> Iterator[Tuple[int, int, bytes]]:
+    """
+    Read the non-empty lines of the (optionally gzip- or zstd-compressed) ndjson file, starting at offset
+
+    :param path: The path of the ndjson file; a path ending in .gz is read as gzip-compressed, one ending in .zst
+        as zstd-compressed (this requires the optional zstandard dependency)
+    :type path: str
+    :param offset: The (uncompressed) offset to start reading at
+    :type offset: int
+    :param line_number: The number of lines before offset
+    :type line_number: int
+    :return: Per line, its line number (counted from 1), the (uncompressed) offset after the line, and the line
+    :rtype: Iterator[Tuple[int, int, bytes]]
+    """
+    with _compressed_reader(path, offset) as f:
+        for line in f:
+            offset += len(line)
+            line_number += 1
+            if line.strip():
+                yield line_number, offset, line
+
+
+def read_checkpoint(path: str) -> Tuple[int, int]:
+    """The offset and line number stored in the checkpoint file, or (0, 0) when there is no checkpoint file"""
+    if not os.path.exists(path):
+        return 0, 0
+    with open(path) as f:
+        offset, _, line_number = f.read().strip().partition(' ')
+    return int(offset or 0), int(line_number or 0)
+
+
+def write_checkpoint(path: str, offset: int, line_number: int = 0):
+    """Store the offset and the line number it is at in the checkpoint file, replacing it atomically"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(f"{offset} {line_number}")
+    os.replace(tmp_path, path)
+
+
+def _import_line(parse: Callable[[bytes], Any], create: Callable[[Any], Any], line: Tuple[int, int, bytes]):
+    # (line number, offset, result, whether the line could be parsed)
+    line_number, offset, text = line
+    try:
+        parsed = parse(text)
+    except Exception as e:
+        return line_number, offset, e, False
+    try:
+        return line_number, offset, create(parsed), True
+    except Exception as e:
+        return line_number, offset, e, True
+
+
+def _compressed_writer(fileobj: BinaryIO, compression: str):
+    if compression not in compressions:
+        raise ValueError(f"unknown compression {compression}, expected one of {compressions}")
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=fileobj, mode='wb')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImportError("zstd compression requires zstandard, install it with: pip install zstandard")
+        return zstandard.ZstdCompressor().stream_writer(fileobj, closefd=False)
+    return _Unclosed(fileobj)
+
+
+def _compressed_reader(path: str, offset: int) -> BinaryIO:
+    # the file, positioned at the (uncompressed) offset
+    if path.endswith(('.zst', '.zstd')):
+        if zstandard is None:
+            raise ImportError("zstd decompression requires zstandard, install it with: pip install zstandard")
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        # the decompression reader only seeks forward, by decompressing up to the offset
+        reader.seek(offset)
+        return io.BufferedReader(reader)
+    f = gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+    f.seek(offset)
+    return f
+
+
+class _Unclosed:
+    # leaves the closing of the uncompressed fileobj to the caller
+    def __init__(self, fileobj: BinaryIO):
+        self.write = fileobj.write
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
@@ -0,0 +1,221 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Dict, TextIO
+
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from elucidate.metrics import endpoint_context
+
+# the RequestSpan of the request being made in this thread or task, only set while a RequestTracer is tracing
+current_span = ContextVar('elucidate_span', default=None)
+
+
+class RequestSpan:
+    """
+    The timing of one request, from the client method (or page fetch) that made it, to the result it returned.
+    Times are time.perf_counter() values; phases are (name, start, seconds) tuples, named connect, ttfb and download
+    (measured by the transport), and decode and construct (measured by the client).
+    """
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.thread_id = threading.get_ident()
+        self.start = time.perf_counter()
+        self.seconds = 0.0
+        self.phases = []
+
+    def __str__(self):
+        return f"RequestSpan:\n  endpoint = {self.endpoint}\n  seconds = {self.seconds:.4f}\n  phases = " \
+               f"{', '.join(f'{name}={seconds:.4f}' for name, seconds in self.phase_totals().items())}"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def add_phase(self, name: str, start: float, seconds: float):
+        self.phases.append((name, start, seconds))
+
+    def add_response_phases(self, start: float, end: float, elapsed: float, streamed: bool):
+        """
+        Split one attempt of the request into connect, ttfb and download phases
+
+        :param start: When the attempt started
+        :type start: float
+        :param end: When the response was returned by requests
+        :type end: float
+        :param elapsed: The time requests measured from sending the request until the response headers were parsed
+        :type elapsed: float
+        :param streamed: Whether the body is still to be read (and so not part of the download phase)
+        :type streamed: bool
+        """
+        connect = sum(seconds for name, s, seconds in self.phases if name == 'connect' and s >= start)
+        download = 0.0 if streamed else max(0.0, end - start - elapsed)
+        ttfb_end = end - download
+        self.add_phase('ttfb', ttfb_end - max(0.0, elapsed - connect), max(0.0, elapsed - connect))
+        if download:
+            self.add_phase('download', ttfb_end, download)
+
+    def phase_totals(self) -> Dict[str, float]:
+        totals = defaultdict(float)
+        for name, _, seconds in self.phases:
+            totals[name] += seconds
+        if 'construct' in totals:
+            # construction includes the decoding of the json it is constructed from
+            totals['construct'] = max(0.0, totals['construct'] - totals.get('decode', 0.0))
+        return dict(totals)
+
+
+@contextmanager
+def trace_phase(name: str):
+    """Add the time spent in this block as a phase of the current span, if any"""
+    span = current_span.get()
+    if span is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        span.add_phase(name, start, time.perf_counter() - start)
+
+
+class RequestTracer:
+    """
+    Records the timing of every request made through the Transport or AsyncTransport it is given to: the connect time,
+    the time to first byte, the body download, the json decoding and the construction of the client's result.
+    Write them as a Chrome trace (for chrome://tracing or https://ui.perfetto.dev) or as folded stacks (for
+    flamegraph.pl or speedscope) to see whether slow jobs are bound by the server, the network or the client's parsing.
+    The pages of streamed paging (annotations_as_json(stream=True)) are decoded while downloading, so for those only
+    connect and ttfb are recorded.
+    """
+
+    def __init__(self, max_spans: int = 100000):
+        """
+        :param max_spans: The maximum number of spans to keep; later spans are counted in dropped
+        :type max_spans: int
+        """
+        self.max_spans = max_spans
+        self.spans = []
+        self.dropped = 0
+        self.origin = time.perf_counter()
+        self._lock = Lock()
+
+    def __str__(self):
+        return f"RequestTracer:\n  spans = {len(self.spans)}\n  dropped = {self.dropped}"
+
+    def __repr__(self):
+        return self.__str__()
+
+    @contextmanager
+    def span(self, endpoint: str):
+        """Trace the requests in this block as one span, labelled (also for the Metrics) with the given endpoint"""
+        span = RequestSpan(endpoint)
+        token = current_span.set(span)
+        try:
+            with endpoint_context(endpoint):
+                yield span
+        finally:
+            current_span.reset(token)
+            span.seconds = time.perf_counter() - span.start
+            with self._lock:
+                if len(self.spans) < self.max_spans:
+                    self.spans.append(span)
+                else:
+                    self.dropped += 1
+
+    def clear(self):
+        with self._lock:
+            self.spans = []
+            self.dropped = 0
+
+    def totals(self) -> Dict[str, Dict[str, float]]:
+        """The total seconds per endpoint, per phase, with 'other' for the time outside the phases"""
+        totals = defaultdict(lambda: defaultdict(float))
+        for span in list(self.spans):
+            phase_totals = span.phase_totals()
+            for name, seconds in phase_totals.items():
+                totals[span.endpoint][name] += seconds
+            totals[span.endpoint]['other'] += max(0.0, span.seconds - sum(phase_totals.values()))
+        return {endpoint: dict(phase_totals) for endpoint, phase_totals in totals.items()}
+
+    def write_chrome_trace(self, fileobj: TextIO):
+        """Write the spans as Chrome trace event json, one complete event per request and per phase"""
+        pid = os.getpid()
+        events = []
+        for span in list(self.spans):
+            events.append({'name': span.endpoint, 'cat': 'request', 'ph': 'X', 'pid': pid, 'tid': span.thread_id,
+                           'ts': self.__microseconds(span.start), 'dur': span.seconds * 1e6})
+            for name, start, seconds in span.phases:
+                events.append({'name': name, 'cat': 'phase', 'ph': 'X', 'pid': pid, 'tid': span.thread_id,
+                               'ts': self.__microseconds(start), 'dur': seconds * 1e6})
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fileobj)
+
+    def write_folded(self, fileobj: TextIO):
+        """Write the total time (in microseconds) per endpoint and phase as folded stacks"""
+        for endpoint, phase_totals in sorted(self.totals().items()):
+            for name, seconds in phase_totals.items():
+                # decoding the response is part of constructing the result from it
+                nested = name == 'decode' and 'construct' in phase_totals
+                stack = f"{endpoint};construct;decode" if nested else f"{endpoint};{name}"
+                fileobj.write(f"{stack} {round(seconds * 1e6)}\n")
+
+    def __microseconds(self, perf_counter: float) -> float:
+        return (perf_counter - self.origin) * 1e6
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        with trace_phase('connect'):
+            super().connect()
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        with trace_phase('connect'):
+            super().connect()
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+def time_connections(adapter):
+    """Make the connections of the given requests HTTPAdapter add their connect time to the current span"""
+    adapter.poolmanager.pool_classes_by_scheme = {'http': _TimedHTTPConnectionPool,
+                                                  'https': _TimedHTTPSConnectionPool}
+
+
+class HttpxTraceHook:
+    """The httpx 'trace' request extension, adding the connect, ttfb and download phases to the given span"""
+
+    def __init__(self, span: RequestSpan):
+        self.span = span
+        self.started = {}
+
+    async def __call__(self, event_name: str, info: dict):
+        *_, name, state = event_name.split('.')
+        now = time.perf_counter()
+        if state == 'started':
+            self.started[name] = now
+            return
+        start = self.started.get(name)
+        if state != 'complete' or start is None:
+            return
+        if name in ('connect_tcp', 'start_tls'):
+            self.span.add_phase('connect', start, now - start)
+        elif name == 'receive_response_headers':
+            # the time to first byte counts from sending the request
+            sent = self.started.get('send_request_headers', start)
+            self.span.add_phase('ttfb', sent, now - sent)
+        elif name == 'receive_response_body':
+            self.span.add_phase('download', start, now - start)
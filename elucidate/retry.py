@@ -0,0 +1,141 @@
+import random
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Iterable, Optional
+
+idempotent_methods = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while the circuit breaker is open"""
+
+
+class RetryPolicy:
+    """
+    When and how long to wait before retrying a request that failed with a connection error, a timeout, or one of the
+    retry_statuses.
+    Only idempotent requests are retried: GET, HEAD, OPTIONS, PUT and DELETE, and POST with a slug header, since
+    creating a resource with a given id twice does not create a duplicate.
+    The wait grows exponentially with full jitter, unless the server sends a Retry-After header.
+    """
+
+    def __init__(self, max_retries: int = 3, backoff_factor: float = 0.5, max_backoff: float = 60.0,
+                 retry_statuses: Iterable[int] = (429, 502, 503, 504)):
+        """
+        :param max_retries: The maximum number of retries per request
+        :type max_retries: int
+        :param backoff_factor: The (maximum) wait in seconds before the first retry, doubled for every next retry
+        :type backoff_factor: float
+        :param max_backoff: The maximum wait in seconds before a retry, also for Retry-After
+        :type max_backoff: float
+        :param retry_statuses: The response status codes to retry
+        :type retry_statuses: Iterable[int]
+        """
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.retry_statuses = set(retry_statuses)
+
+    def __str__(self):
+        return f"RetryPolicy:\n  max_retries = {self.max_retries}\n  backoff_factor = {self.backoff_factor}" \
+               f"\n  retry_statuses = {sorted(self.retry_statuses)}"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def can_retry(self, method: str, headers: Optional[dict], attempt: int) -> bool:
+        """Whether the request may be retried after the given (0-based) attempt"""
+        if attempt >= self.max_retries:
+            return False
+        if method.upper() in idempotent_methods:
+            return True
+        return method.upper() == 'POST' and bool(headers) and any(k.lower() == 'slug' for k in headers)
+
+    def delay(self, attempt: int, retry_after: str = None) -> float:
+        """The number of seconds to wait before retrying after the given (0-based) attempt"""
+        seconds = _parse_retry_after(retry_after) if retry_after else None
+        if seconds is None:
+            seconds = random.uniform(0, self.backoff_factor * (2 ** attempt))
+        return max(0.0, min(seconds, self.max_backoff))
+
+
+class CircuitBreaker:
+    """
+    Fails fast while the server seems down: after failure_threshold consecutive failures the circuit opens, and
+    requests raise a CircuitOpenError without being sent. After reset_timeout seconds one trial request is let through;
+    when it succeeds the circuit closes again, when it fails the circuit stays open for another reset_timeout.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 failure_statuses: Iterable[int] = (502, 503, 504)):
+        """
+        :param failure_threshold: The number of consecutive failures that opens the circuit
+        :type failure_threshold: int
+        :param reset_timeout: The number of seconds the circuit stays open before a trial request
+        :type reset_timeout: float
+        :param failure_statuses: The response status codes that count as failures, besides connection errors
+        :type failure_statuses: Iterable[int]
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failure_statuses = set(failure_statuses)
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = Lock()
+
+    def __str__(self):
+        return f"CircuitBreaker:\n  state = {self.state}\n  failures = {self.failures}"
+
+    def __repr__(self):
+        return self.__str__()
+
+    @property
+    def state(self) -> str:
+        """'closed', 'open' or 'half-open'"""
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def before_request(self):
+        """Raise a CircuitOpenError when the request may not be sent"""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return
+            if state == 'half-open' and not self._trial_running:
+                self._trial_running = True
+                return
+        raise CircuitOpenError(f"the circuit is open after {self.failures} consecutive failures")
+
+    def record(self, status_code: int = None):
+        """Record the outcome of a request: its status code, or None for a connection error or timeout"""
+        with self._lock:
+            self._trial_running = False
+            if status_code is not None and status_code not in self.failure_statuses:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+    def cancel_trial(self):
+        """Let another trial request through after one that ended without an outcome to record"""
+        with self._lock:
+            self._trial_running = False
+
+
+def _parse_retry_after(retry_after: str) -> Optional[float]:
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        return (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds()
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,139 @@
+import sqlite3
+import time
+from threading import Lock
+from typing import Dict, Optional
+from urllib.parse import urlsplit, parse_qsl, urlencode, urlunsplit
+
+import requests
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+
+# the search endpoints, by the last segment of their path
+query_types = {
+    'body': 'part',
+    'target': 'part',
+    'creator': 'role',
+    'generator': 'role',
+    'temporal': 'temporal'
+}
+
+default_ttls = {
+    'part': 24 * 60 * 60,
+    'role': 24 * 60 * 60,
+    'temporal': 60 * 60
+}
+
+
+class SearchCache:
+    """
+    A persistent, SQLite-backed cache of the pages of search results, so repeated searches can be served from disk,
+    also after a restart.
+    The pages are keyed by their url with normalized query parameters, expire after the time-to-live of their query
+    type (part, role or temporal), and the least recently used pages are evicted when the cache exceeds max_bytes.
+    """
+
+    def __init__(self, path: str = 'elucidate-search-cache.sqlite', ttls: Dict[str, float] = None,
+                 max_bytes: int = 256 * 1024 * 1024):
+        """
+        :param path: The path of the SQLite database file
+        :type path: str
+        :param ttls: The time-to-live (in seconds) per query type: 'part', 'role' and 'temporal'
+        :type ttls: Dict[str, float]
+        :param max_bytes: The maximum total size (in bytes) of the cached pages
+        :type max_bytes: int
+        """
+        self.path = path
+        self.ttls = {**default_ttls, **(ttls if ttls else {})}
+        self.max_bytes = max_bytes
+        self._lock = Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS pages (key TEXT PRIMARY KEY, query_type TEXT, stored_at REAL, '
+                'used_at REAL, size INTEGER, content_type TEXT, body BLOB)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS pages_used_at ON pages (used_at)')
+
+    def __str__(self):
+        return f"SearchCache:\n  path = {self.path}\n  ttls = {self.ttls}\n  max_bytes = {self.max_bytes}"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def get(self, url: str, params: dict = None) -> Optional[Response]:
+        """
+        The cached response for the search (page) url, or None if not cached, expired, or not a search url
+        """
+        key = cache_key(url, params)
+        query_type = search_query_type(key)
+        if not query_type:
+            return None
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute('SELECT stored_at, content_type, body FROM pages WHERE key = ?',
+                                           (key,)).fetchone()
+            if not row:
+                return None
+            stored_at, content_type, body = row
+            if now - stored_at > self.ttls[query_type]:
+                self._connection.execute('DELETE FROM pages WHERE key = ?', (key,))
+                return None
+            self._connection.execute('UPDATE pages SET used_at = ? WHERE key = ?', (now, key))
+        return as_response(key, content_type, body)
+
+    def put(self, response: Response):
+        """
+        Store the response when it is a successful response to a search (page) url
+        """
+        key = cache_key(response.request.url)
+        query_type = search_query_type(key)
+        if response.status_code != 200 or not query_type:
+            return
+        body = response.content
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                     (key, query_type, now, now, len(body), response.headers.get('content-type'),
+                                      body))
+            self._evict()
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM pages')
+
+    def close(self):
+        self._connection.close()
+
+    def _evict(self):
+        total, = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()
+        if total <= self.max_bytes:
+            return
+        for key, size in self._connection.execute('SELECT key, size FROM pages ORDER BY used_at').fetchall():
+            self._connection.execute('DELETE FROM pages WHERE key = ?', (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+def cache_key(url: str, params: dict = None) -> str:
+    scheme, netloc, path, query, _ = urlsplit(url)
+    query_params = parse_qsl(query, keep_blank_values=True)
+    if params:
+        query_params += [(k, str(v)) for k, v in params.items() if v is not None]
+    return urlunsplit((scheme, netloc, path, urlencode(sorted(query_params)), ''))
+
+
+def search_query_type(url: str) -> Optional[str]:
+    path = urlsplit(url).path.rstrip('/')
+    if '/services/search/' not in path:
+        return None
+    return query_types.get(path.split('/')[-1])
+
+
+def as_response(url: str, content_type: str, body: bytes) -> Response:
+    response = Response()
+    response.status_code = 200
+    response._content = body
+    response.headers = CaseInsensitiveDict({'content-type': content_type} if content_type else {})
+    response.url = url
+    response.request = requests.Request('GET', url).prepare()
+    return response
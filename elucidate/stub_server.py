@@ -0,0 +1,626 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Union, Callable, Optional, List
+from urllib.parse import urlsplit, parse_qsl, urlencode, quote
+
+anno_context = "http://www.w3.org/ns/anno.jsonld"
+ldp_context = "http://www.w3.org/ns/ldp.jsonld"
+
+
+class StubElucidateServer:
+    """
+    An in-process stand-in for an Elucidate server, for testing and benchmarking the client without one.
+    It keeps its containers, annotations and groups in memory, and implements the parts of the api the client uses:
+    container and annotation CRUD with ETags, paging, the search, statistics and batch services, users and groups.
+    Latency, errors and a throughput limit can be injected, so the client's performance features can be measured
+    reproducibly:
+
+        with StubElucidateServer(page_size=10, latency=0.005) as server:
+            client = ElucidateClient(server.base_uri)
+            ...
+
+    It is meant for tests: it does no authentication, keeps no history, and its search and batch services only
+    approximate Elucidate's.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, page_size: int = 100,
+                 latency: Union[float, Callable[[], float]] = 0.0, error_rate: float = 0.0, error_status: int = 503,
+                 max_requests_per_second: float = None, bytes_per_second: float = None, seed: int = None):
+        """
+        :param host: The host to listen on
+        :type host: str
+        :param port: The port to listen on, a free port when 0
+        :type port: int
+        :param page_size: The number of annotations per page of a container or search result
+        :type page_size: int
+        :param latency: The seconds to wait before handling a request, or a function returning them
+        :type latency: Union[float, Callable[[], float]]
+        :param error_rate: The fraction of requests that fail with error_status
+        :type error_rate: float
+        :param error_status: The status code of the injected errors
+        :type error_status: int
+        :param max_requests_per_second: Answer the requests above this rate with 429 Too Many Requests
+        :type max_requests_per_second: float
+        :param bytes_per_second: Send the response bodies at this rate
+        :type bytes_per_second: float
+        :param seed: The seed of the injected errors, for reproducible runs
+        :type seed: int
+        """
+        self.page_size = page_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.max_requests_per_second = max_requests_per_second
+        self.bytes_per_second = bytes_per_second
+        self.request_count = 0
+        self._random = random.Random(seed)
+        self._tokens = max_requests_per_second or 0.0
+        self._tokens_updated = time.monotonic()
+        self._lock = threading.RLock()
+        self._server = ThreadingHTTPServer((host, port), _RequestHandler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+        self.reset()
+
+    def __str__(self):
+        return f"StubElucidateServer:\n  base_uri = {self.base_uri}\n  page_size = {self.page_size}" \
+               f"\n  containers = {len(self.containers)}\n  request_count = {self.request_count}"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def base_uri(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/annotation"
+
+    def start(self) -> 'StubElucidateServer':
+        """Serve in a background thread"""
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={'poll_interval': 0.05},
+                                        name='stub-elucidate', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def reset(self):
+        """Remove all containers, annotations, groups and users"""
+        with self._lock:
+            self.containers = {}
+            self.groups = {}
+            self.current_user = {'id': str(uuid.uuid4()), 'username': 'stub', 'roles': ['ROLE_USER']}
+            self.request_count = 0
+
+    def add_annotations(self, container_uuid: str, annotations: List[dict], label: str = None) -> List[str]:
+        """
+        Store the annotations directly, without going through http; for preparing large benchmark fixtures
+
+        :param container_uuid: The container to store them in; it is created when needed
+        :type container_uuid: str
+        :param annotations: The annotations, with an 'id' to use as their uuid, or without
+        :type annotations: List[dict]
+        :param label: The label of the container, when it is created
+        :type label: str
+        :return: The uuids of the stored annotations
+        :rtype: List[str]
+        """
+        with self._lock:
+            container = self.containers.get(container_uuid) or self._create_container(container_uuid, label)
+            return [container.put(annotation.get('id', '').split('/')[-1] or None, annotation)[0]
+                    for annotation in annotations]
+
+    def _create_container(self, container_uuid: str, label: str) -> '_Container':
+        container = _Container(container_uuid, label or 'A Container for Web Annotations')
+        self.containers[container_uuid] = container
+        return container
+
+    def _admit(self) -> Optional[int]:
+        # the injected faults: the status code to answer with instead of handling the request, if any
+        with self._lock:
+            self.request_count += 1
+            if self.max_requests_per_second:
+                now = time.monotonic()
+                self._tokens = min(self.max_requests_per_second,
+                                   self._tokens + (now - self._tokens_updated) * self.max_requests_per_second)
+                self._tokens_updated = now
+                if self._tokens < 1:
+                    return HTTPStatus.TOO_MANY_REQUESTS
+                self._tokens -= 1
+            if self.error_rate and self._random.random() < self.error_rate:
+                return self.error_status
+        return None
+
+
+class _Annotation:
+    def __init__(self, json: dict):
+        self.json = json
+        self.created = _now()
+        self.modified = None
+        self.etag = _etag(json)
+
+    def as_json(self, url: str) -> dict:
+        annotation = dict(self.json)
+        annotation['id'] = url
+        annotation['created'] = _isoformat(self.created)
+        if self.modified:
+            annotation['modified'] = _isoformat(self.modified)
+        return annotation
+
+
+class _Container:
+    def __init__(self, container_uuid: str, label: str):
+        self.uuid = container_uuid
+        self.label = label
+        self.annotations = {}
+        self.version = 0
+
+    def put(self, annotation_uuid: Optional[str], json: dict) -> tuple:
+        annotation_uuid = annotation_uuid or str(uuid.uuid4())
+        annotation = _Annotation({k: v for k, v in json.items() if k not in ('id', 'created', 'modified')})
+        self.annotations[annotation_uuid] = annotation
+        self.version += 1
+        return annotation_uuid, annotation
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # send the headers and body of a response in one write, without waiting for the client's delayed ACK
+    disable_nagle_algorithm = True
+    wbufsize = -1
+    routes = []
+    search_matchers = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    @property
+    def stub(self) -> StubElucidateServer:
+        return self.server.stub
+
+    @property
+    def base_uri(self) -> str:
+        return self.stub.base_uri
+
+    def _dispatch(self, method: str):
+        url = urlsplit(self.path)
+        self.query = dict(parse_qsl(url.query))
+        length = int(self.headers.get('Content-Length', 0))
+        self.body = self.rfile.read(length) if length else b''
+        latency = self.stub.latency() if callable(self.stub.latency) else self.stub.latency
+        if latency:
+            time.sleep(latency)
+        fault = self.stub._admit()
+        if fault:
+            headers = {'Retry-After': '1'} if fault == HTTPStatus.TOO_MANY_REQUESTS else {}
+            return self._send(fault, {'message': 'injected fault'}, headers)
+        for route_method, pattern, handler in self.routes:
+            match = pattern.fullmatch(url.path) if route_method == method else None
+            if match:
+                try:
+                    with self.stub._lock:
+                        return handler(self, *match.groups())
+                except (ValueError, KeyError, TypeError) as e:
+                    return self._send(HTTPStatus.BAD_REQUEST, {'message': str(e)})
+        self._send(HTTPStatus.NOT_FOUND, {'message': f'no route for {method} {url.path}'})
+
+    def _send(self, status: int, json=None, headers: dict = None):
+        body = b'' if json is None else _dumps(json)
+        self.send_response(status)
+        content_type = 'application/json' if self.path.startswith(('/annotation/user', '/annotation/group')) \
+            else f'application/ld+json; profile="{anno_context}"'
+        if json is not None:
+            self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body and self.stub.bytes_per_second:
+            time.sleep(len(body) / self.stub.bytes_per_second)
+        self.wfile.write(body)
+
+    def _json_body(self):
+        return json.loads(self.body) if self.body else {}
+
+    def _container(self, container_uuid: str) -> Optional[_Container]:
+        return self.stub.containers.get(container_uuid)
+
+    def _annotation_url(self, version: str, container_uuid: str, annotation_uuid: str) -> str:
+        return f"{self.base_uri}/{version}/{container_uuid}/{annotation_uuid}"
+
+    # containers and annotations
+
+    def create_container(self, version: str):
+        json = self._json_body()
+        container_uuid = self.headers.get('slug') or str(uuid.uuid4())
+        if container_uuid in self.stub.containers:
+            return self._send(HTTPStatus.CONFLICT, {'message': f'container {container_uuid} exists'})
+        container = self.stub._create_container(container_uuid, json.get('label'))
+        url = f"{self.base_uri}/{version}/{container_uuid}/"
+        self._send(HTTPStatus.CREATED, self._container_json(version, container), {'Location': url})
+
+    def read_container(self, version: str, container_uuid: str):
+        container = self._container(container_uuid)
+        if container is None:
+            return self._send(HTTPStatus.NOT_FOUND, {'message': f'no container {container_uuid}'})
+        container_url = f"{self.base_uri}/{version}/{container_uuid}/"
+        urls_and_annotations = [(self._annotation_url(version, container_uuid, annotation_uuid), annotation)
+                                for annotation_uuid, annotation in container.annotations.items()]
+        if 'page' in self.query:
+            return self._send(HTTPStatus.OK, self._page(container_url, urls_and_annotations, int(self.query['page'])))
+        etag = f'W/"{container.version}-{version}"'
+        if _etag_matches(self.headers.get('If-None-Match'), etag):
+            return self._send(HTTPStatus.NOT_MODIFIED, headers={'ETag': etag})
+        self._send(HTTPStatus.OK, self._container_json(version, container), {'ETag': etag})
+
+    def _container_json(self, version: str, container: _Container) -> dict:
+        container_url = f"{self.base_uri}/{version}/{container.uuid}/"
+        urls_and_annotations = [(self._annotation_url(version, container.uuid, annotation_uuid), annotation)
+                                for annotation_uuid, annotation in container.annotations.items()]
+        collection = self._collection(container_url, urls_and_annotations)
+        collection.update({'@context': [anno_context, ldp_context], 'type': ['BasicContainer', 'AnnotationCollection'],
+                           'label': container.label})
+        return collection
+
+    def create_annotation(self, version: str, container_uuid: str):
+        container = self._container(container_uuid)
+        if container is None:
+            return self._send(HTTPStatus.NOT_FOUND, {'message': f'no container {container_uuid}'})
+        slug = self.headers.get('slug')
+        if slug and slug in container.annotations:
+            return self._send(HTTPStatus.CONFLICT, {'message': f'annotation {slug} exists'})
+        annotation_uuid, annotation = container.put(slug, self._json_body())
+        url = self._annotation_url(version, container_uuid, annotation_uuid)
+        self._send(HTTPStatus.CREATED, annotation.as_json(url), {'Location': url, 'ETag': annotation.etag})
+
+    def read_annotation(self, version: str, container_uuid: str, annotation_uuid: str):
+        annotation = self.__annotation(container_uuid, annotation_uuid)
+        if annotation is None:
+            return
+        if _etag_matches(self.headers.get('If-None-Match'), annotation.etag):
+            return self._send(HTTPStatus.NOT_MODIFIED, headers={'ETag': annotation.etag})
+        url = self._annotation_url(version, container_uuid, annotation_uuid)
+        self._send(HTTPStatus.OK, annotation.as_json(url), {'ETag': annotation.etag})
+
+    def update_annotation(self, version: str, container_uuid: str, annotation_uuid: str):
+        annotation = self.__annotation(container_uuid, annotation_uuid, check_if_match=True)
+        if annotation is None:
+            return
+        annotation.json = {k: v for k, v in self._json_body().items() if k not in ('id', 'created', 'modified')}
+        annotation.modified = _now()
+        annotation.etag = _etag(annotation.json)
+        self._container(container_uuid).version += 1
+        url = self._annotation_url(version, container_uuid, annotation_uuid)
+        self._send(HTTPStatus.OK, annotation.as_json(url), {'ETag': annotation.etag})
+
+    def delete_annotation(self, version: str, container_uuid: str, annotation_uuid: str):
+        if self.__annotation(container_uuid, annotation_uuid, check_if_match=True) is None:
+            return
+        container = self._container(container_uuid)
+        del container.annotations[annotation_uuid]
+        container.version += 1
+        self._send(HTTPStatus.NO_CONTENT)
+
+    def __annotation(self, container_uuid: str, annotation_uuid: str, check_if_match: bool = False):
+        # the annotation, or None when an error response has been sent
+        container = self._container(container_uuid)
+        annotation = container.annotations.get(annotation_uuid) if container else None
+        if annotation is None:
+            self._send(HTTPStatus.NOT_FOUND, {'message': f'no annotation {container_uuid}/{annotation_uuid}'})
+        elif check_if_match and not _etag_matches(self.headers.get('If-Match'), annotation.etag):
+            self._send(HTTPStatus.PRECONDITION_FAILED, {'message': 'If-Match does not match the current ETag'})
+            return None
+        return annotation
+
+    # services
+
+    def search(self, version: str, kind: str):
+        matcher = self.search_matchers.get(kind)
+        if matcher is None:
+            return self._send(HTTPStatus.NOT_FOUND, {'message': f'no search service {kind}'})
+        matches = matcher(self, kind)
+        urls_and_annotations = []
+        for container in self.stub.containers.values():
+            for annotation_uuid, annotation in container.annotations.items():
+                url = self._annotation_url(version, container.uuid, annotation_uuid)
+                if matches(annotation.as_json(url)):
+                    urls_and_annotations.append((url, annotation))
+        query = urlencode([(k, v) for k, v in self.query.items() if k != 'page'], quote_via=quote)
+        collection_url = f"{self.base_uri}/{version}/services/search/{kind}?{query}"
+        if 'page' in self.query:
+            return self._send(HTTPStatus.OK, self._page(collection_url, urls_and_annotations, int(self.query['page'])))
+        collection = self._collection(collection_url, urls_and_annotations)
+        collection.update({'@context': anno_context, 'type': 'AnnotationCollection'})
+        self._send(HTTPStatus.OK, collection)
+
+    def _part_matcher(self, part: str) -> Callable[[dict], bool]:
+        fields = self.query['fields'].split(',')
+        strict = self.query.get('strict', 'false').lower() == 'true'
+        value = self.query['value']
+
+        def matches(annotation: dict) -> bool:
+            return any(_value_matches(item.get(field), value, strict)
+                       for item in _items(annotation.get(part)) for field in fields)
+
+        return matches
+
+    def _role_matcher(self, role: str) -> Callable[[dict], bool]:
+        levels = self.query['levels'].split(',')
+        field = self.query['type']
+        strict = self.query.get('strict', 'false').lower() == 'true'
+        value = self.query['value']
+
+        def matches(annotation: dict) -> bool:
+            return any(_value_matches(agent.get(field), value, strict)
+                       for level_item in _level_items(annotation, levels)
+                       for agent in _items(level_item.get(role)))
+
+        return matches
+
+    def _temporal_matcher(self, _: str) -> Callable[[dict], bool]:
+        levels = self.query['levels'].split(',')
+        types = self.query['types'].split(',')
+        since = _isoformat(_parse_datetime(self.query['since']))
+
+        def matches(annotation: dict) -> bool:
+            return any(isinstance(level_item.get(t), str) and level_item[t] >= since
+                       for level_item in _level_items(annotation, levels) for t in types)
+
+        return matches
+
+    def statistics(self, version: str, part: str):
+        field = self.query['field']
+        counts = {}
+        for container in self.stub.containers.values():
+            for annotation in container.annotations.values():
+                for item in _items(annotation.json.get(part)):
+                    value = item.get(field)
+                    if isinstance(value, str):
+                        counts[value] = counts.get(value, 0) + 1
+        items = [{'value': value, 'count': count}
+                 for value, count in sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))]
+        self._send(HTTPStatus.OK, {'@context': anno_context, 'items': items})
+
+    def batch(self, version: str, operation: str):
+        # {"body": {"id": ..., "oldId": ...}} (or target) updates the id, {"body": {"id": ...}} deletes the annotations
+        json = self._json_body()
+        selections = [(part, json[part]) for part in ('body', 'target') if isinstance(json.get(part), dict)]
+        count = 0
+        for container in self.stub.containers.values():
+            for annotation_uuid, annotation in list(container.annotations.items()):
+                for part, selection in selections:
+                    old_id = selection['oldId'] if operation == 'update' else selection['id']
+                    hits = [item for item in _items(annotation.json.get(part)) if item.get('id') == old_id]
+                    if not hits:
+                        continue
+                    count += 1
+                    container.version += 1
+                    if operation == 'delete':
+                        del container.annotations[annotation_uuid]
+                        break
+                    annotation.json[part] = _replace_id(annotation.json[part], old_id, selection['id'])
+                    annotation.modified = _now()
+                    annotation.etag = _etag(annotation.json)
+        self._send(HTTPStatus.OK, {'status': 'OK', 'operation': operation, 'annotations': count})
+
+    # users and groups
+
+    def read_current_user(self):
+        user = self.stub.current_user
+        groups = [{'id': group_id, 'label': group['label']} for group_id, group in self.stub.groups.items()
+                  if user['id'] in group['users']]
+        self._send(HTTPStatus.OK, {**user, 'groups': groups})
+
+    def create_group(self):
+        group_id = str(uuid.uuid4())
+        label = self._json_body().get('label')
+        self.stub.groups[group_id] = {'label': label, 'users': [self.stub.current_user['id']], 'annotations': []}
+        self._send(HTTPStatus.CREATED, {'id': group_id, 'label': label})
+
+    def read_group(self, group_id: str):
+        group = self.__group(group_id)
+        if group is not None:
+            self._send(HTTPStatus.OK, {'id': group_id, 'label': group['label']})
+
+    def read_group_users(self, group_id: str):
+        group = self.__group(group_id)
+        if group is not None:
+            self._send(HTTPStatus.OK, {'users': [{'id': user_id} for user_id in group['users']]})
+
+    def change_group_user(self, group_id: str, user_id: str):
+        self.__change_group_member(group_id, 'users', user_id)
+
+    def read_group_annotations(self, group_id: str):
+        group = self.__group(group_id)
+        if group is not None:
+            self._send(HTTPStatus.OK, {'annotations': group['annotations']})
+
+    def change_group_annotation(self, group_id: str, container_uuid: str, annotation_uuid: str):
+        self.__change_group_member(group_id, 'annotations', f"{self.base_uri}/{container_uuid}/{annotation_uuid}")
+
+    def __change_group_member(self, group_id: str, kind: str, member: str):
+        group = self.__group(group_id)
+        if group is None:
+            return
+        if self.command == 'POST' and member not in group[kind]:
+            group[kind].append(member)
+        elif self.command == 'DELETE' and member in group[kind]:
+            group[kind].remove(member)
+        self._send(HTTPStatus.OK, {'id': group_id, kind: group[kind]})
+
+    def __group(self, group_id: str) -> Optional[dict]:
+        group = self.stub.groups.get(group_id)
+        if group is None:
+            self._send(HTTPStatus.NOT_FOUND, {'message': f'no group {group_id}'})
+        return group
+
+    # collections
+
+    def _collection(self, collection_url: str, urls_and_annotations: list) -> dict:
+        total = len(urls_and_annotations)
+        last_page = max(0, (total - 1) // self.stub.page_size)
+        return {'id': collection_url, 'total': total,
+                'first': self._page(collection_url, urls_and_annotations, 0),
+                'last': _page_url(collection_url, last_page)}
+
+    def _page(self, collection_url: str, urls_and_annotations: list, page: int) -> dict:
+        size = self.stub.page_size
+        start = page * size
+        json = {'id': _page_url(collection_url, page), 'type': 'AnnotationPage', 'partOf': collection_url,
+                'startIndex': start,
+                'items': [annotation.as_json(url) for url, annotation in urls_and_annotations[start:start + size]]}
+        if start + size < len(urls_and_annotations):
+            json['next'] = _page_url(collection_url, page + 1)
+        if page > 0:
+            json['prev'] = _page_url(collection_url, page - 1)
+        return json
+
+
+_version = '(w3c|oa)'
+_name = '([^/]+)'
+_RequestHandler.routes = [(method, re.compile(f'/annotation{pattern}'), handler) for method, pattern, handler in (
+    ('GET', f'/{_version}/services/search/{_name}', _RequestHandler.search),
+    ('GET', f'/{_version}/services/stats/(body|target)', _RequestHandler.statistics),
+    ('POST', f'/{_version}/services/batch/(update|delete)', _RequestHandler.batch),
+    ('POST', f'/{_version}/', _RequestHandler.create_container),
+    ('GET', f'/{_version}/{_name}/', _RequestHandler.read_container),
+    ('POST', f'/{_version}/{_name}/', _RequestHandler.create_annotation),
+    ('GET', f'/{_version}/{_name}/{_name}', _RequestHandler.read_annotation),
+    ('PUT', f'/{_version}/{_name}/{_name}', _RequestHandler.update_annotation),
+    ('DELETE', f'/{_version}/{_name}/{_name}', _RequestHandler.delete_annotation),
+    ('GET', '/user/current', _RequestHandler.read_current_user),
+    ('POST', '/group', _RequestHandler.create_group),
+    ('GET', f'/group/{_name}', _RequestHandler.read_group),
+    ('GET', f'/group/{_name}/users', _RequestHandler.read_group_users),
+    ('POST', f'/group/{_name}/users/{_name}', _RequestHandler.change_group_user),
+    ('DELETE', f'/group/{_name}/users/{_name}', _RequestHandler.change_group_user),
+    ('GET', f'/group/{_name}/annotations', _RequestHandler.read_group_annotations),
+    ('POST', f'/group/{_name}/annotation/{_name}/{_name}', _RequestHandler.change_group_annotation),
+    ('DELETE', f'/group/{_name}/annotation/{_name}/{_name}', _RequestHandler.change_group_annotation),
+)]
+
+# per search service, the method making the predicate on the annotations that match the query
+_RequestHandler.search_matchers = {
+    'body': _RequestHandler._part_matcher,
+    'target': _RequestHandler._part_matcher,
+    'creator': _RequestHandler._role_matcher,
+    'generator': _RequestHandler._role_matcher,
+    'temporal': _RequestHandler._temporal_matcher,
+}
+
+
+def _dumps(json_object) -> bytes:
+    return json.dumps(json_object, separators=(',', ':')).encode('utf-8')
+
+
+def _etag(json_object: dict) -> str:
+    return f'W/"{hashlib.sha1(_dumps(json_object)).hexdigest()}"'
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    # the client sends the ETags of annotation identifiers without the W/ prefix and the quotes
+    if not header:
+        return False
+    return header.strip() in (etag, etag[2:], etag[3:-1], '*')
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _isoformat(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def _parse_datetime(value: str) -> datetime:
+    # the client sends e.g. 2000-01-01T00:00:00.00000Z; fromisoformat only accepts 3 or 6 digit fractions
+    value = value.rstrip('Z')
+    seconds, _, fraction = value.partition('.')
+    dt = datetime.strptime(seconds, '%Y-%m-%dT%H:%M:%S')
+    return dt.replace(microsecond=int((fraction + '000000')[:6]), tzinfo=timezone.utc)
+
+
+def _page_url(collection_url: str, page: int) -> str:
+    return f"{collection_url}{'&' if '?' in collection_url else '?'}page={page}"
+
+
+def _items(value) -> List[dict]:
+    # a body, target or agent value as a list of dicts, with plain strings as {'id': value}
+    values = value if isinstance(value, list) else [value] if value is not None else []
+    return [v if isinstance(v, dict) else {'id': v} for v in values if isinstance(v, (dict, str))]
+
+
+def _level_items(annotation: dict, levels: List[str]) -> List[dict]:
+    items = []
+    for level in levels:
+        items += [annotation] if level == 'annotation' else _items(annotation.get(level))
+    return items
+
+
+def _value_matches(candidate, value: str, strict: bool) -> bool:
+    if not isinstance(candidate, str):
+        return False
+    return candidate == value if strict else candidate.startswith(value)
+
+
+def _replace_id(value, old_id: str, new_id: str):
+    if isinstance(value, list):
+        return [_replace_id(v, old_id, new_id) for v in value]
+    if value == old_id:
+        return new_id
+    if isinstance(value, dict) and value.get('id') == old_id:
+        return {**value, 'id': new_id}
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a stand-in Elucidate server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds to wait before handling each request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with a 503')
+    parser.add_argument('--max-requests-per-second', type=float, default=None)
+    args = parser.parse_args()
+    server = StubElucidateServer(args.host, args.port, page_size=args.page_size, latency=args.latency,
+                                 error_rate=args.error_rate, max_requests_per_second=args.max_requests_per_second)
+    print(f"serving {server.base_uri}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
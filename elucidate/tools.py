@@ -1,3 +1,10 @@
+import re
+from typing import List, Optional, Tuple
+
+_char_fragment = re.compile(r'char=(\d+),(\d+)')
+_xywh_fragment = re.compile(r'xywh=(?:pixel:)?(-?[\d.]+),(-?[\d.]+),([\d.]+),([\d.]+)')
+
+
 def split_annotation(annotation: dict):
     context = annotation['@context']
     body = annotation['body']
@@ -13,3 +20,50 @@ def split_annotation(annotation: dict):
     else:
         custom_contexts = None
     return body, target, custom, custom_contexts
+
+
+def as_list(value) -> list:
+    """A body, target, selector or agent value as a list"""
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def target_selectors(target) -> List[dict]:
+    """The selectors of the target, followed by the selectors they are refined by; none for a plain url target"""
+    if not isinstance(target, dict):
+        return []
+    selectors = []
+    for selector in as_list(target.get('selector')):
+        while isinstance(selector, dict):
+            selectors.append(selector)
+            selector = selector.get('refinedBy')
+    return selectors
+
+
+def text_position(selector: dict) -> Optional[Tuple[int, int]]:
+    """The (start, end) of a TextPositionSelector or char= FragmentSelector, None for other selectors"""
+    if selector.get('type') == 'TextPositionSelector':
+        start, end = selector.get('start'), selector.get('end')
+        return (start, end) if isinstance(start, int) and isinstance(end, int) else None
+    value = selector.get('value') if selector.get('type') == 'FragmentSelector' else None
+    match = _char_fragment.search(value) if isinstance(value, str) else None
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+def pixel_region(selector: dict) -> Optional[tuple]:
+    """The (x, y, w, h) of an xywh= FragmentSelector in pixels, None for percent regions and other selectors"""
+    value = selector.get('value') if selector.get('type') == 'FragmentSelector' else None
+    match = _xywh_fragment.search(value) if isinstance(value, str) else None
+    return tuple(_number(v) for v in match.groups()) if match else None
+
+
+def fragment_pixel_region(fragment: str) -> Optional[tuple]:
+    """The (x, y, w, h) of a url fragment like xywh=10,20,30,40 in pixels, or None"""
+    match = _xywh_fragment.fullmatch(fragment)
+    return tuple(_number(v) for v in match.groups()) if match else None
+
+
+def _number(value: str):
+    number = float(value)
+    return int(number) if number.is_integer() else number
@@ -0,0 +1,348 @@
+import asyncio
+import time
+from typing import Union, Tuple
+
+import requests
+from requests import Response
+from requests.adapters import HTTPAdapter
+
+from elucidate.limiter import AdaptiveLimiter
+from elucidate.metrics import Metrics, RequestEvent, request_bytes, response_bytes
+from elucidate.profiling import RequestTracer, HttpxTraceHook, current_span, time_connections
+from elucidate.retry import RetryPolicy, CircuitBreaker
+from elucidate.search_cache import SearchCache
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None
+
+Timeout = Union[None, float, Tuple[float, float]]
+
+
+class Transport:
+    """
+    The HTTP layer used by ElucidateClient and the AnnotationCollections it returns.
+    All requests go through one pooled requests.Session, so connections (and TLS sessions) are reused between calls.
+    """
+
+    def __init__(self, pool_connections: int = 10, pool_maxsize: int = 10, keep_alive: bool = True,
+                 timeout: Timeout = None, search_cache: SearchCache = None, retry_policy: RetryPolicy = None,
+                 circuit_breaker: CircuitBreaker = None, limiter: AdaptiveLimiter = None, metrics: Metrics = None,
+                 tracer: RequestTracer = None):
+        """
+        :param pool_connections: The number of host pools to cache
+        :type pool_connections: int
+        :param pool_maxsize: The maximum number of connections kept open per host
+        :type pool_maxsize: int
+        :param keep_alive: Whether to keep connections open between requests
+        :type keep_alive: bool
+        :param timeout: The default timeout (in seconds) for requests, either one value or a (connect, read) tuple
+        :type timeout: Union[None, float, Tuple[float, float]]
+        :param search_cache: The persistent cache for the pages of search results, no caching when omitted
+        :type search_cache: SearchCache
+        :param retry_policy: When to retry failed requests, no retries when omitted
+        :type retry_policy: RetryPolicy
+        :param circuit_breaker: The circuit breaker to fail fast with while the server is down, none when omitted
+        :type circuit_breaker: CircuitBreaker
+        :param limiter: The adaptive limit on the number of requests in flight, shared by all threads using this
+            transport; no limit when omitted. Make pool_maxsize at least its max_limit.
+        :type limiter: AdaptiveLimiter
+        :param metrics: The metrics to record every request in, no measuring when omitted
+        :type metrics: Metrics
+        :param tracer: The tracer to record the timing of the phases of every request in, no tracing when omitted
+        :type tracer: RequestTracer
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.search_cache = search_cache
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        self.limiter = limiter
+        self.metrics = metrics
+        self.tracer = tracer
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        if tracer:
+            time_connections(adapter)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+
+    def __str__(self):
+        return f"Transport:\n  pool_connections = {self.pool_connections}\n  pool_maxsize = {self.pool_maxsize}" \
+               f"\n  keep_alive = {self.keep_alive}\n  timeout = {self.timeout}"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def request(self, method: str, url: str, **kwargs) -> Response:
+        kwargs.setdefault('timeout', self.timeout)
+        if self.metrics is None:
+            return self._cached_send(method, url, kwargs)
+        event = self.metrics.start(method, url)
+        started = time.monotonic()
+        try:
+            response = self._cached_send(method, url, kwargs, event)
+            event.status_code = response.status_code
+            event.response_bytes = response_bytes(response, kwargs)
+            return response
+        finally:
+            event.seconds = time.monotonic() - started
+            event.request_bytes = request_bytes(kwargs)
+            self.metrics.record(event)
+
+    def get(self, url: str, **kwargs) -> Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> Response:
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> Response:
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> Response:
+        return self.request('DELETE', url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def _cached_send(self, method: str, url: str, kwargs: dict, event: RequestEvent = None) -> Response:
+        if self.search_cache is None or method != 'GET':
+            return self._send(method, url, kwargs, event)
+        response = self.search_cache.get(url, kwargs.get('params'))
+        if response is None:
+            response = self._send(method, url, kwargs, event)
+            # reading a streamed body to cache it would leave nothing to stream
+            if not kwargs.get('stream'):
+                self.search_cache.put(response)
+        elif event is not None:
+            event.from_cache = True
+        return response
+
+    def _send(self, method: str, url: str, kwargs: dict, event: RequestEvent = None) -> Response:
+        attempt = 0
+        while True:
+            try:
+                response = self._guarded_attempt(method, url, kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if not self._can_retry(method, kwargs, attempt):
+                    raise
+                time.sleep(self.retry_policy.delay(attempt))
+            else:
+                if response.status_code not in self._retry_statuses() or not self._can_retry(method, kwargs, attempt):
+                    return response
+                response.close()
+                time.sleep(self.retry_policy.delay(attempt, response.headers.get('retry-after')))
+            attempt += 1
+            if event is not None:
+                event.retries = attempt
+
+    def _guarded_attempt(self, method: str, url: str, kwargs: dict) -> Response:
+        # the attempt, with its outcome recorded in the circuit breaker
+        if not self.circuit_breaker:
+            return self._attempt(method, url, kwargs)
+        self.circuit_breaker.before_request()
+        try:
+            response = self._attempt(method, url, kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            self.circuit_breaker.record(None)
+            raise
+        except BaseException:
+            self.circuit_breaker.cancel_trial()
+            raise
+        self.circuit_breaker.record(response.status_code)
+        return response
+
+    def _attempt(self, method: str, url: str, kwargs: dict) -> Response:
+        span = current_span.get() if self.tracer is not None else None
+        if span is None:
+            return self._limited_request(method, url, kwargs)
+        started = time.perf_counter()
+        response = self._limited_request(method, url, kwargs)
+        span.add_response_phases(started, time.perf_counter(), response.elapsed.total_seconds(),
+                                 streamed=bool(kwargs.get('stream')))
+        return response
+
+    def _limited_request(self, method: str, url: str, kwargs: dict) -> Response:
+        if not self.limiter:
+            return self.session.request(method=method, url=url, **kwargs)
+        started = self.limiter.acquire()
+        status_code = None
+        try:
+            response = self.session.request(method=method, url=url, **kwargs)
+            status_code = response.status_code
+            return response
+        finally:
+            self.limiter.release(started, status_code)
+
+    def _can_retry(self, method: str, kwargs: dict, attempt: int) -> bool:
+        return self.retry_policy is not None and self.retry_policy.can_retry(method, kwargs.get('headers'), attempt)
+
+    def _retry_statuses(self) -> set:
+        return self.retry_policy.retry_statuses if self.retry_policy else set()
+
+
+class AsyncTransport:
+    """
+    The asyncio counterpart of Transport, used by AsyncElucidateClient and the AsyncAnnotationCollections it returns.
+    All requests go through one pooled httpx.AsyncClient; this requires the optional httpx dependency.
+    """
+
+    def __init__(self, pool_maxsize: int = 10, keep_alive: bool = True, keep_alive_expiry: float = 5.0,
+                 timeout: Timeout = None, retry_policy: RetryPolicy = None, circuit_breaker: CircuitBreaker = None,
+                 limiter: AdaptiveLimiter = None, metrics: Metrics = None, tracer: RequestTracer = None):
+        """
+        :param pool_maxsize: The maximum number of concurrent connections
+        :type pool_maxsize: int
+        :param keep_alive: Whether to keep connections open between requests
+        :type keep_alive: bool
+        :param keep_alive_expiry: The time (in seconds) an idle connection is kept open
+        :type keep_alive_expiry: float
+        :param timeout: The default timeout (in seconds) for requests, either one value or a (connect, read) tuple
+        :type timeout: Union[None, float, Tuple[float, float]]
+        :param retry_policy: When to retry failed requests, no retries when omitted
+        :type retry_policy: RetryPolicy
+        :param circuit_breaker: The circuit breaker to fail fast with while the server is down, none when omitted
+        :type circuit_breaker: CircuitBreaker
+        :param limiter: The adaptive limit on the number of requests in flight, shared by all tasks using this
+            transport (and by the threads of a Transport given the same limiter); no limit when omitted. Make
+            pool_maxsize at least its max_limit.
+        :type limiter: AdaptiveLimiter
+        :param metrics: The metrics to record every request in, no measuring when omitted
+        :type metrics: Metrics
+        :param tracer: The tracer to record the timing of the phases of every request in, no tracing when omitted
+        :type tracer: RequestTracer
+        """
+        if httpx is None:
+            raise ImportError("AsyncTransport requires httpx, install it with: pip install elucidate-client[async]")
+        self.pool_maxsize = pool_maxsize
+        self.keep_alive = keep_alive
+        self.keep_alive_expiry = keep_alive_expiry
+        self.timeout = timeout
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        self.limiter = limiter
+        self.metrics = metrics
+        self.tracer = tracer
+        limits = httpx.Limits(max_connections=pool_maxsize,
+                              max_keepalive_connections=pool_maxsize if keep_alive else 0,
+                              keepalive_expiry=keep_alive_expiry)
+        self.client = httpx.AsyncClient(limits=limits, timeout=_as_httpx_timeout(timeout))
+
+    def __str__(self):
+        return f"AsyncTransport:\n  pool_maxsize = {self.pool_maxsize}\n  keep_alive = {self.keep_alive}" \
+               f"\n  timeout = {self.timeout}"
+
+    def __repr__(self):
+        return self.__str__()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def request(self, method: str, url: str, **kwargs):
+        if isinstance(kwargs.get('data'), bytes):
+            # httpx takes an encoded body as content
+            kwargs['content'] = kwargs.pop('data')
+        span = current_span.get() if self.tracer is not None else None
+        if span is not None:
+            kwargs['extensions'] = {**kwargs.get('extensions', {}), 'trace': HttpxTraceHook(span)}
+        if self.metrics is None:
+            return await self._send(method, url, kwargs)
+        event = self.metrics.start(method, url)
+        started = time.monotonic()
+        try:
+            response = await self._send(method, url, kwargs, event)
+            event.status_code = response.status_code
+            event.response_bytes = response_bytes(response, kwargs)
+            return response
+        finally:
+            event.seconds = time.monotonic() - started
+            event.request_bytes = request_bytes(kwargs)
+            self.metrics.record(event)
+
+    async def _send(self, method: str, url: str, kwargs: dict, event: RequestEvent = None):
+        attempt = 0
+        while True:
+            try:
+                response = await self._guarded_attempt(method, url, kwargs)
+            except httpx.TransportError:
+                if not self._can_retry(method, kwargs, attempt):
+                    raise
+                await asyncio.sleep(self.retry_policy.delay(attempt))
+            else:
+                if response.status_code not in self._retry_statuses() or not self._can_retry(method, kwargs, attempt):
+                    return response
+                await asyncio.sleep(self.retry_policy.delay(attempt, response.headers.get('retry-after')))
+            attempt += 1
+            if event is not None:
+                event.retries = attempt
+
+    async def _guarded_attempt(self, method: str, url: str, kwargs: dict):
+        # the attempt, with its outcome recorded in the circuit breaker
+        if not self.circuit_breaker:
+            return await self._limited_request(method, url, kwargs)
+        self.circuit_breaker.before_request()
+        try:
+            response = await self._limited_request(method, url, kwargs)
+        except httpx.TransportError:
+            self.circuit_breaker.record(None)
+            raise
+        except BaseException:
+            # also on cancellation, or the circuit would never get another trial
+            self.circuit_breaker.cancel_trial()
+            raise
+        self.circuit_breaker.record(response.status_code)
+        return response
+
+    async def _limited_request(self, method: str, url: str, kwargs: dict):
+        if not self.limiter:
+            return await self.client.request(method=method, url=url, **kwargs)
+        started = await self.limiter.acquire_async()
+        status_code = None
+        try:
+            response = await self.client.request(method=method, url=url, **kwargs)
+            status_code = response.status_code
+            return response
+        finally:
+            self.limiter.release(started, status_code)
+
+    async def get(self, url: str, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url: str, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def put(self, url: str, **kwargs):
+        return await self.request('PUT', url, **kwargs)
+
+    async def delete(self, url: str, **kwargs):
+        return await self.request('DELETE', url, **kwargs)
+
+    async def close(self):
+        await self.client.aclose()
+
+    def _can_retry(self, method: str, kwargs: dict, attempt: int) -> bool:
+        return self.retry_policy is not None and self.retry_policy.can_retry(method, kwargs.get('headers'), attempt)
+
+    def _retry_statuses(self) -> set:
+        return self.retry_policy.retry_statuses if self.retry_policy else set()
+
+
+def _as_httpx_timeout(timeout: Timeout):
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(timeout)
@@ -0,0 +1,132 @@
+import json
+import os
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Iterator, Optional
+
+from elucidate.model import ElucidateFailure, ElucidateSuccess
+
+cursor_format = '%Y-%m-%dT%H:%M:%S.%f'
+_timestamp = re.compile(r'(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})(?:\.(\d+))?(Z|[+-]\d{2}:?\d{2})?')
+
+
+class AnnotationEvent:
+    def __init__(self, kind: str, annotation: dict):
+        """
+        :param kind: 'created' or 'modified'
+        :type kind: str
+        :param annotation: The created or modified annotation
+        :type annotation: dict
+        """
+        self.kind = kind
+        self.annotation = annotation
+
+    def __str__(self):
+        return f"AnnotationEvent:\n  kind = {self.kind}\n  id = {self.annotation.get('id')}"
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class ChangeFeed:
+    """
+    Polls the server for annotations created or modified since the cursor.
+    Every poll searches from the previous poll's (UTC) start time minus an overlap, for clock skew between client and
+    server; the events in that overlap that were already reported are skipped. Only the events that can show up in the
+    next overlap are remembered for that, so the memory use and the cursor file stay small.
+    The poll interval is doubled after a poll without events (up to max_interval), and halved after a poll with events
+    (down to min_interval).
+    With a cursor_path, the cursor is stored after every poll, so a restarted feed continues where it left off.
+    """
+
+    def __init__(self, client, since: datetime = None, cursor_path: str = None, min_interval: float = 1.0,
+                 max_interval: float = 60.0, overlap: timedelta = timedelta(seconds=30)):
+        self.client = client
+        self.cursor_path = cursor_path
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.overlap = overlap
+        self.interval = min_interval
+        self.cursor = since if since else datetime.utcnow()
+        self._seen = set()
+        if cursor_path and os.path.exists(cursor_path):
+            self.__load_cursor()
+
+    def __str__(self):
+        return f"ChangeFeed:\n  cursor = {self.cursor}\n  interval = {self.interval}"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __iter__(self) -> Iterator[AnnotationEvent]:
+        while True:
+            events = 0
+            for event in self.poll():
+                events += 1
+                yield event
+            # only persist the cursor once the events have been consumed
+            self.__store_cursor()
+            if events:
+                self.interval = max(self.min_interval, self.interval / 2)
+            else:
+                self.interval = min(self.max_interval, self.interval * 2)
+            time.sleep(self.interval)
+
+    def poll(self) -> Iterator[AnnotationEvent]:
+        """
+        Search the annotations created or modified since the cursor, yielding the events while the results are paged.
+        Once all events are iterated, the cursor moves to the start of this poll.
+        """
+        started = datetime.utcnow()
+        since = self.cursor - self.overlap
+        # nothing from before the next poll's overlap can be reported again
+        horizon = started - self.overlap
+        seen = set()
+        for kind, search in (('created', self.client.search_by_annotation_created_since),
+                             ('modified', self.client.search_by_annotation_modified_since)):
+            collection = search(since)
+            if isinstance(collection, ElucidateFailure):
+                raise Exception(f'{kind} search returned {collection.response.status_code}')
+            if isinstance(collection, ElucidateSuccess):
+                collection = collection.result
+            for annotation in collection.annotations_as_json():
+                key = f"{kind} {annotation['id']} {annotation.get(kind)}"
+                timestamp = _utc(annotation.get(kind))
+                if timestamp is None or timestamp >= horizon:
+                    seen.add(key)
+                if key not in self._seen:
+                    yield AnnotationEvent(kind, annotation)
+        self._seen = seen
+        self.cursor = started
+
+    def __load_cursor(self):
+        with open(self.cursor_path) as f:
+            state = json.load(f)
+        self.cursor = datetime.strptime(state['cursor'], cursor_format)
+        self._seen = set(state['seen'])
+
+    def __store_cursor(self):
+        if self.cursor_path:
+            tmp_path = f"{self.cursor_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'cursor': self.cursor.strftime(cursor_format), 'seen': sorted(self._seen)}, f)
+            os.replace(tmp_path, self.cursor_path)
+
+
+def _utc(value) -> Optional[datetime]:
+    # the (naive UTC) datetime of an iso timestamp from the server, None when it can not be parsed; the server may send
+    # fractions of any length, which fromisoformat (before Python 3.11) only accepts with 3 or 6 digits
+    match = _timestamp.fullmatch(value.strip()) if isinstance(value, str) else None
+    if not match:
+        return None
+    seconds, fraction, offset = match.groups()
+    try:
+        parsed = datetime.strptime(seconds, '%Y-%m-%dT%H:%M:%S')
+    except ValueError:
+        return None
+    parsed = parsed.replace(microsecond=int((fraction or '').ljust(6, '0')[:6]))
+    if offset and offset != 'Z':
+        sign = -1 if offset[0] == '-' else 1
+        parsed -= sign * timedelta(hours=int(offset[1:3]), minutes=int(offset[-2:]))
+    return parsed
@@ -1,8 +1,67 @@
 # -*- coding: utf-8 -*-
+import asyncio
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
 import unittest
+from datetime import datetime, timedelta
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from types import SimpleNamespace
+
+import requests
 
 import elucidate.tools as et
-from elucidate.model import ElucidateSuccess, ElucidateResponse, ContainerIdentifier, AnnotationIdentifier
+from elucidate.cache import ResponseCache
+from elucidate.client import ElucidateClient, as_annotation_collection, as_json_dict
+from elucidate.codec import JsonCodec, available_codecs
+from elucidate.columnar import split_annotations, to_dataframe, flatten_annotation, export_parquet
+from elucidate.executor import max_workers_for
+from elucidate.index import IntervalIndex, SpatialIndex
+from elucidate.model import ElucidateSuccess, ElucidateResponse, ContainerIdentifier, AnnotationIdentifier, \
+    AnnotationCollection, ElucidateFailure
+from elucidate.limiter import AdaptiveLimiter
+from elucidate.metrics import Metrics
+from elucidate.mirror import AnnotationMirror
+from elucidate.ndjson import write_ndjson
+from elucidate.profiling import RequestTracer
+from elucidate.retry import RetryPolicy, CircuitBreaker, CircuitOpenError
+from elucidate.search_cache import SearchCache, as_response
+from elucidate.stub_server import StubElucidateServer
+from elucidate.transport import Transport, AsyncTransport
+from elucidate.watch import ChangeFeed
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
 
 BASE_URI = "http://localhost:18080/annotation"
 
@@ -109,6 +168,1080 @@ class WebAnnotationSplitterTestSuite(unittest.TestCase):
         self.assertEqual(expected_custom_contexts, custom_contexts)
 
 
+class FakeResponse:
+    def __init__(self, body: dict = None, status_code: int = 200, headers: dict = None, method: str = 'GET',
+                 url: str = None):
+        self._json = body
+        self.status_code = status_code
+        self.headers = headers if headers else {}
+        self.request = SimpleNamespace(method=method, url=url)
+        self.text = ''
+        self.content = json.dumps(body).encode('utf-8')
+        self.raw = io.BytesIO(self.content)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def json(self):
+        return self._json
+
+
+class FakeTransport:
+    def __init__(self, pages: dict = None, handler=None):
+        self.pages = pages
+        self.handler = handler
+        self.requested_urls = []
+
+    def request(self, method: str, url: str, **kwargs):
+        self.requested_urls.append(url)
+        return self.handler(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs):
+        if self.pages is None:
+            return self.request('GET', url, **kwargs)
+        self.requested_urls.append(url)
+        return FakeResponse(self.pages[url])
+
+    def close(self):
+        pass
+
+
+class TransportTestSuite(unittest.TestCase):
+    def test_client_creates_pooled_transport(self):
+        client = ElucidateClient(BASE_URI)
+        self.assertIsInstance(client.transport, Transport)
+        client.close()
+
+    def test_client_uses_given_transport(self):
+        transport = Transport(pool_maxsize=4, timeout=5)
+        with ElucidateClient(BASE_URI, transport=transport) as client:
+            self.assertIs(transport, client.transport)
+            self.assertEqual(4, client.transport.pool_maxsize)
+
+    def test_annotation_collection_pages_through_transport(self):
+        collection_id = f"{BASE_URI}/w3c/container/"
+        transport = FakeTransport({
+            f"{collection_id}?page=1": {'items': [{'id': 'a3'}, {'id': 'a4'}]},
+            f"{collection_id}?page=2": {'items': [{'id': 'a5'}]}
+        })
+        collection = AnnotationCollection(5, collection_id, {'items': [{'id': 'a1'}, {'id': 'a2'}]}, None,
+                                          transport)
+        ids = [a['id'] for a in collection.annotations_as_json()]
+        self.assertEqual(['a1', 'a2', 'a3', 'a4', 'a5'], ids)
+        self.assertEqual([f"{collection_id}?page=1", f"{collection_id}?page=2"], transport.requested_urls)
+
+
+class AnnotationCollectionPagingTestSuite(unittest.TestCase):
+    collection_id = f"{BASE_URI}/w3c/container/"
+
+    def collection(self, total: int = 7, page_size: int = 2):
+        ids = [f"a{i}" for i in range(total)]
+        pages = [ids[i:i + page_size] for i in range(0, total, page_size)]
+        transport = FakeTransport({
+            f"{self.collection_id}?page={n}": {'items': [{'id': i} for i in page]}
+            for n, page in enumerate(pages)
+        })
+        first_page = {'items': [{'id': i} for i in pages[0]]}
+        return ids, AnnotationCollection(total, self.collection_id, first_page, None, transport)
+
+    def test_prefetching_yields_all_annotations_in_order(self):
+        ids, collection = self.collection()
+        self.assertEqual(ids, [a['id'] for a in collection.annotations_as_json(prefetch=2)])
+        self.assertEqual(3, collection.page)
+
+    def test_prefetching_stops_when_consumer_stops(self):
+        _, collection = self.collection(total=20)
+        for annotation in collection.annotations_as_json(prefetch=2):
+            if annotation['id'] == 'a2':
+                break
+        self.assertLessEqual(len(collection.transport.requested_urls), 3)
+
+    def test_parallel_pages_in_order(self):
+        ids, collection = self.collection(total=9)
+        pages = list(collection.pages_as_json(max_workers=3))
+        self.assertEqual(5, len(pages))
+        self.assertEqual(ids, [a['id'] for page in pages for a in page])
+
+    def test_parallel_pages_unordered(self):
+        ids, collection = self.collection(total=9)
+        pages = list(collection.pages_as_json(max_workers=3, ordered=False))
+        self.assertEqual(['a0', 'a1'], [a['id'] for a in pages[0]])
+        self.assertEqual(sorted(ids), sorted(a['id'] for page in pages for a in page))
+
+    @unittest.skipIf(ijson is None, "ijson is not installed")
+    def test_sequential_paging_streams_items_without_parsing_the_page(self):
+        ids, collection = self.collection()
+        parsed = []
+        get = collection.transport.get
+
+        def streaming_get(url, **kwargs):
+            response = get(url, **kwargs)
+            response.json = lambda: parsed.append(url)
+            return response
+
+        collection.transport.get = streaming_get
+        self.assertEqual(ids, [a['id'] for a in collection.annotations_as_json(stream=True)])
+        self.assertEqual([], parsed)
+
+    def test_pages_decoded_in_processes(self):
+        ids, collection = self.collection()
+        pages = list(collection.pages_as_json(max_workers=4, processes=2))
+        self.assertEqual(ids, [a['id'] for page in pages for a in page])
+        self.assertEqual([2, 2, 2, 1], list(collection.pages_as_json(processes=2, transform=len)))
+
+    def test_sequential_paging_decodes_pages_with_the_codec(self):
+        ids, collection = self.collection()
+        decoded = []
+        loads = collection.codec.loads
+        collection.codec.loads = lambda data: decoded.append(data) or loads(data)
+        self.assertEqual(ids, [a['id'] for a in collection.annotations_as_json()])
+        self.assertEqual(3, len(decoded))
+
+    def test_missing_items_ends_iteration(self):
+        collection = AnnotationCollection(4, self.collection_id, {}, None, FakeTransport({}))
+        self.assertEqual([], list(collection.annotations_as_json()))
+
+
+class RetryTestSuite(unittest.TestCase):
+    @staticmethod
+    def transport(statuses: list, **kwargs):
+        calls = []
+
+        def request(method, url, **request_kwargs):
+            calls.append(method)
+            status = statuses.pop(0)
+            if status is None:
+                raise requests.ConnectionError('connection reset')
+            if isinstance(status, Exception):
+                raise status
+            response = requests.Response()
+            response.status_code = status
+            response.raw = io.BytesIO(b'')
+            return response
+
+        transport = Transport(**kwargs)
+        transport.session = SimpleNamespace(request=request)
+        return transport, calls
+
+    def test_idempotent_request_is_retried(self):
+        transport, calls = self.transport([503, None, 200], retry_policy=RetryPolicy(backoff_factor=0))
+        self.assertEqual(200, transport.get('http://example.org/').status_code)
+        self.assertEqual(3, len(calls))
+
+    def test_post_is_only_retried_with_slug(self):
+        transport, calls = self.transport([503, 503, 201], retry_policy=RetryPolicy(backoff_factor=0))
+        self.assertEqual(503, transport.post('http://example.org/').status_code)
+        self.assertEqual(201, transport.post('http://example.org/', headers={'slug': 'id'}).status_code)
+
+    def test_retries_are_limited(self):
+        transport, calls = self.transport([503] * 5, retry_policy=RetryPolicy(max_retries=2, backoff_factor=0))
+        self.assertEqual(503, transport.get('http://example.org/').status_code)
+        self.assertEqual(3, len(calls))
+
+    def test_delay_honours_retry_after(self):
+        policy = RetryPolicy(backoff_factor=1, max_backoff=10)
+        self.assertEqual(7, policy.delay(0, '7'))
+        self.assertEqual(10, policy.delay(0, '120'))
+        self.assertLessEqual(policy.delay(2), 4)
+
+    def test_circuit_breaker_fails_fast_while_open(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        transport, calls = self.transport([503, None], circuit_breaker=breaker)
+        transport.get('http://example.org/')
+        with self.assertRaises(requests.ConnectionError):
+            transport.get('http://example.org/')
+        with self.assertRaises(CircuitOpenError):
+            transport.get('http://example.org/')
+        self.assertEqual(2, len(calls))
+
+    def test_circuit_breaker_closes_after_successful_trial(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        transport, _ = self.transport([503, 200], circuit_breaker=breaker)
+        transport.get('http://example.org/')
+        self.assertEqual('half-open', breaker.state)
+        transport.get('http://example.org/')
+        self.assertEqual('closed', breaker.state)
+
+    def test_circuit_breaker_recovers_after_trial_without_outcome(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        transport, _ = self.transport([503, requests.exceptions.ChunkedEncodingError('truncated'), 200],
+                                      circuit_breaker=breaker)
+        transport.get('http://example.org/')
+        with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+            transport.get('http://example.org/')
+        self.assertEqual(200, transport.get('http://example.org/').status_code)
+        self.assertEqual('closed', breaker.state)
+
+
+class AdaptiveLimiterTestSuite(unittest.TestCase):
+    def test_limit_grows_by_one_per_limit_successes(self):
+        limiter = AdaptiveLimiter(initial_limit=2, max_limit=3)
+        for _ in range(2):
+            limiter.release(limiter.acquire(), 200)
+        self.assertEqual(3, limiter.limit)
+        for _ in range(6):
+            limiter.release(limiter.acquire(), 200)
+        self.assertEqual(3, limiter.limit)
+
+    def test_limit_halves_once_per_round_trip_on_overload(self):
+        limiter = AdaptiveLimiter(initial_limit=8)
+        started = [limiter.acquire() for _ in range(4)]
+        for s in started:
+            limiter.release(s, 503)
+        self.assertEqual(4, limiter.limit)
+        limiter.release(limiter.acquire(), None)
+        self.assertEqual(2, limiter.limit)
+        self.assertEqual(0, limiter.in_flight)
+
+    def test_limit_decreases_when_latency_rises(self):
+        limiter = AdaptiveLimiter(initial_limit=1, max_limit=1, window=10)
+        for _ in range(10):
+            limiter.release(limiter.acquire(), 200)
+        limiter._latencies.extend([10.0] * 10)
+        limiter.limit = 4
+        for _ in range(4):
+            limiter.release(limiter.acquire() + 1, 200)
+        self.assertEqual(2, limiter.limit)
+
+    def test_transport_releases_after_connection_error(self):
+        limiter = AdaptiveLimiter(initial_limit=4)
+        transport, calls = RetryTestSuite.transport([None, 200], limiter=limiter,
+                                                    retry_policy=RetryPolicy(backoff_factor=0))
+        self.assertEqual(200, transport.get('http://example.org/').status_code)
+        self.assertEqual((0, 2), (limiter.in_flight, limiter.limit))
+
+    def test_async_acquire_waits_for_release(self):
+        limiter = AdaptiveLimiter(initial_limit=1)
+        order = []
+
+        async def request(name: str, seconds: float):
+            started = await limiter.acquire_async()
+            order.append(f"{name} started")
+            await asyncio.sleep(seconds)
+            order.append(f"{name} done")
+            limiter.release(started, 200)
+
+        async def run():
+            await asyncio.gather(request('a', 0.01), request('b', 0))
+
+        asyncio.run(run())
+        self.assertEqual(['a started', 'a done', 'b started', 'b done'], order)
+        self.assertEqual(0, limiter.in_flight)
+
+    def test_bulk_operations_default_to_max_limit_workers(self):
+        transport = FakeTransport()
+        transport.limiter = AdaptiveLimiter(max_limit=3)
+        self.assertEqual(3, max_workers_for(transport))
+        self.assertEqual(5, max_workers_for(transport, 5))
+        self.assertEqual(8, max_workers_for(FakeTransport()))
+
+
+class MetricsTestSuite(unittest.TestCase):
+    search_url = f"{BASE_URI}/w3c/services/search/body"
+
+    def transport(self, statuses: list, metrics: Metrics) -> Transport:
+        page = {'total': 2, 'id': self.search_url, 'first': {'items': [{'id': 'a1'}]}, 'items': [{'id': 'a2'}]}
+
+        def request(method, url, **kwargs):
+            response = requests.Response()
+            response.status_code = statuses.pop(0)
+            response._content = json.dumps(page).encode('utf-8')
+            response.raw = io.BytesIO(b'')
+            response.request = SimpleNamespace(method=method, url=url)
+            return response
+
+        transport = Transport(metrics=metrics, retry_policy=RetryPolicy(backoff_factor=0))
+        transport.session = SimpleNamespace(request=request)
+        return transport
+
+    def test_requests_are_counted_per_client_method(self):
+        events = []
+        metrics = Metrics(exporters=[events.append])
+        client = ElucidateClient(BASE_URI, transport=self.transport([503, 200, 200], metrics))
+        collection = client.search_by_body_id('http://example.org/body')
+        self.assertEqual(2, len(list(collection.pages_as_json())))
+        self.assertEqual({('search_by_body_id', 'GET', '200'): 1, ('annotation_page', 'GET', '200'): 1},
+                         dict(metrics.requests))
+        self.assertEqual(1, metrics.retries['search_by_body_id'])
+        self.assertEqual(['search_by_body_id', 'annotation_page'], [e.endpoint for e in events])
+        self.assertEqual((1, 0), (events[0].retries, events[1].retries))
+
+    def test_prometheus_text(self):
+        metrics = Metrics(buckets=(0.1, 1.0))
+        transport = self.transport([200], metrics)
+        transport.get(self.search_url)
+        text = metrics.prometheus_text()
+        self.assertIn('elucidate_requests_total{endpoint="other",method="GET",status="200"} 1', text)
+        self.assertIn('elucidate_request_duration_seconds_bucket{endpoint="other",le="+Inf"} 1', text)
+        self.assertIn('elucidate_retries_total{endpoint="other"} 0', text)
+
+    def test_disabled_metrics_do_not_label_requests(self):
+        client = ElucidateClient(BASE_URI, transport=self.transport([200], None))
+        self.assertIsNone(client.transport.metrics)
+        self.assertEqual(2, client.search_by_body_id('x').total)
+
+
+class RequestTracerTestSuite(unittest.TestCase):
+    def test_spans_have_phases_per_endpoint(self):
+        tracer = RequestTracer()
+        transport = MetricsTestSuite().transport([200, 200], None)
+        transport.tracer = tracer
+        real_request = transport.session.request
+
+        def request(method, url, **kwargs):
+            response = real_request(method, url, **kwargs)
+            response.elapsed = timedelta(0)
+            return response
+
+        transport.session = SimpleNamespace(request=request)
+        client = ElucidateClient(BASE_URI, transport=transport)
+        list(client.search_by_body_id('x').pages_as_json())
+        self.assertEqual(['search_by_body_id', 'annotation_page'], [span.endpoint for span in tracer.spans])
+        self.assertEqual({'ttfb', 'download', 'decode', 'construct'}, set(tracer.spans[0].phase_totals()))
+        self.assertEqual({'ttfb', 'download', 'decode'}, set(tracer.spans[1].phase_totals()))
+
+        trace = io.StringIO()
+        tracer.write_chrome_trace(trace)
+        events = json.loads(trace.getvalue())['traceEvents']
+        self.assertEqual(2, len([e for e in events if e['cat'] == 'request']))
+        folded = io.StringIO()
+        tracer.write_folded(folded)
+        stacks = [line.rsplit(' ', 1)[0] for line in folded.getvalue().splitlines()]
+        self.assertIn('search_by_body_id;construct;decode', stacks)
+        self.assertIn('annotation_page;decode', stacks)
+
+    def test_connect_time_is_measured_on_new_connections(self):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'{}')
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        tracer = RequestTracer()
+        try:
+            with Transport(tracer=tracer) as transport:
+                for _ in range(2):
+                    with tracer.span('get'):
+                        transport.get(f"http://127.0.0.1:{server.server_port}/")
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(['connect', 'ttfb', 'download'], [name for name, _, _ in tracer.spans[0].phases])
+        self.assertEqual(['ttfb', 'download'], [name for name, _, _ in tracer.spans[1].phases])
+
+
+class StubElucidateServerTestSuite(unittest.TestCase):
+    def setUp(self):
+        self.server = StubElucidateServer(page_size=2).start()
+        self.client = ElucidateClient(self.server.base_uri, raise_exceptions=False)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def test_annotation_crud_with_etags(self):
+        container_id = get_result(self.client.create_container(label='stub', container_id='c1'))
+        annotation_id = get_result(self.client.create_annotation(container_id, 'http://example.org/b', 'http://t'))
+        self.assertEqual('http://example.org/b', get_result(self.client.read_annotation(annotation_id))['body'])
+        updated_id = get_result(self.client.update_annotation(annotation_id, 'http://example.org/b2', 'http://t'))
+        self.assertNotEqual(annotation_id.etag, updated_id.etag)
+        self.assertEqual(412, self.client.delete_annotation(annotation_id).response.status_code)
+        self.assertTrue(get_result(self.client.delete_annotation(updated_id)))
+        self.assertEqual(404, self.client.read_annotation(updated_id).response.status_code)
+
+    def test_paging_and_search(self):
+        self.server.add_annotations('c1', [{'type': 'Annotation', 'body': f"http://example.org/b{i}", 'target': 't'}
+                                           for i in range(5)])
+        collection = get_result(self.client.read_container(ContainerIdentifier(f"{self.server.base_uri}/w3c/c1/")))
+        self.assertEqual(5, len(list(collection.annotations_as_json())))
+        self.assertEqual(3, len(list(collection.pages_as_json())))
+        result = get_result(self.client.search_by_body_id('http://example.org/b'))
+        self.assertEqual(5, result.total)
+        self.assertEqual(5, len(list(result.annotations_as_json())))
+        self.assertEqual(1, get_result(self.client.search_by_body_id('http://example.org/b3', strict=True)).total)
+        self.assertEqual(5, get_result(self.client.search_by_annotation_created_since(datetime(2000, 1, 1))).total)
+        self.assertEqual(0, get_result(self.client.search_by_annotation_creator_id('http://example.org/nobody')).total)
+
+    def test_injected_errors_and_rate_limit(self):
+        self.server.error_rate = 1.0
+        self.assertEqual(503, self.client.read_current_user().response.status_code)
+        self.server.error_rate = 0.0
+        self.server.max_requests_per_second = 1
+        self.server._tokens = 1
+        self.assertIsInstance(self.client.read_current_user(), ElucidateSuccess)
+        response = self.client.read_current_user()
+        self.assertEqual(429, response.response.status_code)
+        self.assertEqual('1', response.response.headers['retry-after'])
+
+    def test_group_annotations(self):
+        group_id = get_result(self.client.create_group('group'))
+        annotation_id = AnnotationIdentifier(f"{self.server.base_uri}/w3c/c1/a1", '')
+        self.assertTrue(get_result(self.client.create_group_annotation(group_id, annotation_id)))
+        self.assertEqual([f"{self.server.base_uri}/c1/a1"], get_result(self.client.read_group_annotations(group_id)))
+
+
+class ColumnarTestSuite(unittest.TestCase):
+    annotations = [
+        {'id': 'http://example.org/a1', 'motivation': 'classifying', 'created': '2021-07-27T16:13:09',
+         'generator': {'id': 'https://github.com/example/ner', 'type': 'Software'},
+         'body': [{'purpose': 'classifying', 'type': 'TextualBody', 'value': 'location'}],
+         'target': [{'source': 'urn:example:line1', 'selector': {'type': 'TextPositionSelector', 'start': 19, 'end': 24}},
+                    {'source': 'https://example.org/scan.jpg',
+                     'selector': {'type': 'FragmentSelector', 'value': 'xywh=850,3620,1510,86'}}]},
+        {'id': 'http://example.org/a2', 'body': 'http://example.org/body',
+         'target': {'source': 'urn:example:line2', 'selector': {'type': 'FragmentSelector', 'value': 'char=3,7'}}},
+        {'id': 'http://example.org/a3', 'creator': 'http://example.org/me', 'target': 'urn:example:line3'}
+    ]
+
+    def test_flatten_annotation(self):
+        row = flatten_annotation(self.annotations[0])
+        self.assertEqual('urn:example:line1', row['target_source'])
+        self.assertEqual('TextPositionSelector', row['selector_type'])
+        self.assertEqual((19, 24), (row['selector_start'], row['selector_end']))
+        self.assertEqual((850, 3620, 1510, 86), (row['xywh_x'], row['xywh_y'], row['xywh_w'], row['xywh_h']))
+        self.assertEqual(('classifying', 'location'), (row['body_purpose'], row['body_value']))
+        self.assertEqual('https://github.com/example/ner', row['generator'])
+        row = flatten_annotation(self.annotations[1])
+        self.assertEqual((3, 7), (row['selector_start'], row['selector_end']))
+        self.assertEqual('http://example.org/body', row['body_id'])
+        self.assertIsNone(row['xywh_x'])
+
+    def test_flatten_annotation_takes_positions_and_regions_with_their_source(self):
+        row = flatten_annotation({'id': 'a', 'target': [
+            'urn:a',
+            {'source': 'urn:b', 'selector': {'type': 'TextPositionSelector', 'start': 1, 'end': 5}},
+            {'source': 'scan.jpg', 'selector': {'type': 'FragmentSelector', 'value': 'xywh=percent:10.5,1,2,3'}},
+            {'source': 'other.jpg', 'selector': {'type': 'FragmentSelector', 'value': 'xywh=pixel:10,20,30,40'}}]})
+        self.assertEqual(('urn:a', None), (row['target_source'], row['selector_type']))
+        self.assertEqual(('urn:b', 1, 5), (row['text_source'], row['selector_start'], row['selector_end']))
+        self.assertEqual(('other.jpg', 10, 20, 30, 40),
+                         (row['image_source'], row['xywh_x'], row['xywh_y'], row['xywh_w'], row['xywh_h']))
+
+    def test_python_chunks(self):
+        chunks = list(split_annotations(iter(self.annotations), chunk_size=2, format='python'))
+        self.assertEqual([2, 1], [len(chunk['id']) for chunk in chunks])
+        self.assertEqual(['urn:example:line3'], chunks[1]['target_source'])
+        self.assertEqual(['http://example.org/me'], chunks[1]['creator'])
+        with self.assertRaises(ValueError):
+            next(split_annotations(self.annotations, format='csv'))
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_numpy_chunks(self):
+        chunk, = split_annotations(self.annotations, format='numpy')
+        self.assertEqual([19, 3, -1], chunk['selector_start'].tolist())
+        self.assertEqual(object, chunk['id'].dtype)
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_arrow_chunks(self):
+        batches = list(split_annotations(self.annotations, chunk_size=2))
+        self.assertEqual([2, 1], [batch.num_rows for batch in batches])
+        self.assertEqual(pyarrow.int64(), batches[0].schema.field('selector_start').type)
+        self.assertEqual([24, 7], batches[0].column('selector_end').to_pylist())
+
+    @unittest.skipIf(pandas is None, "pandas is not installed")
+    def test_to_dataframe(self):
+        df = to_dataframe(self.annotations, chunk_size=2)
+        self.assertEqual(3, len(df))
+        self.assertEqual(['http://example.org/a1', 'http://example.org/a2', 'http://example.org/a3'], list(df['id']))
+        self.assertEqual(850, df['xywh_x'][0])
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_export_parquet(self):
+        import pyarrow.dataset
+        with StubElucidateServer(page_size=2) as server, ElucidateClient(server.base_uri) as client, \
+                tempfile.TemporaryDirectory() as directory:
+            server.add_annotations('c1', [{k: v for k, v in a.items() if k != 'id'} for a in self.annotations])
+            container_id = ContainerIdentifier(f"{server.base_uri}/w3c/c1/")
+            path = os.path.join(directory, 'snapshot')
+            progress = export_parquet(container_id, path, client=client, partition_by=('motivation',),
+                                      rows_per_group=2)
+            self.assertEqual((3, 3), (progress.count, progress.total))
+            self.assertTrue(os.path.isdir(os.path.join(path, 'motivation=classifying')))
+            table = pyarrow.dataset.dataset(path, partitioning='hive').to_table().sort_by('selector_start')
+            self.assertEqual([3, 19, None], table.column('selector_start').to_pylist())
+            self.assertEqual('urn:example:line2', json.loads(table.column('json')[0].as_py())['target']['source'])
+            path = os.path.join(directory, 'processes')
+            self.assertEqual(3, export_parquet(container_id, path, client=client, processes=2).count)
+            self.assertEqual(3, pyarrow.dataset.dataset(path).count_rows())
+
+
+class IntervalIndexTestSuite(unittest.TestCase):
+    @staticmethod
+    def text_annotation(annotation_id: str, source: str, start: int, end: int) -> dict:
+        return {'id': annotation_id,
+                'target': {'source': source, 'selector': {'type': 'TextPositionSelector', 'start': start, 'end': end}}}
+
+    def setUp(self):
+        self.index = IntervalIndex([
+            self.text_annotation('a1', 'line1', 0, 10),
+            self.text_annotation('a2', 'line1', 5, 8),
+            self.text_annotation('a3', 'line1', 20, 30),
+            self.text_annotation('a4', 'line2', 0, 100),
+            {'id': 'a5', 'target': {'source': 'line1',
+                                    'selector': {'type': 'FragmentSelector', 'value': 'char=40,45'}}},
+            {'id': 'a6', 'target': 'line1'}
+        ])
+
+    def ids(self, spans) -> list:
+        return [span.annotation['id'] for span in spans]
+
+    def test_queries(self):
+        self.assertEqual(5, len(self.index))
+        self.assertEqual(['a1', 'a2'], self.ids(self.index.overlapping('line1', 6, 20)))
+        self.assertEqual(['a3'], self.ids(self.index.overlapping('line1', 29, 35)))
+        self.assertEqual([], self.ids(self.index.overlapping('line1', 10, 20)))
+        self.assertEqual(['a2', 'a3'], self.ids(self.index.within('line1', 5, 30)))
+        self.assertEqual(['a1', 'a2'], self.ids(self.index.containing('line1', 6, 7)))
+        self.assertEqual('a3', self.index.nearest('line1', 17).annotation['id'])
+        self.assertEqual('a1', self.index.nearest('line1', 12, 14).annotation['id'])
+        self.assertEqual('a5', self.index.nearest('line1', 42).annotation['id'])
+        self.assertIsNone(self.index.nearest('line3', 0))
+
+    def test_add_and_remove(self):
+        self.assertEqual(1, self.index.remove('a1'))
+        self.assertEqual(['a2'], self.ids(self.index.overlapping('line1', 0, 20)))
+        self.index.add(self.text_annotation('a2', 'line1', 12, 15))
+        self.assertEqual(['a2'], self.ids(self.index.overlapping('line1', 0, 20)))
+        self.assertEqual(12, self.index.overlapping('line1', 0, 20)[0].start)
+        for i in range(100):
+            self.index.add(self.text_annotation(f"n{i}", 'line3', i, i + 2))
+        self.assertEqual(['n4', 'n5', 'n6'], self.ids(self.index.overlapping('line3', 5, 7)))
+        self.assertNotIn('a1', self.index)
+
+    def test_span_selected_twice_is_indexed_once(self):
+        annotation = {'id': 'a', 'target': [
+            {'source': 's', 'selector': {'type': 'TextPositionSelector', 'start': 19, 'end': 24}},
+            {'source': 's', 'selector': {'type': 'FragmentSelector', 'value': 'char=19,24'}}]}
+        index = IntervalIndex([annotation])
+        self.assertEqual(1, len(index))
+        self.assertEqual(['a'], self.ids(index.overlapping('s', 0, 100)))
+        self.assertEqual(1, index.add(annotation))
+
+    def test_annotations_need_an_id(self):
+        annotation = self.text_annotation(None, 'line1', 0, 5)
+        with self.assertRaises(ValueError):
+            self.index.add(annotation)
+        with self.assertRaises(ValueError):
+            IntervalIndex([annotation])
+        self.assertEqual(5, len(self.index))
+
+
+class SpatialIndexTestSuite(unittest.TestCase):
+    @staticmethod
+    def image_annotation(annotation_id: str, xywh: str) -> dict:
+        return {'id': annotation_id,
+                'target': {'source': 'scan.jpg', 'selector': {'type': 'FragmentSelector', 'value': f"xywh={xywh}"}}}
+
+    def test_intersecting(self):
+        annotations = [self.image_annotation(f"a{x}-{y}", f"{x * 100},{y * 100},50,50")
+                       for x in range(20) for y in range(20)]
+        annotations.append({'id': 'b', 'target': 'other.jpg#xywh=pixel:10,10,5,5'})
+        annotations.append(self.image_annotation('percent', 'percent:10,10,5,5'))
+        index = SpatialIndex(annotations, node_size=4)
+        self.assertEqual(401, len(index))
+        found = index.intersecting('scan.jpg', 120, 220, 100, 100)
+        self.assertEqual(['a1-2', 'a1-3', 'a2-2', 'a2-3'], sorted(region.annotation['id'] for region in found))
+        self.assertEqual([], index.intersecting('scan.jpg', 160, 160, 30, 30))
+        self.assertEqual(['a0-0'], [region.annotation['id'] for region in index.at('scan.jpg', 50, 50)])
+        self.assertEqual(['b'], [region.annotation['id'] for region in index.intersecting('other.jpg', 0, 0, 20, 20)])
+        self.assertEqual([], index.intersecting('unknown.jpg', 0, 0, 20, 20))
+
+
+class JsonCodecTestSuite(unittest.TestCase):
+    def test_available_codecs_round_trip(self):
+        annotation = {'body': {'value': 'caf\u00e9', 'score': 0.5}, 'target': [1, None, True]}
+        for name in available_codecs():
+            codec = JsonCodec(name)
+            self.assertIsInstance(codec.dumps(annotation), bytes)
+            self.assertEqual(annotation, codec.loads(codec.dumps(annotation)))
+
+    def test_sort_keys_gives_the_same_encoding_for_any_key_order(self):
+        for name in available_codecs():
+            codec = JsonCodec(name)
+            self.assertEqual(codec.dumps({'b': 1, 'a': {'d': 2, 'c': 3}}, sort_keys=True),
+                             codec.dumps({'a': {'c': 3, 'd': 2}, 'b': 1}, sort_keys=True))
+
+    def test_unavailable_codec_is_rejected(self):
+        with self.assertRaises(ValueError):
+            JsonCodec('simplejson-that-is-not-there')
+
+    def test_response_helpers_decode_with_the_codec(self):
+        codec = JsonCodec('json')
+        decoded = []
+        loads = codec.loads
+        codec.loads = lambda data: decoded.append(data) or loads(data)
+        response = FakeResponse({'total': 1, 'id': 'c', 'first': {'items': [{'id': 'a1'}]}})
+        self.assertEqual(1, as_json_dict(response, codec)['total'])
+        collection = as_annotation_collection(response, codec=codec)
+        self.assertEqual(['a1'], [a['id'] for a in collection.annotations_as_json()])
+        self.assertIs(codec, collection.codec)
+        self.assertEqual(2, len(decoded))
+
+
+class ResponseCacheTestSuite(unittest.TestCase):
+    def test_evicts_least_recently_used_entry(self):
+        cache = ResponseCache(max_entries=2)
+        cache.put('a', 'etag-a', {}, 10)
+        cache.put('b', 'etag-b', {}, 10)
+        cache.get('a')
+        cache.put('c', 'etag-c', {}, 10)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual('etag-a', cache.get('a').etag)
+        self.assertEqual(20, cache.size)
+
+    def test_evicts_to_stay_within_max_bytes(self):
+        cache = ResponseCache(max_bytes=25)
+        cache.put('a', 'etag-a', {}, 10)
+        cache.put('b', 'etag-b', {}, 10)
+        cache.put('c', 'etag-c', {}, 10)
+        self.assertEqual(2, len(cache))
+        self.assertIsNone(cache.get('a'))
+
+    def test_client_revalidates_cached_annotation(self):
+        url = f"{BASE_URI}/w3c/container/anno1"
+        annotation = {'id': url}
+        sent_headers = []
+
+        def handle(method, request_url, headers=None, **kwargs):
+            sent_headers.append(headers)
+            if method == 'DELETE':
+                cached_while_deleting.append(len(cache))
+                return FakeResponse(status_code=204)
+            if headers.get('If-None-Match') == 'W/"etag1"':
+                return FakeResponse(status_code=304)
+            return FakeResponse(annotation, headers={'etag': 'W/"etag1"'})
+
+        cached_while_deleting = []
+        cache = ResponseCache()
+        client = ElucidateClient(BASE_URI, transport=FakeTransport(handler=handle), cache=cache)
+        annotation_identifier = AnnotationIdentifier(url, 'etag1')
+        first_read = client.read_annotation(annotation_identifier)
+        self.assertEqual(annotation, first_read)
+        first_read['body'] = 'changed by the caller'
+        self.assertEqual({'id': url}, client.read_annotation(annotation_identifier))
+        self.assertEqual('W/"etag1"', sent_headers[1]['If-None-Match'])
+        client.delete_annotation(annotation_identifier)
+        self.assertEqual([1], cached_while_deleting)
+        self.assertEqual(0, len(cache))
+
+
+class SearchCacheTestSuite(unittest.TestCase):
+    search_url = f"{BASE_URI}/w3c/services/search/body"
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'cache.sqlite')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_transport_serves_repeated_search_from_cache(self):
+        requested = []
+
+        def request(method, url, params=None, **kwargs):
+            requested.append(url)
+            full_url = f"{url}?value={params['value']}&fields={params['fields']}" if params else url
+            return as_response(full_url, 'application/json', b'{"total": 0}')
+
+        search_cache = SearchCache(self.path)
+        transport = Transport(search_cache=search_cache)
+        transport.session = SimpleNamespace(request=request)
+        for _ in range(2):
+            response = transport.get(self.search_url, params=dict(fields='id', value='x'))
+            self.assertEqual({'total': 0}, response.json())
+        self.assertEqual(1, len(requested))
+        search_cache.close()
+
+        reopened = SearchCache(self.path)
+        self.assertIsNotNone(reopened.get(f"{self.search_url}?fields=id&value=x"))
+        self.assertIsNone(reopened.get(f"{BASE_URI}/w3c/container/"))
+        reopened.close()
+
+    def test_paging_search_results_through_the_cache(self):
+        search_cache = SearchCache(self.path)
+        with StubElucidateServer(page_size=2) as server, \
+                ElucidateClient(server.base_uri, transport=Transport(search_cache=search_cache)) as client:
+            server.add_annotations('c1', [{'type': 'Annotation', 'body': 'b', 'target': {'source': f"urn:t{i}"}}
+                                          for i in range(5)])
+            streams = (True, True, False, False) if ijson is not None else (False, False)
+            for stream in streams:
+                collection = client.search_by_target_source('urn:t')
+                self.assertEqual(5, len(list(collection.annotations_as_json(stream=stream))))
+        search_cache.close()
+
+    def test_expired_pages_are_not_served(self):
+        search_cache = SearchCache(self.path, ttls={'part': -1})
+        search_cache.put(as_response(f"{self.search_url}?value=x", None, b'{}'))
+        self.assertIsNone(search_cache.get(f"{self.search_url}?value=x"))
+        search_cache.close()
+
+    def test_least_recently_used_pages_are_evicted(self):
+        search_cache = SearchCache(self.path, max_bytes=10)
+        search_cache.put(as_response(f"{self.search_url}?page=0", None, b'123456'))
+        search_cache.put(as_response(f"{self.search_url}?page=1", None, b'123456'))
+        self.assertIsNone(search_cache.get(f"{self.search_url}?page=0"))
+        self.assertEqual(b'123456', search_cache.get(f"{self.search_url}?page=1").content)
+        search_cache.close()
+
+
+class AnnotationMirrorTestSuite(unittest.TestCase):
+    def test_sync_upserts_only_changed_annotations(self):
+        def collection(annotations):
+            return AnnotationCollection(len(annotations), 'collection', {'items': annotations}, None)
+
+        a1 = {'id': f"{BASE_URI}/w3c/c1/a1", 'body': 'one'}
+        a2 = {'id': f"{BASE_URI}/w3c/c1/a2", 'body': 'two'}
+        a2_modified = {**a2, 'body': 'three'}
+        other = {'id': f"{BASE_URI}/w3c/c2/a3", 'body': 'other'}
+        searches = []
+        client = SimpleNamespace(
+            base_uri=BASE_URI,
+            codec=JsonCodec(),
+            read_container=lambda container_identifier: collection([a1, a2]),
+            search_by_annotation_created_since=lambda since: searches.append(since) or collection([other]),
+            search_by_annotation_modified_since=lambda since: collection([a1, a2_modified]))
+        with tempfile.TemporaryDirectory() as directory:
+            with AnnotationMirror(client, os.path.join(directory, 'mirror.sqlite'), ['c1']) as mirror:
+                self.assertEqual(2, mirror.sync())
+                watermark = mirror.watermark
+                self.assertEqual(1, mirror.sync())
+                self.assertEqual(watermark - mirror.overlap, searches[0])
+                self.assertEqual(a2_modified, mirror.get(a2['id']))
+                self.assertEqual(2, len(list(mirror.annotations('c1'))))
+
+
+class ChangeFeedTestSuite(unittest.TestCase):
+    def test_poll_skips_events_seen_in_overlap_and_resumes_from_stored_cursor(self):
+        now = datetime.utcnow()
+        a1 = {'id': 'a1', 'created': now.isoformat()}
+        a2 = {'id': 'a2', 'created': (now + timedelta(milliseconds=1)).isoformat() + 'Z'}
+        created = [[a1], [a1, a2], [a2]]
+        client = SimpleNamespace(
+            search_by_annotation_created_since=lambda since: AnnotationCollection(
+                len(created[0]), 'c', {'items': created.pop(0)}, None),
+            search_by_annotation_modified_since=lambda since: AnnotationCollection(0, 'c', {'items': []}, None))
+        with tempfile.TemporaryDirectory() as directory:
+            cursor_path = os.path.join(directory, 'cursor.json')
+            feed = ChangeFeed(client, cursor_path=cursor_path, min_interval=0.001, max_interval=0.004)
+            events = feed.__iter__()
+            self.assertEqual('a1', next(events).annotation['id'])
+            self.assertEqual('a2', next(events).annotation['id'])
+            self.assertEqual(0.001, feed.interval)
+            # the cursor is stored once all events of a poll are consumed, so a2 is reported again after a restart
+            restarted = ChangeFeed(client, cursor_path=cursor_path)
+            self.assertEqual(feed.cursor, restarted.cursor)
+            self.assertEqual(['a2'], [e.annotation['id'] for e in restarted.poll()])
+
+    def test_poll_only_remembers_events_that_can_reappear(self):
+        # fractions of other lengths than 3 or 6 digits, which fromisoformat rejects before Python 3.11
+        old = {'id': 'old', 'created': '2022-01-01T00:00:00.12345Z'}
+        recent = {'id': 'recent', 'created': f"{datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%f')[:-2]}+00:00"}
+        client = SimpleNamespace(
+            search_by_annotation_created_since=lambda since: AnnotationCollection(2, 'c', {'items': [old, recent]}, None),
+            search_by_annotation_modified_since=lambda since: AnnotationCollection(0, 'c', {'items': []}, None))
+        feed = ChangeFeed(client, since=datetime(2021, 1, 1))
+        events = feed.poll()
+        self.assertEqual('old', next(events).annotation['id'])
+        self.assertEqual(datetime(2021, 1, 1), feed.cursor)
+        self.assertEqual(['recent'], [e.annotation['id'] for e in events])
+        self.assertEqual(1, len(feed._seen))
+
+
+class BulkCreateTestSuite(unittest.TestCase):
+    container_url = f"{BASE_URI}/w3c/container/"
+
+    @staticmethod
+    def handle(method, url, headers=None, data=None, **kwargs):
+        body = json.loads(data)
+        if body['body'] == 'bad':
+            return FakeResponse(status_code=400, method=method, url=url)
+        location = f"{url}{headers.get('slug', body['body'])}"
+        return FakeResponse(status_code=201, headers={'location': location, 'etag': 'W/"etag"'}, method=method,
+                            url=url)
+
+    def test_create_annotations_returns_results_in_order(self):
+        client = ElucidateClient(BASE_URI, transport=FakeTransport(handler=self.handle))
+        annotations = ((f"body{i}", "target") for i in range(20))
+        results = list(client.create_annotations(ContainerIdentifier(self.container_url), annotations, max_workers=4))
+        self.assertEqual([f"body{i}" for i in range(20)], [r.uuid for r in results])
+
+    def test_import_annotations_resumes_from_checkpoint(self):
+        posted = []
+
+        def handle(method, url, headers=None, data=None, **kwargs):
+            posted.append(headers.get('slug'))
+            return self.handle(method, url, headers=headers, data=data)
+
+        annotation = {'@context': 'http://www.w3.org/ns/anno.jsonld', 'type': 'Annotation', 'target': 't'}
+        lines = [json.dumps({**annotation, 'id': f"{self.container_url}a{i}", 'body': f"body{i}"}) for i in range(5)]
+        lines.insert(2, '{not json')
+        lines.insert(1, '')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'annotations.ndjson')
+            with open(path, 'w') as f:
+                f.write('\n'.join(lines[:5]) + '\n')
+            client = ElucidateClient(BASE_URI, transport=FakeTransport(handler=handle))
+            failures = []
+            progress = client.import_annotations(ContainerIdentifier(self.container_url), path,
+                                                 on_failure=lambda n, e: failures.append(n))
+            self.assertEqual((4, 1), (progress.count, progress.failed))
+            self.assertEqual([4], failures)
+            with open(path, 'a') as f:
+                f.write('\n'.join(lines[5:]) + '\n')
+            progress = client.import_annotations(ContainerIdentifier(self.container_url), path)
+            self.assertEqual(2, progress.count)
+        self.assertEqual([f"a{i}" for i in range(5)], sorted(posted))
+
+    @unittest.skipIf(zstandard is None, "zstandard is not installed")
+    def test_import_annotations_reads_zstd_exports(self):
+        posted = []
+
+        def handle(method, url, headers=None, data=None, **kwargs):
+            posted.append(headers.get('slug'))
+            return self.handle(method, url, headers=headers, data=data)
+
+        annotations = [{'@context': 'http://www.w3.org/ns/anno.jsonld', 'id': f"{self.container_url}a{i}",
+                        'type': 'Annotation', 'body': f"body{i}", 'target': 't'} for i in range(5)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'annotations.ndjson.zst')
+            with open(path, 'wb') as f:
+                write_ndjson(annotations[:3], f, compression='zstd')
+            client = ElucidateClient(BASE_URI, transport=FakeTransport(handler=handle))
+            self.assertEqual(3, client.import_annotations(ContainerIdentifier(self.container_url), path).count)
+            with open(path, 'wb') as f:
+                write_ndjson(annotations, f, compression='zstd')
+            self.assertEqual(2, client.import_annotations(ContainerIdentifier(self.container_url), path).count)
+        self.assertEqual([f"a{i}" for i in range(5)], posted)
+
+    def test_import_annotations_keeps_checkpoint_when_no_line_parses(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'annotations.ndjson')
+            with open(path, 'w') as f:
+                f.write('{not json\n{nor this\n')
+            client = ElucidateClient(BASE_URI, transport=FakeTransport(handler=self.handle))
+            progress = client.import_annotations(ContainerIdentifier(self.container_url), path, checkpoint_interval=1)
+            self.assertEqual((2, 2), (progress.count, progress.failed))
+            self.assertFalse(os.path.exists(f"{path}.checkpoint"))
+
+    def test_delete_annotations_returns_results_in_order(self):
+        deleted = []
+
+        def handle(method, url, **kwargs):
+            deleted.append(url)
+            return FakeResponse(status_code=404 if url.endswith('a1') else 204, method=method, url=url)
+
+        client = ElucidateClient(BASE_URI, transport=FakeTransport(handler=handle))
+        identifiers = [AnnotationIdentifier(f"{self.container_url}a{i}", 'etag') for i in range(3)]
+        results = list(client.delete_annotations(identifiers, max_workers=2))
+        self.assertEqual(True, results[0])
+        self.assertIsInstance(results[1], Exception)
+        self.assertEqual(True, results[2])
+        self.assertEqual(3, len(deleted))
+
+    def test_create_annotations_continues_after_failure(self):
+        client = ElucidateClient(BASE_URI, transport=FakeTransport(handler=self.handle))
+        annotations = [("good", "target", None, None, "slug1"), ("bad", "target"), ("good", "target")]
+        results = list(client.create_annotations(ContainerIdentifier(self.container_url), annotations))
+        self.assertEqual('slug1', results[0].uuid)
+        self.assertIsInstance(results[1], Exception)
+        self.assertEqual('good', results[2].uuid)
+
+
+class BulkReadTestSuite(unittest.TestCase):
+    container_url = f"{BASE_URI}/w3c/container/"
+    annotation_urls = [f"{BASE_URI}/w3c/container/a{i}" for i in range(4)]
+
+    def handle(self, method, url, **kwargs):
+        if url == self.container_url:
+            first = {'items': [{'id': u} for u in self.annotation_urls[:2]]}
+            return FakeResponse({'total': 4, 'id': self.container_url, 'first': first})
+        if url == f"{self.container_url}?page=1":
+            return FakeResponse({'items': [{'id': u} for u in self.annotation_urls[2:]]})
+        if url in self.annotation_urls:
+            return FakeResponse({'id': url})
+        return FakeResponse(status_code=404, method=method, url=url)
+
+    def read(self, urls, raise_exceptions: bool = True, **kwargs):
+        transport = FakeTransport(handler=self.handle)
+        client = ElucidateClient(BASE_URI, transport=transport, raise_exceptions=raise_exceptions)
+        results = dict(client.read_annotations([AnnotationIdentifier(u, 'etag') for u in urls], **kwargs))
+        return {i.url: r for i, r in results.items()}, transport.requested_urls
+
+    def test_read_annotations_scans_container_when_most_are_requested(self):
+        results, requested_urls = self.read(self.annotation_urls[1:], min_scan=2)
+        self.assertEqual({u: {'id': u} for u in self.annotation_urls[1:]}, results)
+        self.assertEqual([self.container_url, f"{self.container_url}?page=1"], requested_urls)
+
+    def test_read_annotations_reads_one_by_one_when_few_are_requested(self):
+        results, requested_urls = self.read(self.annotation_urls[:1])
+        self.assertEqual({self.annotation_urls[0]: {'id': self.annotation_urls[0]}}, results)
+        self.assertEqual([self.annotation_urls[0]], requested_urls)
+        results, requested_urls = self.read(self.annotation_urls[:1], min_scan=1)
+        self.assertEqual({self.annotation_urls[0]: {'id': self.annotation_urls[0]}}, results)
+        self.assertEqual([self.container_url, self.annotation_urls[0]], requested_urls)
+
+    def test_read_annotations_yields_one_result_per_identifier(self):
+        urls = self.annotation_urls + self.annotation_urls[:2] + [f"{BASE_URI}/w3c/other/a{i}" for i in range(3)]
+        client = ElucidateClient(BASE_URI, transport=FakeTransport(handler=self.handle))
+        for min_scan in (1, 10):
+            results = list(client.read_annotations([AnnotationIdentifier(u, 'etag') for u in urls], max_workers=4,
+                                                   min_scan=min_scan))
+            self.assertEqual(sorted(urls), sorted(i.url for i, _ in results))
+            self.assertEqual(6, sum(isinstance(r, dict) for _, r in results))
+
+    def test_read_annotations_reports_missing_annotations(self):
+        missing_url = f"{self.container_url}missing"
+        results, _ = self.read(self.annotation_urls + [missing_url])
+        self.assertIsInstance(results[missing_url], Exception)
+
+    def test_read_annotations_without_exceptions_yields_dicts_from_reads_and_scans(self):
+        missing_url = f"{self.container_url}missing"
+        # read one by one, and scanned
+        for urls, min_scan in ((self.annotation_urls[:1] + [missing_url], 10), (self.annotation_urls + [missing_url], 2)):
+            results, _ = self.read(urls, raise_exceptions=False, min_scan=min_scan)
+            self.assertEqual({u: {'id': u} for u in urls[:-1]}, {u: r for u, r in results.items() if u != missing_url})
+            self.assertIsInstance(results[missing_url], ElucidateFailure)
+
+    def test_export_container_as_compressed_ndjson(self):
+        client = ElucidateClient(BASE_URI, transport=FakeTransport(handler=self.handle))
+        fileobj = io.BytesIO()
+        reports = []
+        progress = client.export_container(ContainerIdentifier(self.container_url), fileobj, compression='gzip',
+                                           progress=reports.append)
+        self.assertEqual(4, progress.count)
+        self.assertEqual(4, reports[-1].total)
+        lines = gzip.decompress(fileobj.getvalue()).decode('utf-8').splitlines()
+        self.assertEqual(self.annotation_urls, [json.loads(line)['id'] for line in lines])
+
+
+@unittest.skipIf(httpx is None, "httpx is not installed")
+class AsyncElucidateClientTestSuite(unittest.TestCase):
+    container_url = f"{BASE_URI}/w3c/container/"
+
+    def handle(self, request):
+        if request.method == 'POST':
+            return httpx.Response(201, headers={'location': f"{self.container_url}anno1", 'etag': 'W/"etag1"'})
+        if request.url.params.get('page') == '1':
+            return httpx.Response(200, json={'items': [{'id': 'a3'}]})
+        if str(request.url) == self.container_url:
+            return httpx.Response(200, json={'total': 3, 'id': self.container_url, 'label': 'container',
+                                             'first': {'items': [{'id': 'a1'}, {'id': 'a2'}]}})
+        return httpx.Response(404, text='not found')
+
+    def client(self, raise_exceptions: bool = True):
+        from elucidate.async_client import AsyncElucidateClient
+        transport = AsyncTransport()
+        transport.client = httpx.AsyncClient(transport=httpx.MockTransport(self.handle))
+        return AsyncElucidateClient(BASE_URI, raise_exceptions=raise_exceptions, transport=transport)
+
+    def test_create_annotation(self):
+        async def create():
+            async with self.client() as client:
+                return await client.create_annotation(ContainerIdentifier(self.container_url), body={}, target="t")
+
+        annotation_identifier = asyncio.run(create())
+        self.assertEqual('anno1', annotation_identifier.uuid)
+        self.assertEqual('etag1', annotation_identifier.etag)
+
+    def test_async_paging(self):
+        async def read_all():
+            async with self.client() as client:
+                collection = await client.read_container(ContainerIdentifier(self.container_url))
+                return [a['id'] async for a in collection]
+
+        self.assertEqual(['a1', 'a2', 'a3'], asyncio.run(read_all()))
+
+    def test_async_pages(self):
+        async def read_pages():
+            async with self.client() as client:
+                collection = await client.read_container(ContainerIdentifier(self.container_url))
+                unordered = [page async for page in collection.pages_as_json(ordered=False, transform=len)]
+                return [page async for page in collection.pages_as_json(transform=len)], unordered
+
+        self.assertEqual(([2, 1], [2, 1]), asyncio.run(read_pages()))
+
+    def test_async_paging_stops_at_empty_page(self):
+        async def read_all():
+            async with self.client() as client:
+                collection = await client.read_container(ContainerIdentifier(self.container_url))
+                collection.total = 10
+                return [a['id'] async for a in collection]
+
+        container_handle = self.handle
+
+        def handle(request):
+            if request.url.params.get('page') == '2':
+                return httpx.Response(200, json={'items': []})
+            return container_handle(request)
+
+        self.handle = handle
+        self.assertEqual(['a1', 'a2', 'a3'], asyncio.run(asyncio.wait_for(read_all(), 5)))
+
+    def test_limiter_caps_async_requests(self):
+        async def read_pages():
+            async with self.client() as client:
+                client.transport.limiter = limiter
+                collection = await client.read_container(ContainerIdentifier(self.container_url))
+                return [page async for page in collection.pages_as_json(transform=len)]
+
+        limiter = AdaptiveLimiter(initial_limit=1, max_limit=2)
+        self.assertEqual([2, 1], asyncio.run(read_pages()))
+        self.assertEqual((0, 2), (limiter.in_flight, limiter.limit))
+
+    def test_metrics_label_requests_with_client_method(self):
+        async def read_all():
+            async with self.client() as client:
+                client.transport.metrics = metrics
+                collection = await client.read_container(ContainerIdentifier(self.container_url))
+                return [a['id'] async for a in collection]
+
+        metrics = Metrics()
+        asyncio.run(read_all())
+        self.assertEqual({('read_container', 'GET', '200'): 1, ('annotation_page', 'GET', '200'): 1},
+                         dict(metrics.requests))
+
+    def test_failure_without_exceptions(self):
+        async def read_missing():
+            async with self.client(raise_exceptions=False) as client:
+                return await client.read_annotation(AnnotationIdentifier(f"{BASE_URI}/w3c/other/x", "etag"))
+
+        response = asyncio.run(read_missing())
+        self.assertIsInstance(response, ElucidateFailure)
+        self.assertEqual(404, response.response.status_code)
+
+    def test_circuit_breaker_recovers_after_trial_without_outcome(self):
+        outcomes = [httpx.Response(503), httpx.DecodingError('truncated'), httpx.Response(200)]
+
+        def handle(request):
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        async def get_three_times():
+            async with AsyncTransport(circuit_breaker=breaker) as transport:
+                transport.client = httpx.AsyncClient(transport=httpx.MockTransport(handle))
+                await transport.get(self.container_url)
+                with self.assertRaises(httpx.DecodingError):
+                    await transport.get(self.container_url)
+                return (await transport.get(self.container_url)).status_code
+
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        self.assertEqual(200, asyncio.run(get_three_times()))
+        self.assertEqual('closed', breaker.state)
+
+
 def get_result(response: ElucidateResponse):
     assert isinstance(response, ElucidateSuccess)
     return response.result